@@ -1,27 +1,229 @@
+import math
+import os
 import sys
+import tempfile # Spill files for evicted images
+import weakref # Residency tracking must not keep items alive
+import hashlib # Content hashes for shared pixel buffers
+import threading
+import json # Diagnostics export
+import time
+import functools
+import contextlib
+import gzip # Compact input recordings
+import atexit
+import logging
+import logging.handlers
+import queue
 import csv # Added for table parsing
+from array import array # Compact columns of the document model
+from bisect import bisect_left, bisect_right # Visible table columns, snap anchors
+from collections import OrderedDict, deque # LRU caches, rolling frame statistics
 from io import BytesIO, StringIO # Added StringIO for csv module
+from itertools import zip_longest # Row -> column transposition for table chunks
+import importlib
+
+_STARTUP_BEGAN = time.perf_counter() # Origin of the startup profile, taken before the Qt imports are paid for
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QGraphicsView, QGraphicsScene, QToolBar, QDockWidget, QWidget, QVBoxLayout, QLabel, QPushButton, QRadioButton,
     QGraphicsRectItem, QGraphicsEllipseItem, QToolButton, QMenu, QColorDialog, QGraphicsLineItem, QFileDialog, QGraphicsPixmapItem, QMessageBox,
     QMenuBar, QSlider, QSpinBox, QGraphicsPathItem, QGraphicsPolygonItem, QHBoxLayout, QStyleOptionGraphicsItem,
-    QGraphicsItemGroup, QGraphicsSimpleTextItem, # Added QGraphicsItemGroup and QGraphicsSimpleTextItem
-    QGraphicsTextItem, QFontComboBox # Added QFontComboBox
+    QGraphicsItemGroup, # Added QGraphicsItemGroup
+    QGraphicsTextItem, QComboBox,
+    QGraphicsItem, QProgressBar, QStyle, QInputDialog, QTableWidget, QTableWidgetItem, QCheckBox, QHeaderView,
+    QDialog, QDialogButtonBox, QFormLayout, QDoubleSpinBox
 )
 from PySide6.QtGui import (
     QAction, QIcon, QColor, QPainter, QPen, QBrush, QImage, QPixmap, 
     QPainterPath, QPolygonF, QTransform, QUndoStack, QUndoCommand, QKeySequence,
-    QFont # Added QFont
+    QFont, # Added QFont
+    QFontMetricsF, QStaticText, QMouseEvent, QWheelEvent, QKeyEvent, QFontDatabase, QPixmapCache, QActionGroup
 )
-from PySide6.QtCore import Qt, QRectF, QPointF, QSizeF, QBuffer # QKeySequence removed from here
-
-# Import for background removal
-from PIL import Image, ImageEnhance # Added ImageEnhance
-from rembg import remove
+from PySide6.QtCore import Qt, QEvent, QPoint, QRect, QRectF, QPointF, QSizeF, QBuffer, QLineF, QObject, QThread, Signal, Slot, QRunnable, QThreadPool, QTimer, QStandardPaths # QKeySequence removed from here
+from shiboken6 import isValid # Wrappers can outlive items their scene deleted in C++
+
+
+# --- Lazy imports ---
+class LazyModule:
+    # Stands in for a module that is imported on first attribute access, so startup does not pay
+    # for it. importlib's module locks make a first touch from a worker thread safe.
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            STARTUP_PROFILE.record_import(self._name, time.perf_counter() - start)
+            self._module = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+
+# Pillow is only needed once an image is imported or pasted
+Image = LazyModule("PIL.Image")
+ImageEnhance = LazyModule("PIL.ImageEnhance")
+
+# Background removal: rembg pulls in onnxruntime and numpy (over a second to import) and its model
+# session is expensive to create, so both are loaded once, on first use or by warm_up_rembg().
+_rembg_lock = threading.Lock()
+_rembg = None # (remove function, session)
+
+
+def load_rembg():
+    global _rembg
+    with _rembg_lock: # A warm-up in flight is waited for rather than duplicated
+        if _rembg is None:
+            start = time.perf_counter()
+            rembg = importlib.import_module("rembg")
+            STARTUP_PROFILE.record_import("rembg", time.perf_counter() - start)
+            start = time.perf_counter()
+            session = rembg.new_session() # Same default model remove() would create on every call
+            log_image.info("rembg model session created in %.0f ms", (time.perf_counter() - start) * 1000)
+            _rembg = (rembg.remove, session)
+    return _rembg
+
+
+def remove_background(pil_image):
+    remove, session = load_rembg()
+    return remove(pil_image, session=session)
+
+
+def warm_up_rembg():
+    # Loads rembg and its model on a background thread so the first background removal does not stall the UI
+    def warm_up():
+        try:
+            load_rembg()
+        except Exception as e:
+            log_image.warning("rembg warm-up failed: %s", e)
+    threading.Thread(target=warm_up, name="rembg-warmup", daemon=True).start()
 
 HANDLE_SIZE = 10.0
 MIN_SHAPE_SIZE = 5.0
 
+# Table rendering defaults
+TABLE_CELL_PADDING = 5.0
+TABLE_DEFAULT_COLUMN_WIDTH = 100.0
+TABLE_DEFAULT_ROW_HEIGHT = 30.0
+TABLE_TEXT_CACHE_LIMIT = 20000 # Max cached cell text layouts per table
+TABLE_MIN_COLUMN_WIDTH = 40.0
+TABLE_MAX_COLUMN_WIDTH = 400.0
+TABLE_PARSE_CHUNK_ROWS = 2000 # Rows parsed per chunk before handing them to the GUI thread
+TABLE_SNIFF_SAMPLE_SIZE = 64 * 1024 # Characters used for delimiter detection
+TABLE_FILE_EXTENSIONS = (".csv", ".tsv", ".txt")
+
+# Image import
+IMAGE_FILE_EXTENSIONS = (".png", ".xpm", ".jpg", ".jpeg", ".bmp", ".gif")
+IMPORT_THUMBNAIL_SIZE = 128 # Long edge of the quick placeholder decode
+IMPORT_GRID_CELL_SIZE = 320.0 # Multi-image imports are fitted into square grid cells
+IMPORT_GRID_SPACING = 20.0
+IMPORT_FIT_VIEW_FRACTION = 0.8 # A single image larger than the view is fitted to this fraction of it
+REDECODE_THRESHOLD = 1.15 # Re-decode when the view shows the working image magnified by more than this
+REDECODE_HEADROOM = 1.25 # Decode a bit above the needed size so small zoom steps don't re-decode again
+
+# Tiled image rendering
+IMAGE_TILE_SIZE = 256 # Tile grid (in pixels of each mip level) used to cut the visible block
+IMAGE_MIN_MIP_EDGE = 32 # Smallest mip level long edge
+IMAGE_HASH_BAND_BYTES = 4 * 1024 * 1024 # Pixels hashed per step, so interning never copies a whole decoded image
+
+# Image residency (decoded pixel memory budget)
+IMAGE_MEMORY_BUDGET_MB = int(os.environ.get("CANVAS_IMAGE_BUDGET_MB", "1024"))
+IMAGE_SPILL_DIR = os.environ.get("CANVAS_IMAGE_SPILL_DIR") # Evicted images go to disk here instead of memory when set
+IMAGE_RESIDENCY_CHECK_MS = 2000
+
+# Document model: simple shapes stored as arrays, with real items only near the viewport
+PRIMITIVE_KINDS = ("rectangle", "ellipse", "triangle", "line")
+PRIMITIVE_RECT, PRIMITIVE_ELLIPSE, PRIMITIVE_TRIANGLE, PRIMITIVE_LINE = range(len(PRIMITIVE_KINDS))
+DOCUMENT_GRID_CELL = 512.0 # Scene units per spatial-index cell
+DOCUMENT_LAYER_Z = 0.0
+VIRTUAL_MATERIALIZE_MARGIN = 0.25 # Viewport fraction added on each side of the materialized area
+VIRTUAL_MATERIALIZE_BUDGET = 2000 # More primitives than this near the viewport: none get items, the layer draws them
+VIRTUAL_POOL_LIMIT = 4000 # Released items kept per kind for reuse
+VIRTUAL_UPDATE_DELAY_MS = 50
+VIRTUAL_HIT_TOLERANCE = 3.0 # Device pixels around the cursor that still hit a batch-drawn shape
+BATCH_RECTS, BATCH_LINES, BATCH_PATH, BATCH_BOXES = range(4) # How DocumentLayerItem draws a group of primitives
+
+# Level of detail, in device pixels (override with CANVAS_LOD, e.g. "text=6,tiny=3,stroke=1"; 0 turns a rule off)
+LOD_TEXT_GREEK_PX = 4.0 # Text lines shorter than this are drawn as bars
+LOD_TINY_ITEM_PX = 2.0 # Items whose larger side is below this are drawn as one filled rect
+LOD_STROKE_TOLERANCE_PX = 0.5 # Zoomed-out pen strokes draw a simplified path that strays at most this far
+LOD_GREEK_ALPHA = 0.45 # Opacity of greeked text bars
+
+# Render quality while navigating
+INTERACTION_SETTLE_MS = 150 # Input-free time after which the view repaints at full quality
+
+# Canvas grid (View > Grid)
+GRID_STYLES = ("dots", "lines")
+GRID_SPACING = 20.0 # Scene units between minor grid lines at the finest level
+GRID_MAJOR_EVERY = 5 # Minor cells per major cell, and the spacing factor from one level to the next coarser one
+GRID_MIN_SPACING_PX = 8.0 # Minor lines closer than this on screen give way to the next coarser level
+GRID_FADE_STEPS = 8 # Minor-line opacity steps while a level fades out (each step is its own cached tile)
+GRID_TILE_CACHE_SIZE = 16
+GRID_TILE_MAX_PX = 512 # Major cells larger on screen are drawn line by line instead of from a tile
+GRID_MINOR_ALPHA = 0.16 # Over the background; the grid is black on light backgrounds and white on dark ones
+GRID_MAJOR_ALPHA = 0.3
+
+# Navigator dock
+NAVIGATOR_TILE = 64 # Pixels; the cached overview is re-rendered in tiles of this size where the scene changed
+NAVIGATOR_UPDATE_MS = 200 # Scene changes are collected for this long before dirty tiles are re-rendered
+NAVIGATOR_BUDGET_MS = 8.0 # Render time per pass; remaining dirty tiles wait for the next event-loop turn
+NAVIGATOR_MARGIN = 4 # Pixels between the overview and the widget edge
+
+# Snapping while moving, resizing and drawing (View > Snapping); holding Alt places freely
+SNAP_DISTANCE_PX = 6.0 # Screen distance within which an edge, center, equal gap or grid line pulls the geometry
+SNAP_SCAN_LIMIT = 64 # Index entries looked at per lookup before giving up (e.g. long runs of off-screen items)
+SNAP_MAX_PENDING_REGIONS = 64 # Queued changed areas beyond this are merged into their bounding rect
+SNAP_GUIDE_COLOR = QColor(255, 45, 138)
+
+# Render settings (View > Rendering Settings), saved in the user config dir
+RENDER_SETTINGS_FILE = "canvas_render_settings.json"
+VIEWPORT_UPDATE_MODES = {
+    "minimal": ("Minimal region", QGraphicsView.ViewportUpdateMode.MinimalViewportUpdate),
+    "smart": ("Smart (merged regions)", QGraphicsView.ViewportUpdateMode.SmartViewportUpdate),
+    "bounding": ("Bounding rect", QGraphicsView.ViewportUpdateMode.BoundingRectViewportUpdate),
+    "full": ("Full viewport", QGraphicsView.ViewportUpdateMode.FullViewportUpdate),
+}
+RENDER_SETTINGS_DEFAULTS = {
+    "item_cache": True, # Device-coordinate cache for tables, text and rotated images
+    "background_cache": True,
+    "viewport_update": "smart",
+    "skip_antialias_margin": False, # QGraphicsView.DontAdjustForAntialiasing
+    "pixmap_cache_mb": 0, # 0: sized from the cached items on the canvas
+    "adaptive_quality": True,
+    "lod_enabled": True,
+    "lod_text_px": LOD_TEXT_GREEK_PX,
+    "lod_tiny_px": LOD_TINY_ITEM_PX,
+    "lod_stroke_px": LOD_STROKE_TOLERANCE_PX,
+}
+PIXMAP_CACHE_MIN_MB = 10 # Qt's default
+PIXMAP_CACHE_MAX_MB = 256
+PIXMAP_CACHE_RETUNE_MS = 500
+
+# Properties panel
+PROPERTIES_SECTIONS = ("shape", "image", "text", "pen", "rotation") # Panel order; each is built on first use
+FONT_FAMILY_CACHE_FILE = "canvas_font_families.json" # Snapshot of installed font families, in the user cache dir
+
+# Memory diagnostics
+MEMORY_REFRESH_MS = 1000
+MEMORY_TOP_OFFENDERS = 50 # Rows shown in the diagnostics panel (the JSON export has every item)
+MEMORY_KINDS = ("original", "bg_removed", "display", "modifiable_qimage", "pixmap", "compressed", "table_cells", "text_layouts", "vector")
+TABLE_LAYOUT_ESTIMATE_BYTES = 256 # Rough size of one cached QStaticText (layout and glyph runs)
+TABLE_CELL_SAMPLE_SIZE = 200 # Cells per column sampled to estimate string storage
+
+# Frame timing HUD
+FRAME_STATS_WINDOW = 240 # Frames (and handler calls) kept for percentiles
+FRAME_STATS_COUNT_INTERVAL = 0.5 # Seconds between counts of the items in the repainted area
+
+# Tracing
+TRACE_BUFFER_SIZE = int(os.environ.get("CANVAS_TRACE_BUFFER", "200000")) # Spans kept; older ones are dropped
+
+# Input recording
+INPUT_RECORDING_VERSION = 1
+INPUT_RECORDING_FILTER = "Canvas Input Recording (*.canvasrec)"
+
 LIGHT_THEME = {
     "name": "light",
     "window_bg": QColor("#f0f0f0"),
@@ -109,6 +311,3038 @@ def pil_to_qimage(pil_image):
     qimage = QImage(data, pil_image.size[0], pil_image.size[1], QImage.Format.Format_RGBA8888)
     return qimage.copy() # Return a copy to avoid issues with data lifetime
 
+# --- Logging ---
+# Category loggers under "canvas.<category>". Configure with environment variables:
+#   CANVAS_LOG_LEVEL=INFO              default level for every category (default WARNING)
+#   CANVAS_LOG=selection=DEBUG,tool=INFO   per-category overrides
+#   CANVAS_LOG_FILE=canvas.log         also write to a file
+# Records are handed to a background thread (QueueListener), so console and file I/O never block the GUI.
+class CategoryLogger:
+    # Wraps a logging.Logger and caches its enabled checks as plain attributes, so a disabled message costs
+    # one attribute read. Arguments are %-formatted only when a record is actually emitted.
+    def __init__(self, category):
+        self.logger = logging.getLogger(f"canvas.{category}")
+        self._rate_limits = {} # key -> [last emit time, suppressed count]
+        self._sample_counts = {} # message -> calls seen
+        self.refresh()
+
+    def refresh(self):
+        self.debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+        self.info_enabled = self.logger.isEnabledFor(logging.INFO)
+        self.warning_enabled = self.logger.isEnabledFor(logging.WARNING)
+
+    def debug(self, message, *args):
+        if self.debug_enabled:
+            self.logger.debug(message, *args)
+
+    def info(self, message, *args):
+        if self.info_enabled:
+            self.logger.info(message, *args)
+
+    def warning(self, message, *args):
+        if self.warning_enabled:
+            self.logger.warning(message, *args)
+
+    def error(self, message, *args, exc_info=False):
+        self.logger.error(message, *args, exc_info=exc_info)
+
+    def info_every(self, key, interval, message, *args):
+        # At most one record per `interval` seconds for `key` (per-event messages); reports what was dropped
+        if not self.info_enabled:
+            return
+        now = time.monotonic()
+        state = self._rate_limits.get(key)
+        if state is not None and now - state[0] < interval:
+            state[1] += 1
+            return
+        suppressed = state[1] if state is not None else 0
+        self._rate_limits[key] = [now, 0]
+        if suppressed:
+            message += " (%d similar suppressed)"
+            args += (suppressed,)
+        self.logger.info(message, *args)
+
+    def debug_sampled(self, every, message, *args):
+        # Emits one in `every` calls of the same message
+        if not self.debug_enabled:
+            return
+        count = self._sample_counts.get(message, 0)
+        self._sample_counts[message] = count + 1
+        if count % every == 0:
+            self.logger.debug(message + " [1/%d sampled]", *args, every)
+
+
+LOG_CATEGORIES = ("app", "selection", "tool", "eraser", "pen", "resize", "crop", "image", "table", "theme", "diagnostics")
+CATEGORY_LOGGERS = {category: CategoryLogger(category) for category in LOG_CATEGORIES}
+log_app = CATEGORY_LOGGERS["app"]
+log_selection = CATEGORY_LOGGERS["selection"]
+log_tool = CATEGORY_LOGGERS["tool"]
+log_eraser = CATEGORY_LOGGERS["eraser"]
+log_pen = CATEGORY_LOGGERS["pen"]
+log_resize = CATEGORY_LOGGERS["resize"]
+log_crop = CATEGORY_LOGGERS["crop"]
+log_image = CATEGORY_LOGGERS["image"]
+log_table = CATEGORY_LOGGERS["table"]
+log_theme = CATEGORY_LOGGERS["theme"]
+log_diagnostics = CATEGORY_LOGGERS["diagnostics"]
+_log_listener = None
+
+
+def set_log_level(category, level):
+    # category None sets the default for all categories; call at runtime to turn messages on or off
+    logger = logging.getLogger("canvas" if category is None else f"canvas.{category}")
+    logger.setLevel(level)
+    for category_logger in CATEGORY_LOGGERS.values():
+        category_logger.refresh()
+
+
+def configure_logging():
+    global _log_listener
+    if _log_listener is not None:
+        return
+    root = logging.getLogger("canvas")
+    root.propagate = False
+    level_names = logging.getLevelNamesMapping()
+    rejected = [] # Reported once the handlers are attached
+    level = os.environ.get("CANVAS_LOG_LEVEL", "WARNING").strip().upper()
+    if level in level_names:
+        root.setLevel(level_names[level])
+    else:
+        root.setLevel(logging.WARNING)
+        rejected.append(("CANVAS_LOG_LEVEL", level))
+    for spec in filter(None, os.environ.get("CANVAS_LOG", "").split(",")):
+        category, _, level = spec.partition("=")
+        level = (level or "DEBUG").strip().upper()
+        if category.strip() in LOG_CATEGORIES and level in level_names:
+            logging.getLogger(f"canvas.{category.strip()}").setLevel(level_names[level])
+        else:
+            rejected.append(("CANVAS_LOG", spec))
+
+    formatter = logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+    handlers = [logging.StreamHandler()]
+    log_file = os.environ.get("CANVAS_LOG_FILE")
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop) # Flushes what is still queued
+    for category_logger in CATEGORY_LOGGERS.values():
+        category_logger.refresh()
+    for variable, entry in rejected:
+        log_app.warning("Ignoring %s entry %r", variable, entry)
+
+
+# --- Startup profile ---
+class StartupProfile:
+    # Wall-clock phases from the top of this module to the first painted canvas frame, plus the
+    # lazy imports paid along the way. Printed to stderr with --startup-profile.
+    def __init__(self, began):
+        self.began = began
+        self.last = began
+        self.phases = [] # (name, seconds since the previous mark)
+        self.imports = [] # (module, seconds), in import order
+        self.awaiting_first_paint = True
+        self.first_paint_callbacks = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def record_import(self, module, seconds):
+        self.imports.append((module, seconds))
+        log_app.debug("Lazy import of %s took %.1f ms", module, seconds * 1000)
+
+    def after_first_paint(self, callback):
+        if self.awaiting_first_paint:
+            self.first_paint_callbacks.append(callback)
+        else:
+            QTimer.singleShot(0, callback)
+
+    def first_frame_painted(self):
+        self.awaiting_first_paint = False
+        self.mark("first paint")
+        for callback in self.first_paint_callbacks:
+            QTimer.singleShot(0, callback) # Outside the paint event
+        self.first_paint_callbacks = []
+
+    def report(self):
+        lines = ["Startup profile:"]
+        for phase, seconds in self.phases:
+            lines.append(f"  {phase:<24}{seconds * 1000:9.1f} ms")
+        lines.append(f"  {'total':<24}{(self.last - self.began) * 1000:9.1f} ms")
+        if self.imports:
+            lines.append("Lazy imports so far:")
+            for module, seconds in self.imports:
+                lines.append(f"  {module:<24}{seconds * 1000:9.1f} ms")
+        return "\n".join(lines) + "\n"
+
+
+STARTUP_PROFILE = StartupProfile(_STARTUP_BEGAN)
+
+
+# --- Tracing ---
+class Tracer:
+    # Records timed spans into a ring buffer; export() writes Chrome trace-event JSON that
+    # chrome://tracing and ui.perfetto.dev can open. Disabled, span() returns a shared no-op context.
+    def __init__(self, capacity):
+        self.events = deque(maxlen=capacity) # deque.append is atomic, spans come from worker threads too
+        self.thread_names = {}
+        self.enabled = False
+
+    def span(self, name, category="canvas", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return TraceSpan(self, name, category, args)
+
+    def record(self, name, category, start_ns, end_ns, args=None):
+        thread_id = threading.get_ident()
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = threading.current_thread().name
+        event = {"name": name, "cat": category, "ph": "X", "ts": start_ns / 1000, "dur": (end_ns - start_ns) / 1000,
+                 "pid": os.getpid(), "tid": thread_id}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
+
+    def export(self, file_path):
+        events = list(self.events)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": name}}
+                    for thread_id, name in list(self.thread_names.items())]
+        with open(file_path, "w", encoding="utf-8") as trace_file:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, trace_file)
+        return len(events)
+
+
+class TraceSpan:
+    __slots__ = ("tracer", "name", "category", "args", "start_ns")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        args = self.args
+        if exc_type is not None:
+            args = dict(args, error=exc_type.__name__)
+        self.tracer.record(self.name, self.category, self.start_ns, time.perf_counter_ns(), args)
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+TRACER = Tracer(TRACE_BUFFER_SIZE)
+TRACER.enabled = os.environ.get("CANVAS_TRACE", "") not in ("", "0") # Capture from startup, e.g. for a bug report
+
+
+def traced(name, category="canvas"):
+    # Records each call of a method as a span. Qt passes signal arguments a slot may not declare
+    # (e.g. clicked(bool)), so extra positional arguments are dropped like Qt does for plain methods.
+    def decorator(method):
+        arg_count = method.__code__.co_argcount - 1
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            args = args[:arg_count]
+            if not TRACER.enabled:
+                return method(self, *args, **kwargs)
+            with TraceSpan(TRACER, name, category, {}):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Shared Pixel Buffers ---
+class SharedPixelBuffer:
+    # A decoded image shared by every item showing the same pixels, identified by a content hash.
+    # The PIL image is never modified in place: edits (crop, erase, background removal, effects) always build a
+    # new image, so an item gets a private copy only when it changes, and unchanged duplicates share one
+    # PIL image, one QPixmap and one set of mip levels.
+    registry = weakref.WeakValueDictionary() # content hash -> buffer, alive while any item uses it
+    registry_lock = threading.Lock() # Buffers are interned from decode threads
+
+    def __init__(self, key, pil_image):
+        self.key = key
+        self.pil_image = pil_image
+        self._pixmap = None
+        self._qimage = None # Prepared off the GUI thread; QPixmap can only be built on it
+        self.mip_levels = {} # Shared by all items displaying this buffer unchanged
+
+    @classmethod
+    def intern(cls, pil_image):
+        # Expensive (hashes every pixel), call it from a worker thread where possible
+        digest = hashlib.blake2b(digest_size=16)
+        width, height = pil_image.size
+        band = max(1, IMAGE_HASH_BAND_BYTES // max(1, width * len(pil_image.getbands())))
+        for top in range(0, height, band):
+            digest.update(pil_image.crop((0, top, width, min(height, top + band))).tobytes()) # Same bytes as tobytes(), in bands
+        digest.update(f"{pil_image.mode}{pil_image.size}".encode())
+        key = digest.hexdigest()
+        with cls.registry_lock:
+            buffer = cls.registry.get(key)
+            if buffer is None:
+                buffer = cls(key, pil_image)
+                cls.registry[key] = buffer
+        return buffer
+
+    def prepare(self):
+        # Worker thread: convert to QImage unless another item already built the pixmap
+        if self._pixmap is None and self._qimage is None:
+            self._qimage = pil_to_qimage(self.pil_image)
+
+    def pixmap(self):
+        if self._pixmap is None:
+            self._pixmap = QPixmap.fromImage(self._qimage if self._qimage is not None else pil_to_qimage(self.pil_image))
+            self._qimage = None
+        return self._pixmap
+
+# --- Level of Detail ---
+class LevelOfDetail:
+    # Thresholds for drawing zoomed-out items simplified, compared against the item's size in device pixels
+    # (scene size times QStyleOptionGraphicsItem.levelOfDetailFromTransform).
+    def __init__(self, spec=""):
+        self.enabled = True
+        self.text_greek_px = LOD_TEXT_GREEK_PX
+        self.tiny_item_px = LOD_TINY_ITEM_PX
+        self.stroke_tolerance_px = LOD_STROKE_TOLERANCE_PX
+        self.configure(spec)
+
+    def configure(self, spec):
+        names = {"text": "text_greek_px", "tiny": "tiny_item_px", "stroke": "stroke_tolerance_px"}
+        for entry in filter(None, spec.split(",")):
+            name, _, value = entry.partition("=")
+            try:
+                setattr(self, names[name.strip()], float(value))
+            except (KeyError, ValueError):
+                log_app.warning("Ignoring CANVAS_LOD entry %r", entry)
+
+    @staticmethod
+    def of(painter, option):
+        return option.levelOfDetailFromTransform(painter.worldTransform())
+
+    def is_tiny(self, rect, lod):
+        return self.enabled and max(rect.width(), rect.height()) * lod < self.tiny_item_px
+
+    def greeks_text(self, line_height, lod):
+        return self.enabled and line_height * lod < self.text_greek_px
+
+    def stroke_tolerance(self, lod):
+        # Scene-unit tolerance for simplifying strokes, rounded down to a power of two so zoom steps share
+        # cached paths; 0 when strokes should draw in full
+        if not self.enabled or self.stroke_tolerance_px <= 0 or lod >= 1.0:
+            return 0.0
+        return 2.0 ** math.floor(math.log2(self.stroke_tolerance_px / lod))
+
+    @staticmethod
+    def draw_tiny(painter, rect, color):
+        painter.fillRect(rect, color)
+
+    @staticmethod
+    def draw_greeked(painter, bars, color):
+        # One bar per text line (or cell), in one call
+        color = QColor(color)
+        color.setAlphaF(color.alphaF() * LOD_GREEK_ALPHA)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(color)
+        painter.drawRects(bars)
+
+
+LOD = LevelOfDetail(os.environ.get("CANVAS_LOD", ""))
+
+
+def simplify_polyline(points, tolerance):
+    # Douglas-Peucker: drops points closer than tolerance to the simplified line; keeps both ends
+    if len(points) < 3:
+        return points
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = points[first]
+        dx, dy = points[last][0] - x1, points[last][1] - y1
+        length_sq = dx * dx + dy * dy
+        farthest, farthest_sq = 0, tolerance_sq
+        for index in range(first + 1, last):
+            px, py = points[index]
+            t = ((px - x1) * dx + (py - y1) * dy) / length_sq if length_sq else 0.0
+            t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+            ex, ey = x1 + t * dx - px, y1 + t * dy - py
+            distance_sq = ex * ex + ey * ey
+            if distance_sq > farthest_sq:
+                farthest, farthest_sq = index, distance_sq
+        if farthest:
+            keep[farthest] = 1
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_path(path, tolerance):
+    # Simplifies every subpath of a polyline path (curve control points are treated as vertices)
+    subpaths = []
+    for index in range(path.elementCount()):
+        element = path.elementAt(index)
+        if element.type == QPainterPath.ElementType.MoveToElement or not subpaths:
+            subpaths.append([])
+        subpaths[-1].append((element.x, element.y))
+    simplified = QPainterPath()
+    for points in subpaths:
+        points = simplify_polyline(points, tolerance)
+        simplified.moveTo(*points[0])
+        for x, y in points[1:]:
+            simplified.lineTo(x, y)
+    return simplified
+
+
+def draw_selection_outline(painter, item, color):
+    painter.setPen(QPen(color, 0, Qt.PenStyle.DashLine))
+    painter.setBrush(Qt.BrushStyle.NoBrush)
+    painter.drawRect(item.boundingRect())
+
+
+# --- Render Settings ---
+def render_settings_path():
+    config_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericConfigLocation) or tempfile.gettempdir()
+    return os.path.join(config_dir, RENDER_SETTINGS_FILE)
+
+
+class RenderSettings:
+    # Rendering preferences applied to the canvas view: item and background caching, viewport update mode,
+    # pixmap cache size, interactive quality and level of detail. Cache policy: tables, text and rotated images
+    # paint once into a device-coordinate cache and are blitted while panning; an item that is selected or being
+    # edited paints directly, as every change would throw its cache away.
+    def __init__(self):
+        self.values = dict(RENDER_SETTINGS_DEFAULTS)
+        self.view = None
+        self.cached_items = weakref.WeakSet() # Items with a cache mode, to size the pixmap cache
+        self.retune_timer = None
+
+    def load(self):
+        try:
+            with open(render_settings_path(), encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.values.update(self.validated(saved))
+
+    def save(self):
+        try:
+            with open(render_settings_path(), "w", encoding="utf-8") as f:
+                json.dump(self.values, f, indent=2)
+        except OSError as e:
+            log_app.warning("Could not save render settings: %s", e)
+
+    @staticmethod
+    def validated(values):
+        # Known keys with the default's type; anything else is dropped
+        clean = {}
+        for key, value in values.items():
+            default = RENDER_SETTINGS_DEFAULTS.get(key)
+            if default is None:
+                continue
+            try:
+                value = type(default)(value)
+            except (TypeError, ValueError):
+                continue
+            if key == "viewport_update" and value not in VIEWPORT_UPDATE_MODES:
+                continue
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value < 0:
+                continue
+            clean[key] = value
+        return clean
+
+    def update(self, values):
+        self.values.update(self.validated(values))
+        self.apply()
+
+    def attach(self, view):
+        self.view = view
+        self.retune_timer = QTimer(view)
+        self.retune_timer.setSingleShot(True)
+        self.retune_timer.setInterval(PIXMAP_CACHE_RETUNE_MS)
+        self.retune_timer.timeout.connect(self.retune_pixmap_cache)
+        self.apply()
+
+    def detach(self, view):
+        if self.view is view:
+            self.retune_timer.stop()
+            self.view = self.retune_timer = None
+
+    def apply(self):
+        values = self.values
+        LOD.enabled = values["lod_enabled"]
+        LOD.text_greek_px, LOD.tiny_item_px, LOD.stroke_tolerance_px = values["lod_text_px"], values["lod_tiny_px"], values["lod_stroke_px"]
+        LOD.configure(os.environ.get("CANVAS_LOD", "")) # The environment wins over saved values
+        view = self.view
+        if view is None:
+            return
+        view.adaptive_quality = values["adaptive_quality"]
+        if not view.adaptive_quality:
+            view.end_interaction()
+        view.setCacheMode(QGraphicsView.CacheModeFlag.CacheBackground if values["background_cache"] else QGraphicsView.CacheModeFlag.CacheNone)
+        view.resetCachedContent()
+        view.setViewportUpdateMode(VIEWPORT_UPDATE_MODES[values["viewport_update"]][1])
+        view.setOptimizationFlag(QGraphicsView.OptimizationFlag.DontAdjustForAntialiasing, values["skip_antialias_margin"])
+        for item in view.scene().items():
+            if isinstance(item, (TableItem, TextItem, TiledImageItem)):
+                self.apply_cache_policy(item)
+        for item in list(self.cached_items):
+            item.update() # Cached pixmaps were painted with the old level-of-detail settings
+        self.retune_pixmap_cache()
+        view.viewport().update()
+
+    def cache_mode_for(self, item):
+        if not self.values["item_cache"] or item.scene() is None or item.isSelected() or item.hasFocus():
+            return QGraphicsItem.CacheMode.NoCache
+        if isinstance(item, TiledImageItem) and not item.rotation():
+            return QGraphicsItem.CacheMode.NoCache # Unrotated images already blit straight from their mip tiles
+        return QGraphicsItem.CacheMode.DeviceCoordinateCache
+
+    def apply_cache_policy(self, item):
+        # Called by the cacheable item classes when they enter a scene, get (de)selected or start/stop editing
+        mode = self.cache_mode_for(item)
+        if item.cacheMode() == mode:
+            return
+        item.setCacheMode(mode)
+        if mode == QGraphicsItem.CacheMode.NoCache:
+            self.cached_items.discard(item)
+        else:
+            self.cached_items.add(item)
+        if self.retune_timer is not None:
+            self.retune_timer.start()
+
+    def retune_pixmap_cache(self):
+        # Room for the background and every cached item at its current on-screen size (at most a viewport each),
+        # doubled so zooming in and out doesn't evict what is about to be shown again
+        if self.values["pixmap_cache_mb"]:
+            limit_kb = self.values["pixmap_cache_mb"] * 1024
+        elif self.view is not None:
+            view = self.view
+            ratio = view.devicePixelRatioF()
+            viewport_area = view.viewport().width() * view.viewport().height() * ratio * ratio
+            needed = viewport_area
+            scene = view.scene()
+            for item in list(self.cached_items):
+                if item.scene() is scene:
+                    device_rect = view.mapFromScene(item.sceneBoundingRect()).boundingRect()
+                    needed += min(device_rect.width() * device_rect.height() * ratio * ratio, viewport_area)
+            limit_kb = min(max(int(needed * 4 * 2 / 1024), PIXMAP_CACHE_MIN_MB * 1024), PIXMAP_CACHE_MAX_MB * 1024)
+        else:
+            return
+        QPixmapCache.setCacheLimit(limit_kb)
+        return limit_kb
+
+
+RENDER_SETTINGS = RenderSettings()
+CACHE_POLICY_CHANGES = (QGraphicsItem.GraphicsItemChange.ItemSceneHasChanged, QGraphicsItem.GraphicsItemChange.ItemSelectedHasChanged)
+
+
+class RenderSettingsDialog(QDialog):
+    def __init__(self, values, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Rendering Settings")
+        layout = QFormLayout(self)
+
+        self.item_cache_checkbox = QCheckBox("Cache tables, text and rotated images")
+        layout.addRow(self.item_cache_checkbox)
+        self.background_cache_checkbox = QCheckBox("Cache canvas background")
+        layout.addRow(self.background_cache_checkbox)
+        self.viewport_update_combo = QComboBox()
+        for key, (label, _) in VIEWPORT_UPDATE_MODES.items():
+            self.viewport_update_combo.addItem(label, key)
+        layout.addRow("Viewport updates:", self.viewport_update_combo)
+        self.skip_margin_checkbox = QCheckBox("Skip antialiasing margin on partial updates")
+        layout.addRow(self.skip_margin_checkbox)
+        self.pixmap_cache_spinbox = QSpinBox()
+        self.pixmap_cache_spinbox.setRange(0, 4096)
+        self.pixmap_cache_spinbox.setSuffix(" MB")
+        self.pixmap_cache_spinbox.setSpecialValueText("Automatic")
+        layout.addRow("Pixmap cache:", self.pixmap_cache_spinbox)
+        self.adaptive_quality_checkbox = QCheckBox("Lower quality while zooming and panning")
+        layout.addRow(self.adaptive_quality_checkbox)
+
+        self.lod_checkbox = QCheckBox("Simplify items when zoomed out")
+        layout.addRow(self.lod_checkbox)
+        self.lod_spinboxes = {}
+        for key, label in (("lod_text_px", "Greek text below:"), ("lod_tiny_px", "Draw items as rects below:"),
+                           ("lod_stroke_px", "Stroke simplification:")):
+            spinbox = QDoubleSpinBox()
+            spinbox.setRange(0.0, 50.0)
+            spinbox.setSingleStep(0.5)
+            spinbox.setSuffix(" px")
+            spinbox.setSpecialValueText("Off")
+            self.lod_checkbox.toggled.connect(spinbox.setEnabled)
+            self.lod_spinboxes[key] = spinbox
+            layout.addRow(label, spinbox)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+                                   | QDialogButtonBox.StandardButton.RestoreDefaults)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        buttons.button(QDialogButtonBox.StandardButton.RestoreDefaults).clicked.connect(lambda: self._show_values(RENDER_SETTINGS_DEFAULTS))
+        layout.addRow(buttons)
+        self._show_values(values)
+
+    def _show_values(self, values):
+        self.item_cache_checkbox.setChecked(values["item_cache"])
+        self.background_cache_checkbox.setChecked(values["background_cache"])
+        self.viewport_update_combo.setCurrentIndex(self.viewport_update_combo.findData(values["viewport_update"]))
+        self.skip_margin_checkbox.setChecked(values["skip_antialias_margin"])
+        self.pixmap_cache_spinbox.setValue(values["pixmap_cache_mb"])
+        self.adaptive_quality_checkbox.setChecked(values["adaptive_quality"])
+        self.lod_checkbox.setChecked(values["lod_enabled"])
+        for key, spinbox in self.lod_spinboxes.items():
+            spinbox.setValue(values[key])
+            spinbox.setEnabled(values["lod_enabled"])
+
+    def values(self):
+        values = {
+            "item_cache": self.item_cache_checkbox.isChecked(),
+            "background_cache": self.background_cache_checkbox.isChecked(),
+            "viewport_update": self.viewport_update_combo.currentData(),
+            "skip_antialias_margin": self.skip_margin_checkbox.isChecked(),
+            "pixmap_cache_mb": self.pixmap_cache_spinbox.value(),
+            "adaptive_quality": self.adaptive_quality_checkbox.isChecked(),
+            "lod_enabled": self.lod_checkbox.isChecked(),
+        }
+        values.update((key, spinbox.value()) for key, spinbox in self.lod_spinboxes.items())
+        return values
+
+
+# --- Stroke and Text Items ---
+class StrokeItem(QGraphicsPathItem):
+    # Pen stroke. Zoomed out, it draws a simplified copy of its path (cached per tolerance), or a filled rect
+    # once it is only a pixel or two across.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._simplified = {} # Tolerance -> QPainterPath
+
+    def setPath(self, path):
+        self._simplified.clear()
+        super().setPath(path)
+
+    def paint(self, painter, option, widget=None):
+        lod = LOD.of(painter, option)
+        rect = self.boundingRect()
+        if LOD.is_tiny(rect, lod):
+            LOD.draw_tiny(painter, rect, self.pen().color())
+            return
+        tolerance = LOD.stroke_tolerance(lod)
+        if not tolerance:
+            super().paint(painter, option, widget)
+            return
+        path = self._simplified.get(tolerance)
+        if path is None:
+            path = self._simplified[tolerance] = simplify_path(self.path(), tolerance)
+        painter.setPen(self.pen())
+        painter.setBrush(self.brush())
+        painter.drawPath(path)
+        if self.isSelected():
+            draw_selection_outline(painter, self, self.pen().color())
+
+
+class TextItem(QGraphicsTextItem):
+    # Text item that draws its lines as bars ("greeking") once they are too small to read
+    text_role = None # Theme key the text color follows; None once an explicit color is set
+
+    def set_text_role(self, role):
+        self.text_role = role
+        STYLES.follow_theme(self)
+
+    def set_text_color(self, color):
+        self.text_role = None
+        STYLES.unfollow_theme(self)
+        self.setDefaultTextColor(color)
+
+    def apply_theme(self, theme):
+        if self.text_role is not None:
+            self.setDefaultTextColor(theme[self.text_role])
+
+    def itemChange(self, change, value):
+        if change in CACHE_POLICY_CHANGES:
+            RENDER_SETTINGS.apply_cache_policy(self)
+        return super().itemChange(change, value)
+
+    def focusInEvent(self, event):
+        super().focusInEvent(event)
+        RENDER_SETTINGS.apply_cache_policy(self) # Editing: no cache
+
+    def focusOutEvent(self, event):
+        super().focusOutEvent(event)
+        RENDER_SETTINGS.apply_cache_policy(self)
+
+    def paint(self, painter, option, widget=None):
+        lod = LOD.of(painter, option)
+        rect = self.boundingRect()
+        if LOD.is_tiny(rect, lod):
+            LOD.draw_tiny(painter, rect, self.defaultTextColor())
+            return
+        if not LOD.greeks_text(QFontMetricsF(self.font()).height(), lod):
+            super().paint(painter, option, widget)
+            return
+        bars = []
+        block = self.document().begin()
+        while block.isValid():
+            layout = block.layout()
+            origin = layout.position()
+            for index in range(layout.lineCount()):
+                line_rect = layout.lineAt(index).naturalTextRect().translated(origin)
+                bars.append(QRectF(line_rect.left(), line_rect.top() + line_rect.height() * 0.25,
+                                   line_rect.width(), line_rect.height() * 0.5))
+            block = block.next()
+        LOD.draw_greeked(painter, bars, self.defaultTextColor())
+        if self.isSelected():
+            draw_selection_outline(painter, self, self.defaultTextColor())
+
+
+# --- Table Items ---
+class TableCellStore:
+    # Columnar cell storage: one list of strings per column, all columns padded to row_count.
+    def __init__(self, column_count=0):
+        self.columns = [[] for _ in range(column_count)]
+        self.row_count = 0
+
+    @property
+    def column_count(self):
+        return len(self.columns)
+
+    def _ensure_columns(self, column_count):
+        # Columns that appear late (ragged rows) are back-filled with empty cells
+        while len(self.columns) < column_count:
+            self.columns.append([""] * self.row_count)
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        self._ensure_columns(max(len(row) for row in rows))
+        for col_idx, column in enumerate(self.columns):
+            column.extend(row[col_idx] if col_idx < len(row) else "" for row in rows)
+        self.row_count += len(rows)
+
+    def append_columns(self, columns, row_count):
+        # Bulk append of an already transposed chunk (one list per column, each row_count long)
+        self._ensure_columns(len(columns))
+        for col_idx, column in enumerate(self.columns):
+            if col_idx < len(columns):
+                column.extend(columns[col_idx])
+            else:
+                column.extend([""] * row_count)
+        self.row_count += row_count
+
+    def cell(self, row, col):
+        return self.columns[col][row]
+
+
+class TableItem(QGraphicsItem):
+    # Single scene item for a pasted table. Only the cells intersecting the exposed rect are painted,
+    # and the elided text layout of each painted cell is cached as a QStaticText.
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.item_type = "table"
+        self.row_height = TABLE_DEFAULT_ROW_HEIGHT
+        self.cell_padding = TABLE_CELL_PADDING
+        self.font = QFont()
+        self._text_cache = OrderedDict() # (row, col) -> QStaticText, in LRU order
+        self.column_widths = []
+        self._column_offsets = [0.0] # Left edge of every column, plus the right edge of the last one
+        self._fitted_column_count = 0 # Columns whose width has been fitted to content
+        self.set_column_widths([TABLE_DEFAULT_COLUMN_WIDTH] * store.column_count)
+        STYLES.follow_theme(self) # Sets border_pen, fill_brush and text_color
+
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True) # Needed for option.exposedRect
+
+    def set_column_widths(self, widths):
+        self.prepareGeometryChange()
+        self.column_widths = list(widths)
+        offsets = [0.0]
+        for width in self.column_widths:
+            offsets.append(offsets[-1] + width)
+        self._column_offsets = offsets
+        self._text_cache.clear() # Elided text depends on column width
+        self.update()
+
+    def append_rows(self, rows):
+        self.prepareGeometryChange()
+        self.store.append_rows(rows)
+        self._sync_column_count()
+
+    def append_columns(self, columns, row_count):
+        self.prepareGeometryChange()
+        self.store.append_columns(columns, row_count)
+        self._sync_column_count()
+
+    def _sync_column_count(self):
+        if self.store.column_count > len(self.column_widths):
+            extra = self.store.column_count - len(self.column_widths)
+            self.set_column_widths(self.column_widths + [TABLE_DEFAULT_COLUMN_WIDTH] * extra)
+        self.update()
+
+    def fit_column_widths(self, longest_texts):
+        # Fit columns to the longest text seen so far; one measurement per column, not per cell.
+        # Columns only ever grow once fitted, so rows arriving later don't make the table jump narrower.
+        metrics = QFontMetricsF(self.font)
+        widths = list(self.column_widths)
+        for col_idx, text in enumerate(longest_texts[:len(widths)]):
+            content_width = metrics.horizontalAdvance(text) + 2 * self.cell_padding
+            fitted = min(max(content_width, TABLE_MIN_COLUMN_WIDTH), TABLE_MAX_COLUMN_WIDTH)
+            widths[col_idx] = fitted if col_idx >= self._fitted_column_count else max(widths[col_idx], fitted)
+        self._fitted_column_count = max(self._fitted_column_count, min(len(longest_texts), len(widths)))
+        if widths != self.column_widths:
+            self.set_column_widths(widths)
+
+    def apply_theme(self, theme):
+        self.border_pen = QPen(theme["item_default_outline"])
+        self.fill_brush = QBrush(theme["window_bg"]) # Use window_bg for cells, or a lighter properties_bg
+        self.text_color = QColor(theme["text_color"])
+        self.update() # Also drops a cached pixmap
+
+    def boundingRect(self):
+        return QRectF(0, 0, self._column_offsets[-1], self.store.row_count * self.row_height)
+
+    def itemChange(self, change, value):
+        if change in CACHE_POLICY_CHANGES:
+            RENDER_SETTINGS.apply_cache_policy(self)
+        return super().itemChange(change, value)
+
+    def _static_text(self, row, col):
+        key = (row, col)
+        static_text = self._text_cache.get(key)
+        if static_text is not None:
+            self._text_cache.move_to_end(key)
+            return static_text
+        available_width = self.column_widths[col] - 2 * self.cell_padding
+        text = QFontMetricsF(self.font).elidedText(self.store.cell(row, col), Qt.TextElideMode.ElideRight, available_width)
+        static_text = QStaticText(text)
+        static_text.setTextFormat(Qt.TextFormat.PlainText)
+        self._text_cache[key] = static_text
+        if len(self._text_cache) > TABLE_TEXT_CACHE_LIMIT:
+            self._text_cache.popitem(last=False)
+        return static_text
+
+    def visible_cell_range(self, rect):
+        # Returns (first_row, last_row, first_col, last_col) of cells intersecting rect, or None
+        rect = rect.intersected(self.boundingRect())
+        if rect.isEmpty():
+            return None
+        first_row = max(0, int(rect.top() // self.row_height))
+        last_row = min(self.store.row_count - 1, int(rect.bottom() // self.row_height))
+        first_col = max(0, bisect_right(self._column_offsets, rect.left()) - 1)
+        last_col = min(len(self.column_widths) - 1, bisect_right(self._column_offsets, rect.right()) - 1)
+        if first_row > last_row or first_col > last_col:
+            return None
+        return first_row, last_row, first_col, last_col
+
+    def paint(self, painter, option, widget=None):
+        lod = LOD.of(painter, option)
+        if LOD.is_tiny(self.boundingRect(), lod):
+            LOD.draw_tiny(painter, self.boundingRect(), self.fill_brush.color())
+            return
+        # exposedRect can cover the whole item (e.g. QGraphicsScene.render), so also clip to the painter's device
+        device_rect = painter.worldTransform().inverted()[0].mapRect(QRectF(painter.viewport()))
+        cell_range = self.visible_cell_range(option.exposedRect.intersected(device_rect))
+        if cell_range:
+            first_row, last_row, first_col, last_col = cell_range
+            offsets = self._column_offsets
+            left, right = offsets[first_col], offsets[last_col + 1]
+            top, bottom = first_row * self.row_height, (last_row + 1) * self.row_height
+            block = QRectF(left, top, right - left, bottom - top)
+
+            painter.fillRect(block, self.fill_brush)
+            if LOD.is_tiny(QRectF(0, 0, 0, self.row_height), lod):
+                # Rows thinner than a pixel or two: the outline stands in for the grid and text
+                painter.setPen(self.border_pen)
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawRect(block)
+            else:
+                # Background and grid lines for the whole visible block in two calls
+                grid_lines = [QLineF(left, row * self.row_height, right, row * self.row_height) for row in range(first_row, last_row + 2)]
+                grid_lines.extend(QLineF(offsets[col], top, offsets[col], bottom) for col in range(first_col, last_col + 2))
+                painter.setPen(self.border_pen)
+                painter.drawLines(grid_lines)
+                metrics = QFontMetricsF(self.font)
+                if LOD.greeks_text(metrics.height(), lod):
+                    self._paint_greeked_cells(painter, metrics, first_row, last_row, first_col, last_col)
+                else:
+                    painter.setPen(self.text_color)
+                    painter.setFont(self.font)
+                    for col in range(first_col, last_col + 1):
+                        column = self.store.columns[col]
+                        text_x = offsets[col] + self.cell_padding
+                        for row in range(first_row, last_row + 1):
+                            if column[row]: # Skip empty cells
+                                painter.drawStaticText(QPointF(text_x, row * self.row_height + self.cell_padding), self._static_text(row, col))
+
+        if self.isSelected():
+            draw_selection_outline(painter, self, self.border_pen.color())
+
+    def _paint_greeked_cells(self, painter, metrics, first_row, last_row, first_col, last_col):
+        # A bar per non-empty cell, its length estimated from the character count (no text layout)
+        char_width, bar_height = metrics.averageCharWidth(), metrics.height() * 0.5
+        bar_offset = self.cell_padding + metrics.height() * 0.25
+        bars = []
+        for col in range(first_col, last_col + 1):
+            column = self.store.columns[col]
+            text_x = self._column_offsets[col] + self.cell_padding
+            available_width = self.column_widths[col] - 2 * self.cell_padding
+            for row in range(first_row, last_row + 1):
+                text = column[row]
+                if text:
+                    bars.append(QRectF(text_x, row * self.row_height + bar_offset, min(len(text) * char_width, available_width), bar_height))
+        if bars:
+            LOD.draw_greeked(painter, bars, self.text_color)
+
+# --- Tiled Image Item ---
+class TiledImageItem(QGraphicsPixmapItem):
+    # Pixmap item that paints from a lazily built mip pyramid. The level is picked from the painter's
+    # level of detail, and only the tile-aligned block of that level intersecting the exposed rect is drawn,
+    # so pan/zoom cost follows the screen size rather than the image size.
+    residency_manager = None # ImageResidencyManager shared by all image items (set by CanvasWindow)
+    pixel_buffer = None # SharedPixelBuffer backing pil_original_image, if any
+    passive_render = False # True while an overview (the navigator) renders: no touch or restore, evicted images stay evicted
+
+    def __init__(self, pixmap=None, parent=None):
+        super().__init__(parent)
+        self._mip_levels = {} # level -> QPixmap at 1/2**level of the pixmap size (level 0 is the pixmap itself)
+        self.evicted_state = None # Set while the pixels are evicted; see ImageResidencyManager
+        self._evicted_size = None # Pixmap size kept while evicted so geometry and hit-testing don't change
+        self.residency_stamp = 0
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True) # Needed for option.exposedRect
+        self.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        if pixmap is not None:
+            self.setPixmap(pixmap)
+        if TiledImageItem.residency_manager is not None:
+            TiledImageItem.residency_manager.track(self)
+
+    def setPixmap(self, pixmap):
+        self._mip_levels = {} # A new dict: the old one may be shared with other items (see show_pixel_buffer)
+        self._evicted_size = None
+        super().setPixmap(pixmap)
+
+    def set_pixel_buffer(self, buffer):
+        self.pixel_buffer = buffer
+        self.pil_original_image = buffer.pil_image
+
+    def shares_pixel_buffer(self):
+        # False once pil_original_image was replaced (crop, re-decode of a private image, ...)
+        return self.pixel_buffer is not None and getattr(self, 'pil_original_image', None) is self.pixel_buffer.pil_image
+
+    def show_pixel_buffer(self):
+        # Display the shared buffer unchanged: the pixmap (implicitly shared by Qt) and mip levels are common
+        self.setPixmap(self.pixel_buffer.pixmap())
+        self._mip_levels = self.pixel_buffer.mip_levels
+
+    def itemChange(self, change, value):
+        if change in CACHE_POLICY_CHANGES:
+            RENDER_SETTINGS.apply_cache_policy(self)
+        return super().itemChange(change, value)
+
+    def release_pixels(self):
+        # Drop the pixmap and mip levels but keep the item's geometry
+        self._evicted_size = QSizeF(self.pixmap().size())
+        self._mip_levels = {}
+        super().setPixmap(QPixmap())
+
+    def boundingRect(self):
+        if self._evicted_size is not None:
+            return QRectF(self.offset(), self._evicted_size)
+        return super().boundingRect()
+
+    def shape(self):
+        if self._evicted_size is not None:
+            path = QPainterPath()
+            path.addRect(self.boundingRect())
+            return path
+        return super().shape()
+
+    def contains(self, point):
+        if self._evicted_size is not None:
+            return self.boundingRect().contains(point)
+        return super().contains(point)
+
+    def _mip_level_pixmap(self, level):
+        pixmap = self._mip_levels.get(level)
+        if pixmap is None:
+            source = self.pixmap()
+            width = max(1, math.ceil(source.width() / 2 ** level))
+            height = max(1, math.ceil(source.height() / 2 ** level))
+            pixmap = source.scaled(width, height, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+            self._mip_levels[level] = pixmap
+        return pixmap
+
+    def mip_level_for(self, level_of_detail):
+        # Coarsest level that still has at least one texel per device pixel
+        if level_of_detail >= 1.0 or level_of_detail <= 0.0:
+            return 0
+        max_level = max(0, int(math.log2(max(self.pixmap().width(), self.pixmap().height(), 1) / IMAGE_MIN_MIP_EDGE)))
+        return min(int(math.log2(1.0 / level_of_detail)), max_level)
+
+    def paint(self, painter, option, widget=None):
+        manager = TiledImageItem.residency_manager
+        if manager is not None:
+            if not TiledImageItem.passive_render:
+                manager.touch(self)
+            if self.evicted_state is not None:
+                # Placeholder until the pixels are decoded back
+                if not TiledImageItem.passive_render:
+                    manager.request_restore(self)
+                painter.fillRect(self.boundingRect(), QColor(128, 128, 128, 60))
+                return
+        source_pixmap = self.pixmap()
+        if source_pixmap.isNull():
+            return
+        image_rect = QRectF(self.offset(), QSizeF(source_pixmap.size()))
+        device_rect = painter.worldTransform().inverted()[0].mapRect(QRectF(painter.viewport()))
+        visible_rect = option.exposedRect.intersected(device_rect).intersected(image_rect)
+
+        if not visible_rect.isEmpty():
+            level_of_detail = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+            level = self.mip_level_for(level_of_detail)
+            level_pixmap = source_pixmap if level == 0 else self._mip_level_pixmap(level)
+            scale_x = level_pixmap.width() / source_pixmap.width()
+            scale_y = level_pixmap.height() / source_pixmap.height()
+
+            # Snap the visible block to the tile grid of the chosen level; drawn as one blit so tiles can't seam
+            local = visible_rect.translated(-self.offset())
+            first_tile_x = int(local.left() * scale_x // IMAGE_TILE_SIZE)
+            first_tile_y = int(local.top() * scale_y // IMAGE_TILE_SIZE)
+            last_tile_x = int(math.ceil(local.right() * scale_x / IMAGE_TILE_SIZE))
+            last_tile_y = int(math.ceil(local.bottom() * scale_y / IMAGE_TILE_SIZE))
+            source_rect = QRectF(first_tile_x * IMAGE_TILE_SIZE, first_tile_y * IMAGE_TILE_SIZE,
+                                 (last_tile_x - first_tile_x) * IMAGE_TILE_SIZE, (last_tile_y - first_tile_y) * IMAGE_TILE_SIZE)
+            source_rect = source_rect.intersected(QRectF(level_pixmap.rect()))
+            target_rect = QRectF(source_rect.left() / scale_x, source_rect.top() / scale_y,
+                                 source_rect.width() / scale_x, source_rect.height() / scale_y).translated(self.offset())
+
+            # Past 100% show real pixels (nearest-neighbour) for inspection; smooth when minified
+            # (and only if the painter asks for smoothing, which the view drops while the user navigates)
+            smooth = (level_of_detail < 1.0 and self.transformationMode() == Qt.TransformationMode.SmoothTransformation
+                      and painter.testRenderHint(QPainter.RenderHint.SmoothPixmapTransform))
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, smooth)
+            painter.drawPixmap(target_rect, level_pixmap, source_rect)
+
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.setPen(QPen(QColor("black"), 0, Qt.PenStyle.DashLine))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRect(image_rect)
+
+
+# --- Background Table Parsing ---
+def detect_table_dialect(sample, truncated=False):
+    # Sniff the delimiter from a sample rather than the whole text; drop a trailing partial line first
+    if truncated and "\n" in sample:
+        sample = sample[:sample.rindex("\n")]
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",\t;|")
+    except csv.Error:
+        # Sniffing failed (e.g. ragged rows), fall back to the most frequent delimiter on the first line
+        first_line = sample.splitlines()[0] if sample else ""
+        counts = {delimiter: first_line.count(delimiter) for delimiter in "\t,;|"}
+        best = max(counts, key=counts.get)
+        if best == '\t':
+            return csv.excel_tab
+        if counts[best] == 0 or best == ',':
+            return csv.excel # Default to Excel (comma-separated)
+        return type("SniffedDialect", (csv.excel,), {"delimiter": best})
+
+
+class TableParseWorker(QObject):
+    # Parses CSV/TSV text or a file on a worker thread, handing rows to the GUI thread in column chunks
+    chunk_parsed = Signal(object, int, object) # columns, row_count, longest text per column
+    progress = Signal(int) # 0-100
+    finished = Signal()
+    failed = Signal(str)
+
+    def __init__(self, text=None, file_path=None):
+        super().__init__()
+        self.text = text
+        self.file_path = file_path
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @Slot()
+    @traced("table_parse", "table")
+    def run(self):
+        try:
+            if self.file_path:
+                source = open(self.file_path, newline="", encoding="utf-8-sig", errors="replace")
+                total_size = max(os.path.getsize(self.file_path), 1)
+            else:
+                source = StringIO(self.text, newline="")
+                total_size = max(len(self.text), 1)
+            with source:
+                sample = source.read(TABLE_SNIFF_SAMPLE_SIZE)
+                dialect = detect_table_dialect(sample, truncated=len(sample) == TABLE_SNIFF_SAMPLE_SIZE)
+                source.seek(0)
+                consumed = 0
+
+                def counted_lines():
+                    # csv.reader consumes lines lazily; count characters for the progress bar
+                    nonlocal consumed
+                    for line in source:
+                        consumed += len(line)
+                        yield line
+
+                rows = []
+                last_percent = -1
+                for row in csv.reader(counted_lines(), dialect):
+                    rows.append(row)
+                    if len(rows) >= TABLE_PARSE_CHUNK_ROWS:
+                        if self._cancelled:
+                            return
+                        self._emit_chunk(rows)
+                        rows = []
+                        percent = min(99, consumed * 100 // total_size)
+                        if percent != last_percent:
+                            last_percent = percent
+                            self.progress.emit(percent)
+                if rows and not self._cancelled:
+                    self._emit_chunk(rows)
+            self.progress.emit(100)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            self.finished.emit()
+
+    def _emit_chunk(self, rows):
+        # Transpose in bulk and find the longest string per column, so the GUI thread only measures one text per column
+        columns = [list(column) for column in zip_longest(*rows, fillvalue="")]
+        longest = [max(column, key=len) for column in columns]
+        self.chunk_parsed.emit(columns, len(rows), longest)
+
+
+class TableImportJob(QObject):
+    # Lives on the GUI thread: owns the parse thread and grows the TableItem as chunks arrive
+    def __init__(self, window, scene_pos, text=None, file_path=None):
+        super().__init__(window)
+        self.window = window
+        self.scene_pos = QPointF(scene_pos)
+        self.file_path = file_path
+        self.table_item = None
+        self.error = None
+
+        self.thread = QThread(self)
+        self.worker = TableParseWorker(text=text, file_path=file_path)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run)
+        self.worker.chunk_parsed.connect(self.on_chunk_parsed)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.failed.connect(self.on_failed)
+        self.worker.finished.connect(self.on_finished)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.worker.cancel()
+        self.thread.quit()
+        self.thread.wait()
+
+    @Slot(object, int, object)
+    @traced("table_append_chunk", "table")
+    def on_chunk_parsed(self, columns, row_count, longest):
+        if self.table_item is None:
+            # First rows appear right away; later chunks are appended to the same item
+            self.table_item = TableItem(TableCellStore())
+            self.table_item.append_columns(columns, row_count)
+            self.table_item.fit_column_widths(longest)
+            self.table_item.setPos(self.scene_pos)
+            description = "Import Table" if self.file_path else "Paste Table"
+            self.window.undo_stack.push(AddItemCommand(self.table_item, self.window.scene, description))
+        else:
+            self.table_item.append_columns(columns, row_count)
+            self.table_item.fit_column_widths(longest)
+
+    @Slot(int)
+    def on_progress(self, percent):
+        self.window.table_progress_bar.setValue(percent)
+
+    @Slot(str)
+    def on_failed(self, message):
+        self.error = message
+
+    @Slot()
+    def on_finished(self):
+        self.thread.quit()
+        self.thread.wait()
+        self.window._on_table_import_finished(self)
+
+
+# --- Parallel Image Import ---
+def normalize_pil_mode(pil_image):
+    # Keep alpha where the source has it, otherwise plain RGB (matches what qimage_to_pil used to produce)
+    if pil_image.mode in ("RGB", "RGBA"):
+        return pil_image
+    if pil_image.mode in ("LA", "PA", "P") or "transparency" in pil_image.info:
+        return pil_image.convert("RGBA")
+    return pil_image.convert("RGB")
+
+
+def decode_image_file(file_path, max_edge=None, source_rect=None):
+    # Decode at a reduced working resolution: Image.thumbnail() uses JPEG draft mode (DCT scaling) and
+    # Pillow's reducing decoders, so the full-size bitmap is never materialised.
+    # source_rect (left, top, right, bottom) in native pixels selects a cropped region; max_edge applies to it.
+    with Image.open(file_path) as source:
+        native_width, native_height = source.size
+        region = source_rect or (0, 0, native_width, native_height)
+        region_edge = max(region[2] - region[0], region[3] - region[1], 1)
+        scale = 1.0 if max_edge is None else min(1.0, max_edge / region_edge)
+        if scale < 1.0:
+            source.thumbnail((max(1, round(native_width * scale)), max(1, round(native_height * scale))), reducing_gap=2.0)
+        else:
+            source.load()
+        pil_image = normalize_pil_mode(source)
+    if source_rect:
+        actual_scale = pil_image.width / native_width
+        pil_image = pil_image.crop(tuple(round(value * actual_scale) for value in source_rect))
+    return pil_image, (native_width, native_height)
+
+
+class ImageDecodeTask(QRunnable):
+    # Decodes one image file on the thread pool: a quick thumbnail first, then the working-resolution image.
+    # Pillow releases the GIL while decoding, so tasks run in parallel across cores.
+    def __init__(self, batch, index, file_path, fit_edge, device_scale):
+        super().__init__()
+        self.batch = batch
+        self.index = index
+        self.file_path = file_path
+        self.fit_edge = fit_edge # Largest on-canvas edge (scene units) the image will be shown at
+        self.device_scale = device_scale # Device pixels per scene unit in the view at import time
+
+    @traced("image_decode", "image")
+    def run(self):
+        try:
+            with Image.open(self.file_path) as source:
+                native_width, native_height = source.size
+                source.draft("RGB", (IMPORT_THUMBNAIL_SIZE, IMPORT_THUMBNAIL_SIZE)) # JPEG: decode at 1/2..1/8 scale
+                thumbnail = normalize_pil_mode(source)
+                thumbnail.thumbnail((IMPORT_THUMBNAIL_SIZE, IMPORT_THUMBNAIL_SIZE))
+            self.batch.thumbnail_ready.emit(self.index, pil_to_qimage(thumbnail), native_width, native_height)
+
+            # Working resolution: what the image covers on screen now, never more than the file has
+            display_edge = min(max(native_width, native_height), self.fit_edge)
+            pil_image, _ = decode_image_file(self.file_path, max_edge=math.ceil(display_edge * self.device_scale))
+            buffer = SharedPixelBuffer.intern(pil_image) # The same file imported twice shares one buffer
+            buffer.prepare()
+            self.batch.image_ready.emit(self.index, buffer)
+        except Exception as e:
+            self.batch.decode_failed.emit(self.index, str(e))
+
+
+class ImageRedecodeTask(QRunnable):
+    # Re-decodes an image from its source file at a higher working resolution (zoom-in)
+    def __init__(self, signals, item, file_path, max_edge, source_rect):
+        super().__init__()
+        self.signals = signals
+        self.item = item
+        self.file_path = file_path
+        self.max_edge = max_edge
+        self.source_rect = source_rect
+
+    @traced("image_redecode", "image")
+    def run(self):
+        try:
+            pil_image, _ = decode_image_file(self.file_path, max_edge=self.max_edge, source_rect=self.source_rect)
+            buffer = SharedPixelBuffer.intern(pil_image)
+            buffer.prepare()
+            self.signals.redecoded.emit(self.item, buffer, self.source_rect)
+        except Exception as e:
+            log_image.error("Error re-decoding %s: %s", self.file_path, e)
+            self.signals.redecoded.emit(self.item, None, self.source_rect)
+
+
+class ImageRedecodeSignals(QObject):
+    redecoded = Signal(object, object, object) # item, SharedPixelBuffer (or None on failure), requested source_rect
+
+
+class ImageImportBatch(QObject):
+    # Lives on the GUI thread. Every file gets a placeholder item immediately; the thumbnail and then the
+    # full-resolution pixmap are swapped in as the decode tasks report back.
+    thumbnail_ready = Signal(int, QImage, int, int) # index, thumbnail, native width, native height
+    image_ready = Signal(int, object) # index, SharedPixelBuffer
+    decode_failed = Signal(int, str)
+
+    def __init__(self, window, file_paths, center_pos):
+        super().__init__(window)
+        self.window = window
+        self.file_paths = list(file_paths)
+        self.center_pos = QPointF(center_pos)
+        self.use_grid = len(self.file_paths) > 1 # A single image keeps its native size (fitted to the view), centered
+        if self.use_grid:
+            self.fit_edge = IMPORT_GRID_CELL_SIZE
+        else:
+            visible_rect = window.view.mapToScene(window.view.viewport().rect()).boundingRect()
+            self.fit_edge = max(1.0, min(visible_rect.width(), visible_rect.height()) * IMPORT_FIT_VIEW_FRACTION)
+        self.device_scale = window.view_device_scale()
+        self.grid_columns = max(1, math.ceil(math.sqrt(len(self.file_paths))))
+        self.items = []
+        self.display_scales = {}
+        self.errors = []
+        self.pending = len(self.file_paths)
+        self.command = None
+
+        self.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.image_ready.connect(self.on_image_ready)
+        self.decode_failed.connect(self.on_decode_failed)
+
+    def _cell_rect(self, index):
+        grid_rows = math.ceil(len(self.file_paths) / self.grid_columns)
+        pitch = IMPORT_GRID_CELL_SIZE + IMPORT_GRID_SPACING
+        grid_origin = self.center_pos - QPointF(self.grid_columns * pitch, grid_rows * pitch) / 2
+        row, col = divmod(index, self.grid_columns)
+        return QRectF(grid_origin.x() + col * pitch, grid_origin.y() + row * pitch, IMPORT_GRID_CELL_SIZE, IMPORT_GRID_CELL_SIZE)
+
+    def start(self):
+        placeholder = QPixmap(16, 16)
+        placeholder.fill(self.window.current_theme_colors["preview_dash_color"])
+        for index, file_path in enumerate(self.file_paths):
+            item = TiledImageItem(placeholder)
+            item.is_loading_image = True # Not selectable until the full image is in
+            item.source_path = file_path
+            if self.use_grid:
+                item.setPos(self._cell_rect(index).topLeft())
+                item.setScale(IMPORT_GRID_CELL_SIZE / placeholder.width())
+            else:
+                item.setPos(self.center_pos - QPointF(placeholder.width() / 2, placeholder.height() / 2))
+            self.items.append(item)
+
+        description = "Add Image" if len(self.items) == 1 else f"Add {len(self.items)} Images"
+        self.command = AddItemsCommand(self.items, self.window.scene, description)
+        self.window.undo_stack.push(self.command)
+
+        pool = QThreadPool.globalInstance()
+        for index, file_path in enumerate(self.file_paths):
+            pool.start(ImageDecodeTask(self, index, file_path, self.fit_edge, self.device_scale))
+
+    def _place_item(self, item, index):
+        # Position for the final on-canvas size, which doesn't change between thumbnail and working image
+        native_width, native_height = item.source_size
+        display_scale = self.display_scales[index]
+        display_size = QSizeF(native_width * display_scale, native_height * display_scale)
+        item.setScale(display_scale * native_width / max(item.pixmap().width(), 1))
+        if self.use_grid:
+            cell = self._cell_rect(index)
+            item.setPos(cell.center() - QPointF(display_size.width() / 2, display_size.height() / 2))
+        else:
+            item.setPos(self.center_pos - QPointF(display_size.width() / 2, display_size.height() / 2))
+
+    @Slot(int, QImage, int, int)
+    def on_thumbnail_ready(self, index, thumbnail, native_width, native_height):
+        item = self.items[index]
+        item.source_size = (native_width, native_height)
+        item.source_rect = None # Region of the source file shown by the item, in native pixels (None = whole file)
+        self.display_scales[index] = min(1.0, self.fit_edge / max(native_width, native_height, 1))
+        item.setPixmap(QPixmap.fromImage(thumbnail))
+        self._place_item(item, index)
+
+    @Slot(int, object)
+    def on_image_ready(self, index, buffer):
+        item = self.items[index]
+        item.set_pixel_buffer(buffer)
+        item.show_pixel_buffer()
+        self._place_item(item, index)
+
+        # Store PIL image versions (at working resolution; the source file stays the source of truth)
+        item.pil_after_bg_removal = None
+        item.pil_for_display = item.pil_original_image # Effects always produce a new image, so the display image can start shared
+        item.current_brightness_factor = 1.0
+        item.is_loading_image = False
+        item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsSelectable)
+        item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsMovable)
+        if not self.use_grid and item.scene():
+            item.setSelected(True)
+        self._task_done()
+
+    @Slot(int, str)
+    def on_decode_failed(self, index, message):
+        item = self.items[index]
+        if item.scene():
+            item.scene().removeItem(item)
+        if item in self.command.items:
+            self.command.items.remove(item)
+        self.errors.append(f"{os.path.basename(self.file_paths[index])}: {message}")
+        log_image.warning("Could not load image from %s: %s", self.file_paths[index], message)
+        self._task_done()
+
+    def _task_done(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self.window._on_image_import_finished(self)
+
+
+# --- Image Residency ---
+def _pil_image_bytes(pil_image):
+    return pil_image.width * pil_image.height * len(pil_image.getbands()) if pil_image is not None else 0
+
+
+def _pixmap_bytes(pixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8 if not pixmap.isNull() else 0
+
+
+def estimate_image_item_bytes(item, seen=None):
+    # Decoded bytes held by an image item, per buffer kind. A buffer shared between kinds is counted once;
+    # pass the same `seen` set for several items to count buffers shared between items once as well.
+    usage = {}
+    seen = set() if seen is None else seen
+    for kind, attribute in (("original", 'pil_original_image'), ("bg_removed", 'pil_after_bg_removal'), ("display", 'pil_for_display')):
+        pil_image = getattr(item, attribute, None)
+        usage[kind] = 0 if pil_image is None or id(pil_image) in seen else _pil_image_bytes(pil_image)
+        seen.add(id(pil_image))
+    modifiable_qimage = getattr(item, 'modifiable_qimage', None)
+    usage["modifiable_qimage"] = modifiable_qimage.sizeInBytes() if modifiable_qimage is not None else 0
+    usage["pixmap"] = 0
+    for pixmap in [item.pixmap()] + list(getattr(item, '_mip_levels', {}).values()):
+        if pixmap.cacheKey() not in seen: # Implicitly shared QPixmaps have the same cache key
+            seen.add(pixmap.cacheKey())
+            usage["pixmap"] += _pixmap_bytes(pixmap)
+    return usage
+
+
+def _encode_png(pil_image):
+    buffer = BytesIO()
+    pil_image.save(buffer, "PNG", compress_level=1) # Fast, lossless; pixels must come back exactly
+    return buffer.getvalue()
+
+
+class ImageEvictTask(QRunnable):
+    # Compresses an evicted image's buffers to PNG on the thread pool (optionally spilling them to disk)
+    def __init__(self, manager, item, stamp, pil_images, qimage):
+        super().__init__()
+        self.manager = manager
+        self.item = item
+        self.stamp = stamp # residency_stamp when eviction started; a newer stamp means the item was used meanwhile
+        self.pil_images = pil_images # kind -> PIL image
+        self.qimage = qimage # Pixmap contents for items without PIL buffers (e.g. rasterized shapes)
+
+    @traced("image_evict_compress", "image")
+    def run(self):
+        try:
+            blobs = {kind: _encode_png(pil_image) for kind, pil_image in self.pil_images.items()}
+            if self.qimage is not None:
+                buffer = QBuffer()
+                buffer.open(QBuffer.OpenModeFlag.WriteOnly)
+                self.qimage.save(buffer, "PNG", 90)
+                blobs["pixmap"] = bytes(buffer.data())
+            if self.manager.spill_dir:
+                for kind, blob in blobs.items():
+                    file_descriptor, path = tempfile.mkstemp(suffix=".png", prefix="canvas_", dir=self.manager.spill_dir)
+                    with os.fdopen(file_descriptor, "wb") as spill_file:
+                        spill_file.write(blob)
+                    blobs[kind] = path
+            self.manager.compressed.emit(self.item, self.stamp, blobs)
+        except Exception as e:
+            log_image.error("Error compressing image for eviction: %s", e)
+            self.manager.compressed.emit(self.item, self.stamp, None)
+
+
+class ImageRestoreTask(QRunnable):
+    # Decodes an evicted image back to pixels on the thread pool
+    def __init__(self, manager, item, state):
+        super().__init__()
+        self.manager = manager
+        self.item = item
+        self.state = state
+
+    @traced("image_restore", "image")
+    def run(self):
+        try:
+            images = self.manager.decode_state(self.item, self.state)
+        except Exception as e:
+            log_image.error("Error restoring evicted image: %s", e)
+            images = None
+        self.manager.restored.emit(self.item, self.state, images)
+
+
+class ImageResidencyManager(QObject):
+    # Keeps decoded image pixels within a memory budget. Every TiledImageItem is tracked; painting stamps it
+    # as recently used. Over budget, the least recently used images that are off-screen (or only referenced by
+    # undo history) are evicted: images still backed by their source file just drop their pixels, others are
+    # compressed to PNG in memory or in a spill directory. Evicted items keep their geometry and restore
+    # asynchronously when painted again, or synchronously when selected or edited.
+    compressed = Signal(object, object, object) # item, stamp, blobs (kind -> bytes or spill file path) or None
+    restored = Signal(object, object, object) # item, eviction state, decoded images or None
+
+    def __init__(self, window, budget_bytes, spill_dir=None):
+        super().__init__(window)
+        self.window = window
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.items = weakref.WeakSet()
+        self.clock = 0
+        self.busy = weakref.WeakSet() # Items with an eviction or restore in flight
+        self.compressed.connect(self._on_compressed)
+        self.restored.connect(self._on_restored)
+        self.enforce_timer = QTimer(self)
+        self.enforce_timer.setInterval(IMAGE_RESIDENCY_CHECK_MS)
+        self.enforce_timer.timeout.connect(self.enforce_budget)
+        self.enforce_timer.start()
+
+    def track(self, item):
+        self.items.add(item)
+
+    def touch(self, item):
+        self.clock += 1
+        item.residency_stamp = self.clock
+
+    def resident_bytes(self):
+        seen = set()
+        return sum(sum(estimate_image_item_bytes(item, seen).values()) for item in list(self.items) if item.evicted_state is None)
+
+    def _can_evict(self, item, visible_rect):
+        if item.evicted_state is not None or item in self.busy or item.pixmap().isNull():
+            return False
+        if item.isSelected() or item == self.window.current_crop_item or item == self.window.selected_item:
+            return False
+        if getattr(item, 'is_loading_image', False) or getattr(item, 'redecode_pending', False):
+            return False
+        # Items on screen stay resident; items off-scene (removed, kept alive by undo history) can always go
+        return item.scene() is None or not item.sceneBoundingRect().intersects(visible_rect)
+
+    def enforce_budget(self):
+        seen = set() # Shared buffers count toward their most recently used item only
+        resident = sorted((item for item in list(self.items) if item.evicted_state is None), key=lambda item: -item.residency_stamp)
+        usage = [(item, sum(estimate_image_item_bytes(item, seen).values())) for item in resident]
+        total = sum(size for _, size in usage)
+        if total <= self.budget_bytes:
+            return
+        visible_rect = self.window.view.mapToScene(self.window.view.viewport().rect()).boundingRect()
+        for item, size in sorted(usage, key=lambda entry: entry[0].residency_stamp):
+            if total <= self.budget_bytes:
+                break
+            if size and self._can_evict(item, visible_rect): # size 0: all its buffers are shared with newer items
+                self._evict(item)
+                total -= size
+
+    def _evict(self, item):
+        if self.window._can_redecode_image(item):
+            # Pixels are a pure function of the source file and the effect settings: just forget them
+            pixmap = item.pixmap()
+            self._release(item, {"source_size": (pixmap.width(), pixmap.height())})
+            return
+        pil_images = {}
+        if getattr(item, 'pil_original_image', None) is not None:
+            pil_images["original"] = item.pil_original_image
+            if item.pil_after_bg_removal is not None:
+                pil_images["bg_removed"] = item.pil_after_bg_removal
+            if getattr(item, 'has_erased_pixels', False):
+                pil_images["display"] = item.pil_for_display # Erased pixels can't be recomputed from the effects
+        qimage = None if pil_images else item.pixmap().toImage() # QPixmap can't leave the GUI thread, QImage can
+        self.busy.add(item)
+        QThreadPool.globalInstance().start(ImageEvictTask(self, item, item.residency_stamp, pil_images, qimage))
+
+    @Slot(object, object, object)
+    def _on_compressed(self, item, stamp, blobs):
+        self.busy.discard(item)
+        if blobs is None:
+            return
+        visible_rect = self.window.view.mapToScene(self.window.view.viewport().rect()).boundingRect()
+        # Used or edited while compressing: keep the pixels and drop the stale compressed copy
+        if item.residency_stamp != stamp or not self._can_evict(item, visible_rect):
+            self._discard_spill_files(blobs)
+            return
+        self._release(item, {"blobs": blobs})
+
+    def _release(self, item, state):
+        item.evicted_state = state
+        item.pixel_buffer = None
+        if hasattr(item, 'pil_original_image'):
+            item.pil_original_image = None
+            item.pil_after_bg_removal = None
+            item.pil_for_display = None
+        item.modifiable_qimage = None
+        item.release_pixels()
+
+    def decode_state(self, item, state):
+        # Runs on either thread: turns an eviction state back into images (kind -> PIL image, "pixmap" -> QImage)
+        if "source_size" in state:
+            width, height = state["source_size"]
+            pil_image, _ = decode_image_file(item.source_path, max_edge=max(width, height), source_rect=item.source_rect)
+            if pil_image.size != (width, height): # Rounding in the reduced decode; geometry must not change
+                pil_image = pil_image.resize((width, height), Image.Resampling.LANCZOS)
+            buffer = SharedPixelBuffer.intern(pil_image) # Re-joins other items still showing the same pixels
+            buffer.prepare()
+            return {"original": buffer}
+        images = {}
+        for kind, blob in state["blobs"].items():
+            if isinstance(blob, str):
+                with open(blob, "rb") as spill_file:
+                    blob = spill_file.read()
+            if kind == "pixmap":
+                images[kind] = QImage.fromData(blob, "PNG")
+            else:
+                with Image.open(BytesIO(blob)) as pil_image:
+                    pil_image.load()
+                    images[kind] = pil_image.copy()
+        if "original" in images:
+            images["original"] = SharedPixelBuffer.intern(images["original"])
+        return images
+
+    def request_restore(self, item):
+        if item.evicted_state is None or item in self.busy:
+            return
+        self.busy.add(item)
+        QThreadPool.globalInstance().start(ImageRestoreTask(self, item, item.evicted_state))
+
+    def ensure_resident(self, item):
+        # Synchronous restore for code that needs the pixels now (selection, erasing, export)
+        state = getattr(item, 'evicted_state', None)
+        if state is None:
+            return
+        try:
+            images = self.decode_state(item, state)
+        except Exception as e:
+            log_image.error("Error restoring evicted image: %s", e)
+            return
+        self._apply(item, state, images)
+
+    @Slot(object, object, object)
+    def _on_restored(self, item, state, images):
+        self.busy.discard(item)
+        if images is None or item.evicted_state is not state: # Failed, or already restored synchronously
+            return
+        self._apply(item, state, images)
+
+    def _apply(self, item, state, images):
+        item.evicted_state = None
+        self.touch(item)
+        if "pixmap" in images:
+            item.setPixmap(QPixmap.fromImage(images["pixmap"]))
+        else:
+            item.set_pixel_buffer(images["original"])
+            item.pil_after_bg_removal = images.get("bg_removed")
+            if "display" in images:
+                item.pil_for_display = images["display"]
+                item.setPixmap(QPixmap.fromImage(pil_to_qimage(item.pil_for_display)))
+            else:
+                self.window._apply_image_effects(item) # Recomputes pil_for_display and the pixmap
+        self._discard_spill_files(state.get("blobs", {}))
+
+    def _discard_spill_files(self, blobs):
+        for blob in blobs.values():
+            if isinstance(blob, str):
+                try:
+                    os.remove(blob)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        self.enforce_timer.stop()
+        for item in list(self.items):
+            if item.evicted_state is not None:
+                self._discard_spill_files(item.evicted_state.get("blobs", {}))
+
+
+# --- Memory Diagnostics ---
+def estimate_table_item_bytes(table_item):
+    # String storage is estimated from a sample of each column; exact sizes would mean touching every cell
+    cell_bytes = 0
+    for column in table_item.store.columns:
+        if column:
+            step = max(1, len(column) // TABLE_CELL_SAMPLE_SIZE)
+            sample = column[::step]
+            cell_bytes += sys.getsizeof(column) + len(column) * sum(sys.getsizeof(text) for text in sample) // len(sample)
+    return {"table_cells": cell_bytes, "text_layouts": len(table_item._text_cache) * TABLE_LAYOUT_ESTIMATE_BYTES}
+
+
+def estimate_item_bytes(item, seen):
+    # kind -> estimated bytes for any canvas item; buffers already in `seen` (shared with another item) count as 0
+    usage = dict.fromkeys(MEMORY_KINDS, 0)
+    if isinstance(item, QGraphicsPixmapItem):
+        usage.update(estimate_image_item_bytes(item, seen))
+        state = getattr(item, 'evicted_state', None)
+        if state is not None:
+            usage["compressed"] = sum(len(blob) for blob in state.get("blobs", {}).values() if isinstance(blob, bytes))
+    elif isinstance(item, TableItem):
+        usage.update(estimate_table_item_bytes(item))
+    elif isinstance(item, (QGraphicsPathItem, QGraphicsPolygonItem)):
+        shape_path = item.path() if isinstance(item, QGraphicsPathItem) else None
+        points = shape_path.elementCount() if shape_path is not None else item.polygon().size()
+        usage["vector"] = points * 24 # x, y and element type per point
+    return usage
+
+
+def describe_item(item):
+    if isinstance(item, QGraphicsPixmapItem):
+        name = os.path.basename(item.source_path) if getattr(item, 'source_path', None) else "Image"
+    elif isinstance(item, TableItem):
+        name = f"Table {item.store.row_count}x{item.store.column_count}"
+    elif isinstance(item, QGraphicsTextItem):
+        name = f"Text '{item.toPlainText()[:20]}'"
+    else:
+        name = type(item).__name__.replace("QGraphics", "").replace("Item", "") or "Item"
+    position = item.scenePos()
+    return f"{name} @ ({position.x():.0f}, {position.y():.0f})"
+
+
+def collect_memory_report(window):
+    # Every top-level scene item, plus items only kept alive by the undo history
+    items = {id(item): (item, "scene") for item in window.scene.items() if item.parentItem() is None}
+    for index in range(window.undo_stack.count()):
+        command = window.undo_stack.command(index)
+        for item in ([command.item] if hasattr(command, 'item') else []) + list(getattr(command, 'items', [])):
+            if id(item) not in items and item.scene() is None:
+                items[id(item)] = (item, "undo_history")
+
+    seen = set()
+    totals = dict.fromkeys(MEMORY_KINDS, 0)
+    by_location = {"scene": 0, "undo_history": 0}
+    entries = []
+    for item, location in items.values():
+        usage = estimate_item_bytes(item, seen)
+        total = sum(usage.values())
+        for kind, size in usage.items():
+            totals[kind] += size
+        by_location[location] += total
+        entries.append({"item": describe_item(item), "type": type(item).__name__, "location": location,
+                        "bytes": {kind: size for kind, size in usage.items() if size}, "total": total})
+    entries.sort(key=lambda entry: entry["total"], reverse=True)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total_bytes": sum(totals.values()),
+        "totals": totals,
+        "by_location": by_location,
+        "item_count": len(entries),
+        "shared_pixel_buffers": len(SharedPixelBuffer.registry),
+        "image_budget_bytes": window.image_residency.budget_bytes,
+        "undo_commands": window.undo_stack.count(),
+        "document_primitives": len(window.document),
+        "document_bytes": window.document.estimated_bytes(),
+        "pen_styles": len(STYLES.pens),
+        "brush_styles": len(STYLES.brushes),
+        "items": entries,
+    }
+
+
+def _format_mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+class MemoryDiagnosticsDock(QDockWidget):
+    # Estimated memory per item and per buffer kind, refreshed live while visible
+    def __init__(self, window):
+        super().__init__("Memory", window)
+        self.canvas_window = window
+        self.last_report = None
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Item", "Where", "Total", "Largest buffer"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.live_checkbox = QCheckBox("Live")
+        self.live_checkbox.setChecked(True)
+        self.live_checkbox.toggled.connect(self._update_timer)
+        buttons.addWidget(self.live_checkbox)
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+        buttons.addWidget(refresh_button)
+        export_button = QPushButton("Export JSON...")
+        export_button.clicked.connect(self.export_json)
+        buttons.addWidget(export_button)
+        layout.addLayout(buttons)
+        self.setWidget(container)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(MEMORY_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self._update_timer)
+
+    def _update_timer(self, *_):
+        # Only spend time on estimates while someone is looking
+        if self.isVisible() and self.live_checkbox.isChecked():
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        report = collect_memory_report(self.canvas_window)
+        self.last_report = report
+        totals = ", ".join(f"{kind} {_format_mb(size)}" for kind, size in report["totals"].items() if size)
+        self.summary_label.setText(
+            f"Total {_format_mb(report['total_bytes'])} in {report['item_count']} items "
+            f"(scene {_format_mb(report['by_location']['scene'])}, undo history {_format_mb(report['by_location']['undo_history'])}); "
+            f"image budget {_format_mb(report['image_budget_bytes'])}, {report['shared_pixel_buffers']} shared pixel buffers; "
+            f"{report['document_primitives']} document primitives in {_format_mb(report['document_bytes'])}.\n"
+            f"{totals or 'No buffers'}")
+        top = report["items"][:MEMORY_TOP_OFFENDERS]
+        self.table.setRowCount(len(top))
+        for row, entry in enumerate(top):
+            largest = max(entry["bytes"].items(), key=lambda kind_size: kind_size[1], default=None)
+            values = [entry["item"], entry["location"].replace("_", " "), _format_mb(entry["total"]),
+                      f"{largest[0]} {_format_mb(largest[1])}" if largest else ""]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+
+    def export_json(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Memory Report", "memory_report.json", "JSON (*.json)")
+        if not file_path:
+            return
+        try:
+            with open(file_path, "w", encoding="utf-8") as report_file:
+                json.dump(collect_memory_report(self.canvas_window), report_file, indent=2)
+            log_diagnostics.info("Memory report exported to %s", file_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Export Error", f"Could not write memory report: {e}")
+
+
+# --- Navigator ---
+class NavigatorWidget(QWidget):
+    # Low-resolution overview of the whole scene with the main view's visible area on top. The overview is
+    # cached in an image and only the tiles under QGraphicsScene.changed regions are re-rendered, a few at a
+    # time from a timer, so editing a big board never waits for a full scene render. Click or drag to pan.
+    def __init__(self, view, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.scene = view.scene()
+        self.world = QRectF() # Scene area shown in the overview
+        self.scale = 1.0 # Overview pixels per scene unit
+        self.offset = QPointF() # Overview position inside the widget
+        self.image = QImage()
+        self.dirty_tiles = set() # (column, row) of overview tiles to re-render
+        self.tracking = False
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.timeout.connect(self.render_dirty_tiles)
+        self.setMinimumSize(160, 120)
+        self.setCursor(Qt.CursorShape.PointingHandCursor)
+        for scrollbar in (view.horizontalScrollBar(), view.verticalScrollBar()):
+            scrollbar.valueChanged.connect(self.update) # Viewport rectangle follows scrolling and zooming
+            scrollbar.rangeChanged.connect(self.update)
+
+    def set_tracking(self, enabled):
+        # Scene changes are only followed while the navigator is visible; showing it again rebuilds the overview
+        if enabled == self.tracking:
+            return
+        self.tracking = enabled
+        if enabled:
+            self.scene.changed.connect(self.on_scene_changed)
+            self.scene.sceneRectChanged.connect(self.invalidate)
+            self.invalidate()
+        else:
+            self.scene.changed.disconnect(self.on_scene_changed)
+            self.scene.sceneRectChanged.disconnect(self.invalidate)
+            self.render_timer.stop()
+
+    def invalidate(self, *_):
+        self.image = QImage() # Rebuilt, with a new layout, on the next pass
+        self._schedule(0)
+
+    def on_scene_changed(self, regions):
+        if self.image.isNull():
+            return
+        image_rect = QRectF(self.image.rect())
+        for region in regions:
+            target = QRectF((region.left() - self.world.left()) * self.scale, (region.top() - self.world.top()) * self.scale,
+                            region.width() * self.scale, region.height() * self.scale).intersected(image_rect)
+            if target.isEmpty():
+                continue
+            for column in range(int(target.left() // NAVIGATOR_TILE), int(target.right() // NAVIGATOR_TILE) + 1):
+                for row in range(int(target.top() // NAVIGATOR_TILE), int(target.bottom() // NAVIGATOR_TILE) + 1):
+                    self.dirty_tiles.add((column, row))
+        if self.dirty_tiles:
+            self._schedule(NAVIGATOR_UPDATE_MS)
+
+    def _schedule(self, delay):
+        if not self.render_timer.isActive(): # Not restarted, so continuous changes still refresh every NAVIGATOR_UPDATE_MS
+            self.render_timer.start(delay)
+
+    def _layout(self):
+        # Fits the scene rect into the widget and allocates the overview image; every tile starts dirty
+        self.world = self.scene.sceneRect()
+        available_width, available_height = self.width() - 2 * NAVIGATOR_MARGIN, self.height() - 2 * NAVIGATOR_MARGIN
+        if self.world.isEmpty() or available_width <= 0 or available_height <= 0:
+            self.image = QImage()
+            return
+        self.scale = min(available_width / self.world.width(), available_height / self.world.height())
+        width, height = max(1, math.ceil(self.world.width() * self.scale)), max(1, math.ceil(self.world.height() * self.scale))
+        self.offset = QPointF((self.width() - width) / 2, (self.height() - height) / 2)
+        self.image = QImage(width, height, QImage.Format.Format_ARGB32_Premultiplied)
+        self.image.fill(self.scene.backgroundBrush().color())
+        self.dirty_tiles = {(column, row) for column in range(math.ceil(width / NAVIGATOR_TILE))
+                            for row in range(math.ceil(height / NAVIGATOR_TILE))}
+
+    @traced("navigator_render")
+    def render_dirty_tiles(self):
+        if self.image.isNull():
+            self._layout()
+            if self.image.isNull():
+                self.update()
+                return
+        deadline = time.perf_counter() + NAVIGATOR_BUDGET_MS / 1000
+        image_rect = QRectF(self.image.rect())
+        painter = QPainter(self.image)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform) # Minified images would alias badly otherwise
+        TiledImageItem.passive_render = True # The overview must not keep images resident or decode evicted ones
+        try:
+            while self.dirty_tiles and time.perf_counter() < deadline:
+                column, row = self.dirty_tiles.pop()
+                target = QRectF(column * NAVIGATOR_TILE, row * NAVIGATOR_TILE, NAVIGATOR_TILE, NAVIGATOR_TILE).intersected(image_rect)
+                source = QRectF(self.world.left() + target.left() / self.scale, self.world.top() + target.top() / self.scale,
+                                target.width() / self.scale, target.height() / self.scale)
+                painter.save()
+                painter.setClipRect(target)
+                self.scene.render(painter, target, source, Qt.AspectRatioMode.IgnoreAspectRatio) # Background included
+                painter.restore()
+        finally:
+            TiledImageItem.passive_render = False
+            painter.end()
+        self.update()
+        if self.dirty_tiles:
+            self._schedule(0) # Let input through, then carry on
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.tracking:
+            self.invalidate()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().window())
+        if self.image.isNull():
+            return
+        painter.drawImage(self.offset, self.image)
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        frame = QRectF(self._to_widget(visible.topLeft()), self._to_widget(visible.bottomRight()))
+        painter.setPen(QPen(QColor(255, 120, 0), 1.5))
+        painter.setBrush(QColor(255, 120, 0, 40))
+        painter.drawRect(frame.intersected(QRectF(self.rect()).adjusted(0.75, 0.75, -0.75, -0.75)))
+
+    def _to_widget(self, scene_point):
+        return QPointF(self.offset.x() + (scene_point.x() - self.world.left()) * self.scale,
+                       self.offset.y() + (scene_point.y() - self.world.top()) * self.scale)
+
+    def _to_scene(self, widget_point):
+        return QPointF(self.world.left() + (widget_point.x() - self.offset.x()) / self.scale,
+                       self.world.top() + (widget_point.y() - self.offset.y()) / self.scale)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._pan_to(event.position())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.MouseButton.LeftButton:
+            self._pan_to(event.position())
+
+    def _pan_to(self, widget_point):
+        if self.image.isNull():
+            return
+        self.view.begin_interaction()
+        self.view.centerOn(self._to_scene(widget_point))
+
+
+class NavigatorDock(QDockWidget):
+    def __init__(self, window):
+        super().__init__("Navigator", window)
+        self.navigator = NavigatorWidget(window.view)
+        self.setWidget(self.navigator)
+        self.visibilityChanged.connect(self.navigator.set_tracking)
+
+
+# --- Snapping ---
+class SnapIndex(QObject):
+    # Edges and centers of the top-level scene items and document primitives, kept in one sorted anchor list per
+    # axis, so a snap bisects to the few anchors within reach instead of looking at every item. Anchors at the same
+    # coordinate (a column of aligned shapes) are sorted by the box's center across the axis, so only the on-screen
+    # part of such a run is looked at. The lists follow QGraphicsScene.changed and DocumentModel.changed lazily:
+    # changed areas are queued and re-read when a snap needs them, with sorted inserts for a few changes and one
+    # re-sort after bulk ones.
+    def __init__(self, view, virtualizer, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.scene = view.scene()
+        self.virtualizer = virtualizer
+        self.model = virtualizer.model
+        self.boxes = {} # key -> (left, top, right, bottom); keys are document rows or scene items
+        # Per axis: anchor coordinates, the box centers across the axis, and (key, anchor) with 0 = min, 1 = center,
+        # 2 = max; ordered by (coordinate, cross center)
+        self.axes = (([], [], []), ([], [], []))
+        self.max_span = 0.0 # Largest box width or height indexed so far; bounds the cross-center search
+        self.scene_regions = [] # Changed areas not re-read yet
+        self.model_regions = []
+        self.held = set() # Keys skipped while they were being dragged; re-read with the next changes
+        self.scene.changed.connect(self._on_scene_changed)
+        self.model.changed.connect(self._on_model_changed)
+
+    def shutdown(self):
+        self.scene.changed.disconnect(self._on_scene_changed)
+        self.model.changed.disconnect(self._on_model_changed)
+        self.boxes.clear() # Keys include item wrappers
+        self.axes = (([], [], []), ([], [], []))
+        self.held.clear()
+
+    def _on_scene_changed(self, regions):
+        self.scene_regions = self._queue(self.scene_regions, regions)
+
+    def _on_model_changed(self, rect):
+        self.model_regions = self._queue(self.model_regions, [rect])
+
+    @staticmethod
+    def _queue(queued, regions):
+        queued.extend(regions)
+        if len(queued) > SNAP_MAX_PENDING_REGIONS:
+            return [functools.reduce(QRectF.united, queued)]
+        return queued
+
+    def key_of(self, item):
+        # Materialized primitives share their row's key, so a primitive is indexed once either way
+        row = getattr(item, "document_row", None)
+        return item if row is None else row
+
+    def _indexable(self, item):
+        return (item.parentItem() is None and item is not self.virtualizer.layer
+                and bool(item.flags() & QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)) # Not handles or previews
+
+    def _box(self, key):
+        # Current box of key, or None once it is gone
+        if isinstance(key, int):
+            item = self.virtualizer.live.get(key)
+            if item is None:
+                return self.model.row_box(key) if self.model.alive[key] else None
+        else:
+            item = key
+        if item.scene() is not self.scene:
+            return None
+        rect = item.sceneBoundingRect()
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+    @traced("snap_index_update")
+    def flush(self, hold=()):
+        # Re-reads queued areas; keys in hold (the items being dragged) are left as they are until a later flush
+        if not (self.scene_regions or self.model_regions):
+            return
+        keys = set(self.held)
+        for rect in self.scene_regions:
+            keys.update(self._keys_in(rect)) # Indexed there: may have moved or gone
+            keys.update(self.key_of(item) for item in self.scene.items(rect) if self._indexable(item))
+        for rect in self.model_regions:
+            keys.update(self._keys_in(rect))
+            keys.update(self.model.query(rect))
+        self.scene_regions, self.model_regions = [], []
+        self.held = keys & set(hold)
+        changes = []
+        for key in keys - self.held:
+            box = self._box(key)
+            if self.boxes.get(key) != box:
+                changes.append((key, box))
+        if len(changes) > max(256, len(self.boxes) // 16):
+            for key, box in changes:
+                if box is None:
+                    self.boxes.pop(key, None)
+                else:
+                    self.boxes[key] = box
+            self._rebuild()
+            return
+        for key, box in changes:
+            old = self.boxes.pop(key, None)
+            if old is not None:
+                self._remove_anchors(key, old)
+            if box is not None:
+                self.boxes[key] = box
+                self._insert_anchors(key, box)
+
+    def _keys_in(self, rect):
+        # Keys with an x anchor inside rect and a box overlapping it
+        values, crosses, keys = self.axes[0]
+        boxes = self.boxes
+        left, top, right, bottom = rect.left(), rect.top(), rect.right(), rect.bottom()
+        found = set()
+        for _, start, end in self._runs(values, bisect_left(values, left), 1):
+            if values[start] > right:
+                break
+            for index in range(bisect_left(crosses, top - self.max_span / 2, start, end), end):
+                if crosses[index] > bottom + self.max_span / 2:
+                    break
+                key = keys[index][0]
+                box = boxes[key]
+                if box[1] <= bottom and box[3] >= top:
+                    found.add(key)
+        return found
+
+    def _rebuild(self):
+        keys, boxes = list(self.boxes), list(self.boxes.values())
+        count = len(keys)
+        axes = []
+        for axis in (0, 1):
+            lows, highs = [box[axis] for box in boxes], [box[axis + 2] for box in boxes]
+            values = lows + [(low + high) / 2 for low, high in zip(lows, highs)] + highs # Anchor i is key i % count
+            crosses = [(box[1 - axis] + box[3 - axis]) / 2 for box in boxes] * 3
+            order = sorted(range(len(values)), key=crosses.__getitem__)
+            order.sort(key=values.__getitem__) # Stable: by coordinate, then cross center
+            axes.append(([values[index] for index in order], [crosses[index] for index in order],
+                         [(keys[index % count], index // count) for index in order]))
+            if boxes:
+                self.max_span = max(self.max_span, max(high - low for low, high in zip(lows, highs)))
+        self.axes = tuple(axes)
+
+    def _anchors(self, box):
+        # Per axis: (anchor coordinates, cross center)
+        left, top, right, bottom = box
+        middle_x, middle_y = (left + right) / 2, (top + bottom) / 2
+        return ((left, middle_x, right), middle_y), ((top, middle_y, bottom), middle_x)
+
+    def _insert_anchors(self, key, box):
+        self.max_span = max(self.max_span, box[2] - box[0], box[3] - box[1])
+        for (values, crosses, keys), (anchors, cross) in zip(self.axes, self._anchors(box)):
+            for anchor, value in enumerate(anchors):
+                index = bisect_right(crosses, cross, bisect_left(values, value), bisect_right(values, value))
+                values.insert(index, value)
+                crosses.insert(index, cross)
+                keys.insert(index, (key, anchor))
+
+    def _remove_anchors(self, key, box):
+        for (values, crosses, keys), (anchors, cross) in zip(self.axes, self._anchors(box)):
+            for anchor, value in enumerate(anchors):
+                start, end = bisect_left(values, value), bisect_right(values, value)
+                for index in range(bisect_left(crosses, cross, start, end), bisect_right(crosses, cross, start, end)):
+                    if keys[index] == (key, anchor):
+                        del values[index]
+                        del crosses[index]
+                        del keys[index]
+                        break
+
+    @staticmethod
+    def _runs(values, index, direction):
+        # Runs of equal coordinates from index outwards (direction 1 up, -1 down): (value, start, end)
+        if direction > 0:
+            while index < len(values):
+                end = bisect_right(values, values[index], index)
+                yield values[index], index, end
+                index = end
+        else:
+            while index > 0:
+                start = bisect_left(values, values[index - 1], 0, index)
+                yield values[index - 1], start, index
+                index = start
+
+    def _usable(self, key, visible):
+        # Still there, and on screen: guides to something out of sight would only confuse
+        if isinstance(key, int):
+            item = self.virtualizer.live.get(key)
+            if not (self.model.alive[key] if item is None else item.scene() is self.scene):
+                return False
+        elif key.scene() is not self.scene:
+            return False
+        box = self.boxes[key]
+        return box[0] <= visible[2] and box[2] >= visible[0] and box[1] <= visible[3] and box[3] >= visible[1]
+
+    @traced("snap")
+    def snap(self, box, items, tolerance, visible, objects=True, grid=0.0, spacing=True):
+        # Offset (dx, dy) that puts an edge or the center of box (left, top, right, bottom) onto another item's edge
+        # or center, into an equal gap between two neighbours, or onto the grid (grid spacing, 0 for none), each
+        # within tolerance scene units; plus the guide lines (QLineF, scene coordinates) showing what it snapped to.
+        # items are the ones being moved: they don't snap to themselves.
+        exclude = {self.key_of(item) for item in items}
+        self.flush(hold=exclude)
+        matches = [self._snap_axis(axis, box, exclude, tolerance, visible, objects, grid, spacing) for axis in (0, 1)]
+        offsets = [match[1] if match else 0.0 for match in matches]
+        moved = (box[0] + offsets[0], box[1] + offsets[1], box[2] + offsets[0], box[3] + offsets[1])
+        guides = []
+        for axis, match in enumerate(matches):
+            if match is None or match[2] is None:
+                continue # Nothing or the grid: the grid shows itself
+            if match[2] == "gap":
+                before, after = match[3], match[4]
+                middle = (moved[1 - axis] + moved[3 - axis]) / 2
+                guides.append(self._line(1 - axis, middle, before[axis + 2], moved[axis]))
+                guides.append(self._line(1 - axis, middle, moved[axis + 2], after[axis]))
+            else:
+                at, other = match[2], self.boxes[match[3]]
+                guides.append(self._line(axis, at, min(moved[1 - axis], other[1 - axis]), max(moved[3 - axis], other[3 - axis])))
+        return offsets[0], offsets[1], guides
+
+    @staticmethod
+    def _line(axis, at, start, end):
+        # Guide across axis at coordinate at: vertical for x (axis 0), horizontal for y
+        return QLineF(at, start, at, end) if axis == 0 else QLineF(start, at, end, at)
+
+    def _snap_axis(self, axis, box, exclude, tolerance, visible, objects, grid, spacing):
+        # Best match along one axis: (distance, offset, guide coordinate, key), (distance, offset, "gap", before,
+        # after) or (distance, offset, None) for the grid
+        low, high = box[axis], box[axis + 2]
+        best = None
+        if objects:
+            middle = (box[1 - axis] + box[3 - axis]) / 2
+            for anchor in ((low, (low + high) / 2, high) if high > low else (low,)):
+                found = self._nearest(axis, anchor, middle, tolerance, exclude, visible)
+                if found is not None and (best is None or abs(found[0] - anchor) < best[0]):
+                    best = (abs(found[0] - anchor), found[0] - anchor, found[0], found[1])
+            if spacing and high > low:
+                before = self._neighbour(axis, low + tolerance, -1, box, exclude, visible)
+                after = self._neighbour(axis, high - tolerance, 1, box, exclude, visible) if before else None
+                if after is not None:
+                    gap = (after[axis] - before[axis + 2] - (high - low)) / 2
+                    offset = before[axis + 2] + gap - low
+                    if gap >= 0 and abs(offset) <= tolerance and (best is None or abs(offset) < best[0]):
+                        best = (abs(offset), offset, "gap", before, after)
+        if grid:
+            for anchor in (low, high):
+                offset = round(anchor / grid) * grid - anchor
+                if abs(offset) <= tolerance and (best is None or abs(offset) < best[0]):
+                    best = (abs(offset), offset, None)
+        return best
+
+    def _nearest(self, axis, value, middle, tolerance, exclude, visible):
+        # Closest usable anchor within tolerance of value, and of those the one nearest to middle across the axis
+        # (short guides): (coordinate, key), or None
+        values, crosses, keys = self.axes[axis]
+        cross_low, cross_high = visible[1 - axis] - self.max_span / 2, visible[3 - axis] + self.max_span / 2
+        start = bisect_left(values, value)
+        up, down = self._runs(values, start, 1), self._runs(values, start, -1)
+        above, below = next(up, None), next(down, None)
+        budget = SNAP_SCAN_LIMIT
+        while budget > 0:
+            if above is not None and (below is None or above[0] - value <= value - below[0]):
+                run, above = above, next(up, None)
+            elif below is not None:
+                run, below = below, next(down, None)
+            else:
+                return None
+            at, start, end = run
+            if abs(at - value) > tolerance:
+                return None
+            first, last = bisect_left(crosses, cross_low, start, end), bisect_right(crosses, cross_high, start, end)
+            after = bisect_left(crosses, middle, first, last)
+            before = after - 1
+            while budget > 0 and (before >= first or after < last):
+                if after < last and (before < first or crosses[after] - middle <= middle - crosses[before]):
+                    index, after = after, after + 1
+                else:
+                    index, before = before, before - 1
+                budget -= 1
+                key = keys[index][0]
+                if key not in exclude and self._usable(key, visible):
+                    return at, key
+            budget -= 1
+        return None
+
+    def _neighbour(self, axis, edge, direction, box, exclude, visible):
+        # Box of the closest usable item wholly before (direction -1) or after (1) edge along axis that overlaps
+        # box across it, or None
+        values, crosses, keys = self.axes[axis]
+        cross_low, cross_high = box[1 - axis], box[3 - axis]
+        wanted = 2 if direction < 0 else 0 # Their max anchors before the edge, min anchors after it
+        budget = SNAP_SCAN_LIMIT
+        start = bisect_right(values, edge) if direction < 0 else bisect_left(values, edge)
+        for _, start, end in self._runs(values, start, direction):
+            for index in range(bisect_left(crosses, cross_low - self.max_span / 2, start, end), end):
+                if crosses[index] > cross_high + self.max_span / 2 or budget <= 0:
+                    break
+                budget -= 1
+                key, anchor = keys[index]
+                if anchor == wanted and key not in exclude:
+                    other = self.boxes[key]
+                    if other[1 - axis] <= cross_high and other[3 - axis] >= cross_low and self._usable(key, visible):
+                        return other
+            budget -= 1
+            if budget <= 0:
+                return None
+        return None
+
+
+# --- Style Registry ---
+class StyleRegistry:
+    # Interns pen and brush definitions. Items that look alike share one QPen/QBrush (Qt shares their data
+    # implicitly) and keep the style ids as item.pen_style / item.brush_style. restyle_pen()/restyle_brush()
+    # redefine a style and update every item using it in one pass. Users are tracked weakly, so a style never
+    # keeps an item alive. A style's color is either a fixed rgba or a theme role (a theme key such as
+    # "item_default_fill"); role styles are re-resolved together by set_theme(). Items whose theme colors
+    # aren't a pen or brush (tables, default-colored text) register with follow_theme() instead.
+    def __init__(self, theme):
+        self.theme = theme
+        self.pens = [] # id -> QPen
+        self.pen_keys = [] # id -> (rgba or role, width, style, cap, join)
+        self.pen_ids = {} # definition -> id
+        self.brushes = [] # id -> QBrush
+        self.brush_keys = [] # id -> (rgba or role, style)
+        self.brush_ids = {}
+        self.pen_users = {} # id -> WeakSet of items
+        self.brush_users = {}
+        self.theme_users = weakref.WeakSet() # Items with an apply_theme(theme) method
+
+    def pen_id(self, color, width=1.0, style=Qt.PenStyle.SolidLine, cap=Qt.PenCapStyle.SquareCap, join=Qt.PenJoinStyle.BevelJoin):
+        key = (QColor(color).rgba(), float(width), style, cap, join)
+        style_id = self.pen_ids.get(key)
+        if style_id is None:
+            style_id = self.pen_ids[key] = len(self.pens)
+            self.pens.append(self._make_pen(key))
+            self.pen_keys.append(key)
+        return style_id
+
+    def brush_id(self, color=None, style=Qt.BrushStyle.SolidPattern):
+        # color None: no fill
+        return self._brush_key_id((0, Qt.BrushStyle.NoBrush) if color is None else (QColor(color).rgba(), style))
+
+    def role_pen_id(self, role, width=1.0, style=Qt.PenStyle.SolidLine, cap=Qt.PenCapStyle.SquareCap, join=Qt.PenJoinStyle.BevelJoin):
+        # Pen whose color follows the theme's role color
+        key = (role, float(width), style, cap, join)
+        style_id = self.pen_ids.get(key)
+        if style_id is None:
+            style_id = self.pen_ids[key] = len(self.pens)
+            self.pens.append(self._make_pen(key))
+            self.pen_keys.append(key)
+        return style_id
+
+    def role_brush_id(self, role, style=Qt.BrushStyle.SolidPattern):
+        return self._brush_key_id((role, style))
+
+    def pen_id_for(self, value, width=1.0):
+        # value as stored by DocumentModel: an rgba int or a role name
+        if isinstance(value, str):
+            return self.role_pen_id(value, width)
+        return self.pen_id(QColor.fromRgba(value), width)
+
+    def brush_id_for(self, value):
+        # value 0: no fill
+        if isinstance(value, str):
+            return self.role_brush_id(value)
+        return self.brush_id(QColor.fromRgba(value) if value else None)
+
+    def pen_value(self, item):
+        # The item's outline as an rgba int or role name, the inverse of pen_id_for()
+        style_id = getattr(item, 'pen_style', None)
+        return self.pen_keys[style_id][0] if style_id is not None else item.pen().color().rgba()
+
+    def brush_value(self, item):
+        style_id = getattr(item, 'brush_style', None)
+        if style_id is not None:
+            return self.brush_keys[style_id][0]
+        brush = item.brush()
+        return brush.color().rgba() if brush.style() != Qt.BrushStyle.NoBrush else 0
+
+    def pen_id_like(self, pen, color=None, width=None):
+        # Id of pen with its color and/or width replaced
+        return self.pen_id(pen.color() if color is None else color, pen.widthF() if width is None else width,
+                           pen.style(), pen.capStyle(), pen.joinStyle())
+
+    def pen(self, style_id):
+        return self.pens[style_id]
+
+    def brush(self, style_id):
+        return self.brushes[style_id]
+
+    def set_pen(self, item, style_id):
+        if getattr(item, 'pen_style', None) == style_id:
+            return
+        self._track(self.pen_users, item, getattr(item, 'pen_style', None), style_id)
+        item.pen_style = style_id
+        item.setPen(self.pens[style_id])
+
+    def set_brush(self, item, style_id):
+        if getattr(item, 'brush_style', None) == style_id:
+            return
+        self._track(self.brush_users, item, getattr(item, 'brush_style', None), style_id)
+        item.brush_style = style_id
+        item.setBrush(self.brushes[style_id])
+
+    def follow_theme(self, item):
+        self.theme_users.add(item)
+        item.apply_theme(self.theme)
+
+    def unfollow_theme(self, item):
+        self.theme_users.discard(item)
+
+    def restyle_pen(self, style_id, color=None, width=None):
+        # Redefines the style in place (its id stays valid) and updates every item using it
+        value, old_width, style, cap, join = old_key = self.pen_keys[style_id]
+        key = (value if color is None else QColor(color).rgba(), old_width if width is None else float(width), style, cap, join)
+        self._rekey(self.pen_ids, old_key, key, style_id)
+        self.pen_keys[style_id] = key
+        pen = self.pens[style_id] = self._make_pen(key)
+        for item in self._live_users(self.pen_users, style_id):
+            item.setPen(pen)
+
+    def restyle_brush(self, style_id, color):
+        old_key = self.brush_keys[style_id]
+        key = (0, Qt.BrushStyle.NoBrush) if color is None else (QColor(color).rgba(), old_key[1] if old_key[0] else Qt.BrushStyle.SolidPattern)
+        self._rekey(self.brush_ids, old_key, key, style_id)
+        self.brush_keys[style_id] = key
+        brush = self.brushes[style_id] = self._make_brush(key)
+        for item in self._live_users(self.brush_users, style_id):
+            item.setBrush(brush)
+
+    def set_theme(self, theme):
+        # Re-resolves every role style against the new theme: one QPen/QBrush rebuild per style, then one
+        # setPen/setBrush per item using it. Returns how many items were updated.
+        self.theme = theme
+        updated = 0
+        for style_id, key in enumerate(self.pen_keys):
+            if isinstance(key[0], str):
+                pen = self.pens[style_id] = self._make_pen(key)
+                for item in self._live_users(self.pen_users, style_id):
+                    item.setPen(pen)
+                    updated += 1
+        for style_id, key in enumerate(self.brush_keys):
+            if isinstance(key[0], str):
+                brush = self.brushes[style_id] = self._make_brush(key)
+                for item in self._live_users(self.brush_users, style_id):
+                    item.setBrush(brush)
+                    updated += 1
+        for item in list(self.theme_users):
+            if isValid(item):
+                item.apply_theme(theme)
+                updated += 1
+            else:
+                self.theme_users.discard(item)
+        return updated
+
+    def _brush_key_id(self, key):
+        style_id = self.brush_ids.get(key)
+        if style_id is None:
+            style_id = self.brush_ids[key] = len(self.brushes)
+            self.brushes.append(self._make_brush(key))
+            self.brush_keys.append(key)
+        return style_id
+
+    def _color(self, value):
+        return QColor(self.theme[value]) if isinstance(value, str) else QColor.fromRgba(value)
+
+    def _make_pen(self, key):
+        value, width, style, cap, join = key
+        return QPen(QBrush(self._color(value)), width, style, cap, join)
+
+    def _make_brush(self, key):
+        value, style = key
+        return QBrush(self._color(value), style) if style != Qt.BrushStyle.NoBrush else QBrush()
+
+    @staticmethod
+    def _rekey(ids, old_key, key, style_id):
+        if ids.get(old_key) == style_id:
+            del ids[old_key]
+        ids.setdefault(key, style_id) # An existing style with that definition keeps its own id
+
+    @staticmethod
+    def _live_users(users, style_id):
+        # Items using the style; ones whose C++ item is gone are dropped on the way
+        item_set = users.get(style_id, ())
+        items = []
+        for item in list(item_set):
+            if isValid(item):
+                items.append(item)
+            else:
+                item_set.discard(item)
+        return items
+
+    @staticmethod
+    def _track(users, item, old_id, new_id):
+        if old_id is not None and old_id in users:
+            users[old_id].discard(item)
+        item_set = users.get(new_id)
+        if item_set is None:
+            item_set = users[new_id] = weakref.WeakSet()
+        item_set.add(item)
+
+
+STYLES = StyleRegistry(LIGHT_THEME)
+
+
+# --- Document Model ---
+class DocumentModel(QObject):
+    # Geometry and style of simple shapes (rectangles, ellipses, triangles, lines) kept in flat typed-array
+    # columns with a uniform-grid spatial index, about 75 bytes per primitive including its index entries instead of
+    # a QGraphicsItem and its Python wrapper. Rows are never reused: removed rows are tombstoned.
+    changed = Signal(QRectF) # Scene area whose content changed
+
+    def __init__(self, cell_size=DOCUMENT_GRID_CELL, parent=None):
+        super().__init__(parent)
+        self.cell_size = cell_size
+        self.kind = array("b") # Index into PRIMITIVE_KINDS
+        self.x = array("d") # Local geometry: the shape's rect, or a line's start point and delta
+        self.y = array("d")
+        self.w = array("d")
+        self.h = array("d")
+        self.pos_x = array("d")
+        self.pos_y = array("d")
+        self.rotation = array("d")
+        self.z = array("d")
+        self.style = array("i") # Index into styles
+        self.alive = bytearray()
+        self.styles = [] # (fill, outline, pen width), interned; colors are rgba ints or theme role names
+        self.style_ids = {}
+        self.grid = {} # (cell x, cell y) -> array of rows overlapping the cell
+        self.count = 0
+        self.extent = None # (left, top, right, bottom) of everything ever added
+        self.max_span = 0.0 # Largest width or height of any primitive's box
+        self._bulk_depth = 0
+        self._dirty = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def bounds(self):
+        if self.extent is None:
+            return QRectF()
+        left, top, right, bottom = self.extent
+        return QRectF(left, top, right - left, bottom - top)
+
+    def style_id(self, fill, outline, pen_width):
+        key = (fill, outline, pen_width)
+        style = self.style_ids.get(key)
+        if style is None:
+            style = self.style_ids[key] = len(self.styles)
+            self.styles.append(key)
+        return style
+
+    def add(self, kind, x, y, w, h, fill=None, outline=None, pen_width=1.0, z=0.0):
+        # kind is one of PRIMITIVE_KINDS; fill and outline are QColors or theme role names (no fill when None)
+        row = len(self.kind)
+        self.kind.append(PRIMITIVE_KINDS.index(kind))
+        self.x.append(x)
+        self.y.append(y)
+        self.w.append(w)
+        self.h.append(h)
+        self.pos_x.append(0.0)
+        self.pos_y.append(0.0)
+        self.rotation.append(0.0)
+        self.z.append(z)
+        self.style.append(self.style_id(self._color_value(fill, 0), self._color_value(outline, 0xff000000), float(pen_width)))
+        self.alive.append(1)
+        self.count += 1
+        half = pen_width / 2 # Unrotated at the origin, so the box is quick to get
+        self._index(row, (min(x, x + w) - half, min(y, y + h) - half, max(x, x + w) + half, max(y, y + h) + half))
+        return row
+
+    def remove(self, row):
+        if not self.alive[row]:
+            return
+        box = self.row_box(row)
+        self._unindex(row, box)
+        self.alive[row] = 0
+        self.count -= 1
+        self._changed(box)
+
+    def update(self, row, x, y, w, h, pos_x, pos_y, rotation, z, fill, outline, pen_width):
+        # fill and outline as stored: rgba ints or role names
+        values = (x, y, w, h, pos_x, pos_y, rotation, z)
+        columns = (self.x, self.y, self.w, self.h, self.pos_x, self.pos_y, self.rotation, self.z)
+        style = self.style_id(fill, outline, pen_width)
+        if style == self.style[row] and all(column[row] == value for column, value in zip(columns, values)):
+            return # Unchanged; keeps the index untouched
+        old_box = self.row_box(row)
+        self._unindex(row, old_box)
+        for column, value in zip(columns, values):
+            column[row] = value
+        self.style[row] = style
+        self._changed(old_box)
+        self._index(row, self.row_box(row))
+
+    def row_box(self, row):
+        # Scene-space (left, top, right, bottom), including half the pen width
+        x, y, w, h = self.x[row], self.y[row], self.w[row], self.h[row]
+        left, right = (x, x + w) if w >= 0 else (x + w, x)
+        top, bottom = (y, y + h) if h >= 0 else (y + h, y)
+        half = self.styles[self.style[row]][2] / 2
+        left, top, right, bottom = left - half, top - half, right + half, bottom + half
+        rotation = self.rotation[row]
+        if rotation: # Items rotate around their origin, before the position offset
+            rotated = QTransform().rotate(rotation).mapRect(QRectF(left, top, right - left, bottom - top))
+            left, top, right, bottom = rotated.left(), rotated.top(), rotated.right(), rotated.bottom()
+        pos_x, pos_y = self.pos_x[row], self.pos_y[row]
+        return left + pos_x, top + pos_y, right + pos_x, bottom + pos_y
+
+    def query(self, rect):
+        # Rows whose grid cells overlap rect; may include a few just outside it
+        rows = set()
+        grid = self.grid
+        for cell in self.cells_in(rect):
+            rows.update(grid[cell])
+        return rows
+
+    def cells_in(self, rect):
+        # Non-empty grid cells overlapping rect
+        grid = self.grid
+        size = self.cell_size
+        first_column, last_column = math.floor(rect.left() / size), math.floor(rect.right() / size)
+        first_row, last_row = math.floor(rect.top() / size), math.floor(rect.bottom() / size)
+        if (last_column - first_column + 1) * (last_row - first_row + 1) > len(grid):
+            # Zoomed far out: walk the cells that exist rather than every cell the rect covers
+            return [cell for cell in grid if first_column <= cell[0] <= last_column and first_row <= cell[1] <= last_row]
+        return [(column, row) for column in range(first_column, last_column + 1) for row in range(first_row, last_row + 1)
+                if (column, row) in grid]
+
+    def hit_test(self, point, tolerance=0.0):
+        # Topmost row whose shape contains point, within tolerance scene units; None if there is none
+        x, y = point.x(), point.y()
+        best = None
+        for row in self.query(QRectF(x - tolerance, y - tolerance, 2 * tolerance, 2 * tolerance)):
+            left, top, right, bottom = self.row_box(row)
+            if not (left - tolerance <= x <= right + tolerance and top - tolerance <= y <= bottom + tolerance):
+                continue
+            if self._contains(row, x, y, tolerance) and (best is None or (self.z[row], row) > (self.z[best], best)):
+                best = row
+        return best
+
+    def _contains(self, row, px, py, tolerance):
+        px, py = px - self.pos_x[row], py - self.pos_y[row] # To item coordinates
+        if self.rotation[row]:
+            local = QTransform().rotate(-self.rotation[row]).map(QPointF(px, py))
+            px, py = local.x(), local.y()
+        x, y, w, h = self.x[row], self.y[row], self.w[row], self.h[row]
+        reach = self.styles[self.style[row]][2] / 2 + tolerance
+        kind = self.kind[row]
+        if kind == PRIMITIVE_LINE:
+            length_sq = w * w + h * h
+            t = max(0.0, min(1.0, ((px - x) * w + (py - y) * h) / length_sq)) if length_sq else 0.0
+            return math.hypot(px - (x + t * w), py - (y + t * h)) <= reach
+        left, right = min(x, x + w) - reach, max(x, x + w) + reach
+        top, bottom = min(y, y + h) - reach, max(y, y + h) + reach
+        if kind == PRIMITIVE_ELLIPSE:
+            radius_x, radius_y = (right - left) / 2, (bottom - top) / 2
+            if not (radius_x and radius_y):
+                return left <= px <= right and top <= py <= bottom # Degenerate: a point or a segment
+            return ((px - left - radius_x) / radius_x) ** 2 + ((py - top - radius_y) / radius_y) ** 2 <= 1.0
+        if kind == PRIMITIVE_TRIANGLE:
+            triangle = QPolygonF([QPointF(x + w / 2, y), QPointF(x, y + h), QPointF(x + w, y + h)])
+            return triangle.containsPoint(QPointF(px, py), Qt.FillRule.OddEvenFill)
+        return left <= px <= right and top <= py <= bottom
+
+    def estimated_bytes(self):
+        columns = (self.kind, self.x, self.y, self.w, self.h, self.pos_x, self.pos_y, self.rotation, self.z, self.style)
+        index = sum(cell_rows.itemsize * len(cell_rows) for cell_rows in self.grid.values())
+        return sum(column.itemsize * len(column) for column in columns) + len(self.alive) + index
+
+    @contextlib.contextmanager
+    def bulk_update(self):
+        # Coalesces the changed() signals of many adds/updates into one
+        self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            self._bulk_depth -= 1
+            if not self._bulk_depth and self._dirty is not None:
+                left, top, right, bottom = self._dirty
+                self._dirty = None
+                self.changed.emit(QRectF(left, top, right - left, bottom - top))
+
+    @staticmethod
+    def _color_value(color, default):
+        if color is None:
+            return default
+        return color if isinstance(color, str) else QColor(color).rgba() # Role names stay symbolic
+
+    def _cells(self, box):
+        size = self.cell_size
+        left, top, right, bottom = box
+        first_column, last_column = math.floor(left / size), math.floor(right / size)
+        first_row, last_row = math.floor(top / size), math.floor(bottom / size)
+        return [(column, row) for column in range(first_column, last_column + 1) for row in range(first_row, last_row + 1)]
+
+    def _index(self, row, box):
+        grid = self.grid
+        for cell in self._cells(box):
+            cell_rows = grid.get(cell)
+            if cell_rows is None:
+                cell_rows = grid[cell] = array("i")
+            cell_rows.append(row)
+        self.max_span = max(self.max_span, box[2] - box[0], box[3] - box[1])
+        if self.extent is None:
+            self.extent = box
+        else:
+            self.extent = (min(self.extent[0], box[0]), min(self.extent[1], box[1]),
+                           max(self.extent[2], box[2]), max(self.extent[3], box[3]))
+        self._changed(box)
+
+    def _unindex(self, row, box):
+        grid = self.grid
+        for cell in self._cells(box):
+            cell_rows = grid.get(cell)
+            if cell_rows is not None:
+                cell_rows.remove(row)
+                if not cell_rows:
+                    del grid[cell]
+
+    def _changed(self, box):
+        if self._bulk_depth:
+            dirty = self._dirty
+            self._dirty = box if dirty is None else (min(dirty[0], box[0]), min(dirty[1], box[1]),
+                                                     max(dirty[2], box[2]), max(dirty[3], box[3]))
+        else:
+            left, top, right, bottom = box
+            self.changed.emit(QRectF(left, top, right - left, bottom - top))
+
+
+class DocumentLayerItem(QGraphicsItem):
+    # Paints every document primitive that has no materialized item, in batches: each grid cell keeps its primitives
+    # grouped by (z, style, draw mode), and a paint merges the exposed cells' groups into one drawRects / drawLines /
+    # drawPath call per group. Within one z level, overlapping primitives of different styles therefore draw grouped
+    # by style rather than in creation order. The layer is a single item, so unmaterialized primitives can't
+    # interleave in z with other scene items either.
+    def __init__(self, virtualizer):
+        super().__init__()
+        self.virtualizer = virtualizer
+        self.bounds = QRectF()
+        self.cell_batches = {} # Home cell -> {(z, style, mode): list of QRectF/QLineF, or a QPainterPath}
+        self.style_tools = {} # Style id -> (QPen, QBrush)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True) # Needed for option.exposedRect
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton) # Clicks go to the items underneath
+        self.setZValue(DOCUMENT_LAYER_Z)
+
+    def boundingRect(self):
+        return self.bounds
+
+    def sync_bounds(self):
+        bounds = self.virtualizer.model.bounds
+        if bounds != self.bounds:
+            self.prepareGeometryChange()
+            self.bounds = bounds
+
+    def invalidate(self, rect):
+        # Drops the cached batches of the cells that rect touches
+        model = self.virtualizer.model
+        if len(self.cell_batches) < 64:
+            self.cell_batches.clear() # Cheaper than working out which ones
+            return
+        for cell in model.cells_in(rect):
+            self.cell_batches.pop(cell, None)
+
+    def invalidate_row(self, row):
+        left, top, right, bottom = self.virtualizer.model.row_box(row)
+        rect = QRectF(left, top, right - left, bottom - top)
+        self.invalidate(rect)
+        self.update(rect)
+
+    def paint(self, painter, option, widget=None):
+        model = self.virtualizer.model
+        span = model.max_span # A primitive is batched in the cell of its top-left corner, which may lie outside the exposed rect
+        groups = {}
+        for cell in model.cells_in(option.exposedRect.adjusted(-span, -span, 0, 0)):
+            batches = self.cell_batches.get(cell)
+            if batches is None:
+                batches = self.cell_batches[cell] = self._build_cell(cell)
+            for key, payload in batches.items():
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = [payload]
+                else:
+                    group.append(payload)
+        if not groups:
+            return
+        # Zoomed out until every primitive is tiny, curved and rotated shapes draw as their bounding boxes
+        boxes_only = LOD.is_tiny(QRectF(0, 0, span, span), LOD.of(painter, option))
+        style_tools = self.style_tools
+        for key in sorted(groups):
+            _, style, mode = key
+            if mode == (BATCH_PATH if boxes_only else BATCH_BOXES):
+                continue
+            tools = style_tools.get(style)
+            if tools is None:
+                tools = style_tools[style] = self._style_tools(model.styles[style])
+            painter.setPen(tools[0])
+            painter.setBrush(tools[1])
+            payloads = groups[key]
+            if mode == BATCH_PATH:
+                for path in payloads:
+                    painter.drawPath(path)
+                continue
+            shapes = payloads[0] if len(payloads) == 1 else [shape for payload in payloads for shape in payload]
+            if mode in (BATCH_RECTS, BATCH_BOXES):
+                painter.drawRects(shapes)
+            else:
+                painter.drawLines(shapes)
+
+    def refresh_styles(self):
+        # After a theme switch: role styles resolve to new pens/brushes; the batches themselves stay valid
+        self.style_tools.clear()
+        self.update()
+
+    @staticmethod
+    def _style_tools(style):
+        fill, outline, pen_width = style
+        return STYLES.pen(STYLES.pen_id_for(outline, pen_width)), STYLES.brush(STYLES.brush_id_for(fill))
+
+    def _build_cell(self, cell):
+        model = self.virtualizer.model
+        live = self.virtualizer.live
+        size = model.cell_size
+        batches = {}
+        for row in model.grid.get(cell, ()):
+            if row in live:
+                continue
+            left, top, _, _ = model.row_box(row)
+            if (math.floor(left / size), math.floor(top / size)) != cell:
+                continue # Batched in its home cell only, so it is drawn once
+            kind = model.kind[row]
+            x, y, w, h = model.x[row], model.y[row], model.w[row], model.h[row]
+            rotation = model.rotation[row]
+            if kind == PRIMITIVE_LINE:
+                line = QLineF(x, y, x + w, y + h)
+                if rotation:
+                    line = QTransform().rotate(rotation).map(line)
+                shape = line.translated(model.pos_x[row], model.pos_y[row])
+                mode = BATCH_LINES
+            elif kind == PRIMITIVE_RECT and not rotation:
+                shape = QRectF(x + model.pos_x[row], y + model.pos_y[row], w, h)
+                mode = BATCH_RECTS
+            else:
+                shape = QPainterPath()
+                if kind == PRIMITIVE_TRIANGLE:
+                    shape.addPolygon(QPolygonF([QPointF(x + w / 2, y), QPointF(x, y + h), QPointF(x + w, y + h)]))
+                    shape.closeSubpath()
+                elif kind == PRIMITIVE_ELLIPSE:
+                    shape.addEllipse(QRectF(x, y, w, h))
+                else:
+                    shape.addRect(QRectF(x, y, w, h))
+                transform = QTransform().translate(model.pos_x[row], model.pos_y[row]).rotate(rotation)
+                shape = transform.map(shape)
+                mode = BATCH_PATH
+                boxes_key = (model.z[row], model.style[row], BATCH_BOXES) # Stand-in used when zoomed far out
+                boxes = batches.get(boxes_key)
+                if boxes is None:
+                    batches[boxes_key] = [shape.boundingRect()]
+                else:
+                    boxes.append(shape.boundingRect())
+            key = (model.z[row], model.style[row], mode)
+            batch = batches.get(key)
+            if mode == BATCH_PATH:
+                if batch is None:
+                    batch = batches[key] = QPainterPath()
+                    batch.setFillRule(Qt.FillRule.WindingFill) # Overlapping shapes of one batch must not cancel out
+                batch.addPath(shape)
+            elif batch is None:
+                batches[key] = [shape]
+            else:
+                batch.append(shape)
+        return batches
+
+
+class SceneVirtualizer(QObject):
+    # Keeps real QGraphicsItems only for document primitives near the viewport, so they can be selected, moved
+    # and edited like drawn shapes; DocumentLayerItem paints all the others. Items that leave the area are written
+    # back to the model and recycled for the next primitive of the same kind.
+    def __init__(self, view, model, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.scene = view.scene()
+        self.model = model
+        self.live = {} # row -> materialized item
+        self.pools = {kind: [] for kind in range(len(PRIMITIVE_KINDS))}
+        self.layer = DocumentLayerItem(self)
+        self.scene.addItem(self.layer)
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(VIRTUAL_UPDATE_DELAY_MS) # The layer draws new content meanwhile
+        self.update_timer.timeout.connect(self.update_materialized)
+        for scrollbar in (view.horizontalScrollBar(), view.verticalScrollBar()):
+            scrollbar.valueChanged.connect(self.schedule_update)
+            scrollbar.rangeChanged.connect(self.schedule_update) # Zoom changes the scroll range
+        model.changed.connect(self._on_model_changed)
+        self.scene.selectionChanged.connect(self.schedule_update) # Deselected items can go back to the layer
+
+    def schedule_update(self):
+        self.update_timer.start()
+
+    def _on_model_changed(self, rect):
+        self.layer.sync_bounds()
+        self.layer.invalidate(rect)
+        self.layer.update(rect)
+        self.schedule_update()
+
+    @traced("virtualizer_update")
+    def update_materialized(self):
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        margin_x, margin_y = visible.width() * VIRTUAL_MATERIALIZE_MARGIN, visible.height() * VIRTUAL_MATERIALIZE_MARGIN
+        area = visible.adjusted(-margin_x, -margin_y, margin_x, margin_y)
+        rows = self.model.query(area)
+        wanted = set()
+        if len(rows) <= VIRTUAL_MATERIALIZE_BUDGET * 4: # Grid cells over-select; far beyond budget no need to check
+            left, top, right, bottom = area.left(), area.top(), area.right(), area.bottom()
+            row_box = self.model.row_box
+            for row in rows:
+                box = row_box(row)
+                if box[0] <= right and box[2] >= left and box[1] <= bottom and box[3] >= top:
+                    wanted.add(row)
+            if len(wanted) > VIRTUAL_MATERIALIZE_BUDGET:
+                wanted = set() # Zoomed out: the layer draws everything
+        self.release_removed()
+        for row, item in list(self.live.items()):
+            if row not in wanted and not self._pinned(item):
+                self.release(row)
+        for row in wanted:
+            if row not in self.live and self.model.alive[row]:
+                self._materialize(row)
+
+    def release_removed(self):
+        # Live items taken out of the scene (deleted, rasterized by the eraser) drop their primitive now,
+        # even while it is still in the materialized area
+        for row, item in list(self.live.items()):
+            if item.scene() is not self.scene:
+                self.release(row)
+
+    def release(self, row):
+        item = self.live.pop(row)
+        if item.scene() is not self.scene:
+            # Deleted, or replaced by an edit (e.g. rasterized by the eraser): the primitive goes with it.
+            # Not pooled, the replacement's owner may still hold it.
+            self.model.remove(row)
+            return
+        self._write_back(row, item)
+        self.scene.removeItem(item)
+        self.layer.invalidate_row(row) # The layer draws it again
+        pool = self.pools[self.model.kind[row]]
+        if len(pool) < VIRTUAL_POOL_LIMIT:
+            pool.append(item)
+
+    def materialize_at(self, point, tolerance=0.0):
+        # Gives the batch-drawn primitive under point a real item, so a click can select and drag it.
+        # Returns that item, or None when no primitive is there.
+        row = self.model.hit_test(point, tolerance)
+        if row is None:
+            return None
+        if row not in self.live:
+            self._materialize(row)
+        return self.live[row]
+
+    def materialize_in(self, rect):
+        # Real items for every primitive touching rect (e.g. under the eraser)
+        left, top, right, bottom = rect.left(), rect.top(), rect.right(), rect.bottom()
+        for row in self.model.query(rect):
+            if row in self.live:
+                continue
+            box = self.model.row_box(row)
+            if box[0] <= right and box[2] >= left and box[1] <= bottom and box[3] >= top:
+                self._materialize(row)
+
+    def shutdown(self):
+        # No more materialization once the window closes (the scene may be cleared under us)
+        self.update_timer.stop()
+        for scrollbar in (self.view.horizontalScrollBar(), self.view.verticalScrollBar()):
+            scrollbar.valueChanged.disconnect(self.schedule_update)
+            scrollbar.rangeChanged.disconnect(self.schedule_update)
+        self.model.changed.disconnect(self._on_model_changed)
+        # Let go of the item wrappers: the scene deletes their C++ items with the window
+        self.live.clear()
+        for pool in self.pools.values():
+            pool.clear()
+
+    def release_all(self):
+        # Writes every materialized item back, e.g. before reading the model directly
+        for row in list(self.live):
+            self.release(row)
+
+    def _pinned(self, item):
+        # Selected items (and the one being dragged) stay real until the user lets go of them
+        return item.scene() is self.scene and (item.isSelected() or item is self.scene.mouseGrabberItem())
+
+    def _materialize(self, row):
+        model = self.model
+        kind = model.kind[row]
+        pool = self.pools[kind]
+        item = pool.pop() if pool else self._create_item(kind)
+        x, y, w, h = model.x[row], model.y[row], model.w[row], model.h[row]
+        fill, outline, pen_width = model.styles[model.style[row]]
+        STYLES.set_pen(item, STYLES.pen_id_for(outline, pen_width))
+        if kind == PRIMITIVE_LINE:
+            item.setLine(x, y, x + w, y + h)
+        else:
+            STYLES.set_brush(item, STYLES.brush_id_for(fill))
+            if kind == PRIMITIVE_TRIANGLE:
+                item.setPolygon(QPolygonF([QPointF(x + w / 2, y), QPointF(x, y + h), QPointF(x + w, y + h)]))
+            else:
+                item.setRect(QRectF(x, y, w, h))
+        item.setPos(model.pos_x[row], model.pos_y[row])
+        item.setRotation(model.rotation[row])
+        item.setZValue(model.z[row])
+        item.document_row = row
+        self.live[row] = item
+        self.scene.addItem(item)
+        self.layer.invalidate_row(row) # Now drawn by its item
+
+    @staticmethod
+    def _create_item(kind):
+        if kind == PRIMITIVE_RECT:
+            item = QGraphicsRectItem()
+        elif kind == PRIMITIVE_ELLIPSE:
+            item = QGraphicsEllipseItem()
+        elif kind == PRIMITIVE_TRIANGLE:
+            item = QGraphicsPolygonItem()
+            item.shape_type = "triangle" # Same marker as drawn triangles
+        else:
+            item = QGraphicsLineItem()
+        item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
+        item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
+        return item
+
+    def _write_back(self, row, item):
+        kind = self.model.kind[row]
+        if kind == PRIMITIVE_LINE:
+            line = item.line()
+            x, y, w, h = line.x1(), line.y1(), line.dx(), line.dy()
+            fill = 0
+        else:
+            rect = item.polygon().boundingRect() if kind == PRIMITIVE_TRIANGLE else item.rect()
+            x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+            fill = STYLES.brush_value(item)
+        self.model.update(row, x, y, w, h, item.pos().x(), item.pos().y(), item.rotation(), item.zValue(),
+                          fill, STYLES.pen_value(item), item.pen().widthF())
+
+
+# --- Font Families ---
+def font_family_cache_path():
+    cache_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericCacheLocation) or tempfile.gettempdir()
+    return os.path.join(cache_dir, FONT_FAMILY_CACHE_FILE)
+
+
+def load_cached_font_families():
+    # Families seen on the previous run; shown right away while FontFamiliesTask enumerates the live list
+    try:
+        with open(font_family_cache_path(), encoding="utf-8") as f:
+            families = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return families if isinstance(families, list) else []
+
+
+class FontFamiliesSignals(QObject):
+    families_ready = Signal(object) # list of family names
+
+
+class FontFamiliesTask(QRunnable):
+    # Enumerates installed font families on the thread pool (QFontDatabase's functions are thread-safe)
+    # and refreshes the on-disk snapshot for the next run
+    def __init__(self, signals):
+        super().__init__()
+        self.signals = signals
+
+    @traced("font_families", "text")
+    def run(self):
+        families = QFontDatabase.families()
+        if families != load_cached_font_families():
+            try:
+                path = font_family_cache_path()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(families, f)
+            except OSError as e:
+                log_app.warning("Could not write the font family cache: %s", e)
+        self.signals.families_ready.emit(families)
+
+
 # --- Undo Commands ---
 class AddItemCommand(QUndoCommand):
     def __init__(self, item, scene, description="Add Item"):
@@ -140,10 +3374,97 @@ class AddItemCommand(QUndoCommand):
         if isinstance(self.item, QGraphicsPolygonItem): return "Triangle"
         if isinstance(self.item, QGraphicsPathItem): return "Pen Stroke"
         if isinstance(self.item, QGraphicsPixmapItem): return "Image"
-        if isinstance(self.item, QGraphicsItemGroup): return "Table" # For pasted tables
+        if isinstance(self.item, (TableItem, QGraphicsItemGroup)): return "Table" # For pasted tables
         if isinstance(self.item, QGraphicsTextItem): return "Text Item"
         return "Item"
 
+class AddItemsCommand(QUndoCommand):
+    # Adds several items as one undo step (e.g. a multi-image import)
+    def __init__(self, items, scene, description="Add Items"):
+        super().__init__(description)
+        self.items = list(items)
+        self.scene = scene
+
+    def undo(self):
+        for item in self.items:
+            if item.scene() == self.scene:
+                self.scene.removeItem(item)
+
+    def redo(self):
+        for item in self.items:
+            if item.scene() is None:
+                self.scene.addItem(item)
+
+# --- Frame Timing HUD ---
+class FrameStats:
+    # Rolling paint and event-handler timings for the HUD; only exists while the HUD is on
+    def __init__(self):
+        self.frame_times = deque(maxlen=FRAME_STATS_WINDOW) # Paint durations in seconds
+        self.frame_stamps = deque(maxlen=FRAME_STATS_WINDOW) # perf_counter() at the end of each frame
+        self.exposed_items = 0 # Items in the last repainted area, not only the ones actually drawn
+        self.exposed_counted_at = 0.0
+        self.handler_times = {} # handler name -> deque of durations in seconds
+
+    def record_frame(self, duration):
+        self.frame_times.append(duration)
+        self.frame_stamps.append(time.perf_counter())
+
+    def wants_exposed_count(self):
+        # The item count costs an index query, so it is refreshed about as often as the HUD timer
+        return time.perf_counter() - self.exposed_counted_at >= FRAME_STATS_COUNT_INTERVAL
+
+    def record_exposed_items(self, count):
+        self.exposed_items = count
+        self.exposed_counted_at = time.perf_counter()
+
+    def record_handler(self, name, duration):
+        times = self.handler_times.get(name)
+        if times is None:
+            times = self.handler_times[name] = deque(maxlen=FRAME_STATS_WINDOW)
+        times.append(duration)
+
+    def fps(self):
+        now = time.perf_counter()
+        return sum(1 for stamp in self.frame_stamps if now - stamp <= 1.0)
+
+    def percentile(self, fraction):
+        if not self.frame_times:
+            return 0.0
+        ordered = sorted(self.frame_times)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def hud_lines(self):
+        last = self.frame_times[-1] if self.frame_times else 0.0
+        lines = [
+            f"FPS {self.fps()}   frame {last * 1000:.1f} ms   items in area {self.exposed_items}",
+            f"p50 {self.percentile(0.5) * 1000:.1f}   p95 {self.percentile(0.95) * 1000:.1f}   p99 {self.percentile(0.99) * 1000:.1f} ms",
+        ]
+        for name, times in sorted(self.handler_times.items()):
+            lines.append(f"{name}: avg {sum(times) / len(times) * 1000:.2f} ms  max {max(times) * 1000:.2f} ms  ({len(times)})")
+        return lines
+
+
+def timed_handler(name):
+    # Times a CustomGraphicsView method into the HUD's FrameStats and the tracer; two attribute checks when both are off
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            stats = self.frame_stats
+            if stats is None and not TRACER.enabled:
+                return method(self, *args)
+            start_ns = time.perf_counter_ns()
+            try:
+                return method(self, *args)
+            finally:
+                end_ns = time.perf_counter_ns()
+                if stats is not None:
+                    stats.record_handler(name, (end_ns - start_ns) / 1e9)
+                if TRACER.enabled:
+                    TRACER.record(name, "input", start_ns, end_ns, {"tool": self.parent_window.current_tool})
+        return wrapper
+    return decorator
+
+
 class CustomGraphicsView(QGraphicsView):
     def __init__(self, scene, parent_window):
         super().__init__(scene)
@@ -163,6 +3484,251 @@ class CustomGraphicsView(QGraphicsView):
         self.original_item_rect_on_resize_start = None
         self.original_item_scale_on_resize_start = None # Added for scaling
 
+        self.setAcceptDrops(True) # CSV/TSV files dropped from disk are imported as tables
+
+        self.frame_stats = None # FrameStats while the frame timing HUD is shown
+        self.hud_rect = QRect() # Viewport area covered by the HUD at the last paint
+        self.hud_timer = QTimer(self) # Keeps the HUD current when partial updates don't reach it
+        self.hud_timer.setInterval(500)
+        self.hud_timer.timeout.connect(lambda: self.viewport().update(self.hud_rect))
+
+        self.grid_style = None # One of GRID_STYLES while the grid is shown
+        self.grid_tiles = OrderedDict() # (style, tile px, fade step, rgba) -> QPixmap of one major cell, in LRU order
+
+        self.snap_index = None # SnapIndex, set by the window once the document model exists
+        self.snap_to_objects = True
+        self.snap_to_grid = True # While the grid is shown
+        self.snap_guides = [] # QLineF in scene coordinates, drawn over the scene while a snap holds
+        self.snap_movers = None # Items the select tool is dragging, from the first snapped move to the release
+
+        # Render quality: full hints at rest. While the user zooms, pans or drags the rotation slider, antialiasing
+        # and smooth pixmap scaling are dropped; one full-quality repaint follows once input settles.
+        self.adaptive_quality = True
+        self.resting_render_hints = self.renderHints() | QPainter.RenderHint.Antialiasing | QPainter.RenderHint.SmoothPixmapTransform
+        self.setRenderHints(self.resting_render_hints)
+        self.interacting = False
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(INTERACTION_SETTLE_MS)
+        self.settle_timer.timeout.connect(self.end_interaction)
+
+    def begin_interaction(self):
+        # Called on every navigation input; each call pushes the full-quality repaint back
+        if not self.adaptive_quality:
+            return
+        self.settle_timer.start()
+        if not self.interacting:
+            self.interacting = True
+            self.setRenderHints(self.resting_render_hints & ~(QPainter.RenderHint.Antialiasing | QPainter.RenderHint.SmoothPixmapTransform))
+
+    def end_interaction(self):
+        self.settle_timer.stop()
+        if self.interacting:
+            self.interacting = False
+            self.setRenderHints(self.resting_render_hints) # Repaints the viewport once
+
+    def set_grid_style(self, style):
+        self.grid_style = style
+        self.resetCachedContent() # The background is cached (see RenderSettings)
+        self.viewport().update()
+
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect) # Theme or custom canvas color
+        if self.grid_style is None:
+            return
+        world = painter.worldTransform()
+        scale = math.hypot(world.m11(), world.m12())
+        if scale <= 0:
+            return
+        # Pick the finest level whose minor lines are at least GRID_MIN_SPACING_PX apart; its minor lines fade in
+        # as they move apart, while its major lines (the next level's minor ones) stay solid
+        spacing = self._grid_spacing(scale)
+        fade = min(1.0, (spacing * scale - GRID_MIN_SPACING_PX) / GRID_MIN_SPACING_PX) # Solid from twice the minimum
+        major_px = spacing * GRID_MAJOR_EVERY * scale
+        background = self.scene().backgroundBrush().color()
+        ink = QColor("black") if background.lightnessF() > 0.5 else QColor("white")
+        if major_px > GRID_TILE_MAX_PX:
+            # Zoomed far in: a tile would be huge while only a few lines are on screen, so draw those directly
+            self._draw_grid_lines(painter, world.mapRect(rect), world.map(QPointF(0, 0)), spacing * scale,
+                                  round(fade * GRID_FADE_STEPS), ink)
+            return
+        tile = self._grid_tile(max(GRID_MAJOR_EVERY, round(major_px)), round(fade * GRID_FADE_STEPS), ink)
+
+        # One textured fill in device coordinates, the tile stretched by under a pixel to the exact spacing and
+        # anchored at the scene origin so the grid moves with the content
+        origin = world.map(QPointF(0, 0))
+        stretch = major_px / tile.width()
+        brush = QBrush(tile)
+        brush.setTransform(QTransform().translate(origin.x(), origin.y()).scale(stretch, stretch))
+        device_rect = world.mapRect(rect)
+        painter.save()
+        painter.resetTransform()
+        painter.fillRect(device_rect, brush)
+        painter.restore()
+
+    @staticmethod
+    def _grid_spacing(scale):
+        # Minor spacing of the finest level whose lines are at least GRID_MIN_SPACING_PX apart on screen
+        spacing = GRID_SPACING
+        while spacing * scale < GRID_MIN_SPACING_PX:
+            spacing *= GRID_MAJOR_EVERY
+        return spacing
+
+    def _grid_inks(self, fade_step, ink):
+        # (minor, major) line or dot colors
+        minor, major = QColor(ink), QColor(ink)
+        minor.setAlphaF((GRID_MINOR_ALPHA if self.grid_style == "lines" else GRID_MAJOR_ALPHA) * fade_step / GRID_FADE_STEPS) # Single-pixel dots need more ink
+        major.setAlphaF(GRID_MAJOR_ALPHA)
+        return minor, major
+
+    def _draw_grid_lines(self, painter, device_rect, origin, step, fade_step, ink):
+        # Same marks as _grid_tile, drawn one by one in device coordinates; step is the minor spacing in pixels
+        minor, major = self._grid_inks(fade_step, ink)
+        columns = range(math.floor((device_rect.left() - origin.x()) / step), math.ceil((device_rect.right() - origin.x()) / step) + 1)
+        rows = range(math.floor((device_rect.top() - origin.y()) / step), math.ceil((device_rect.bottom() - origin.y()) / step) + 1)
+        painter.save()
+        painter.resetTransform()
+        if self.grid_style == "lines":
+            for column in columns:
+                painter.fillRect(QRectF(round(origin.x() + column * step), device_rect.top(), 1, device_rect.height()),
+                                 major if column % GRID_MAJOR_EVERY == 0 else minor)
+            for row in rows:
+                painter.fillRect(QRectF(device_rect.left(), round(origin.y() + row * step), device_rect.width(), 1),
+                                 major if row % GRID_MAJOR_EVERY == 0 else minor)
+        else:
+            for column in columns:
+                x = round(origin.x() + column * step)
+                for row in rows:
+                    y = round(origin.y() + row * step)
+                    if column % GRID_MAJOR_EVERY == 0 and row % GRID_MAJOR_EVERY == 0:
+                        painter.fillRect(x, y, 2, 2, major)
+                    else:
+                        painter.fillRect(x, y, 1, 1, minor)
+        painter.restore()
+
+    def _grid_tile(self, size, fade_step, ink):
+        key = (self.grid_style, size, fade_step, ink.rgba())
+        tile = self.grid_tiles.get(key)
+        if tile is not None:
+            self.grid_tiles.move_to_end(key)
+            return tile
+        tile = QPixmap(size, size)
+        tile.fill(Qt.GlobalColor.transparent)
+        minor, major = self._grid_inks(fade_step, ink)
+        offsets = [round(index * size / GRID_MAJOR_EVERY) for index in range(GRID_MAJOR_EVERY)]
+        painter = QPainter(tile)
+        if self.grid_style == "lines":
+            if fade_step:
+                for offset in offsets[1:]:
+                    painter.fillRect(offset, 0, 1, size, minor)
+                    painter.fillRect(0, offset, size, 1, minor)
+            painter.fillRect(0, 0, 1, size, major)
+            painter.fillRect(0, 0, size, 1, major)
+        else:
+            if fade_step:
+                for x in offsets:
+                    for y in offsets:
+                        if x or y:
+                            painter.fillRect(x, y, 1, 1, minor)
+            painter.fillRect(0, 0, 2, 2, major)
+        painter.end()
+        self.grid_tiles[key] = tile
+        if len(self.grid_tiles) > GRID_TILE_CACHE_SIZE:
+            self.grid_tiles.popitem(last=False)
+        return tile
+
+    def snap_box(self, box, event, items=(), spacing=True):
+        # Offset (dx, dy) snapping box (left, top, right, bottom) to other items and the grid; shows its guides
+        world = self.transform()
+        scale = math.hypot(world.m11(), world.m12())
+        grid = self._grid_spacing(scale) if self.snap_to_grid and self.grid_style is not None else 0.0
+        if (self.snap_index is None or not (self.snap_to_objects or grid) or scale <= 0
+                or event.modifiers() & Qt.KeyboardModifier.AltModifier):
+            self.set_snap_guides([])
+            return 0.0, 0.0
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        dx, dy, guides = self.snap_index.snap(box, items, SNAP_DISTANCE_PX / scale,
+                                              (visible.left(), visible.top(), visible.right(), visible.bottom()),
+                                              self.snap_to_objects, grid, spacing)
+        self.set_snap_guides(guides)
+        return dx, dy
+
+    def snap_point(self, point, event, items=()):
+        dx, dy = self.snap_box((point.x(), point.y(), point.x(), point.y()), event, items, spacing=False)
+        return QPointF(point.x() + dx, point.y() + dy)
+
+    def _snap_dragged_items(self, event):
+        # Qt has just moved the selection to follow the mouse; nudge it onto the nearest snap
+        if self.snap_movers is None:
+            self.snap_movers = [item for item in self.scene().selectedItems()
+                                if item.parentItem() is None and item.flags() & QGraphicsItem.GraphicsItemFlag.ItemIsMovable]
+        if not self.snap_movers:
+            return
+        bounds = QRectF()
+        for item in self.snap_movers:
+            bounds |= item.sceneBoundingRect()
+        dx, dy = self.snap_box((bounds.left(), bounds.top(), bounds.right(), bounds.bottom()), event, self.snap_movers)
+        if dx or dy:
+            for item in self.snap_movers:
+                item.moveBy(dx, dy) # Qt places the items from the press position each move, so this doesn't add up
+
+    def set_snap_guides(self, guides):
+        if not guides and not self.snap_guides:
+            return
+        for line in self.snap_guides + guides: # Where the old ones were and the new ones go
+            area = self.mapFromScene(QRectF(line.p1(), line.p2()).normalized()).boundingRect()
+            self.viewport().update(area.adjusted(-2, -2, 2, 2))
+        self.snap_guides = guides
+
+    def set_frame_hud_enabled(self, enabled):
+        self.frame_stats = FrameStats() if enabled else None
+        if enabled:
+            self.hud_timer.start()
+        else:
+            self.hud_timer.stop()
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        stats = self.frame_stats
+        if stats is None or self.hud_rect.contains(event.region().boundingRect()):
+            super().paintEvent(event) # HUD-only refreshes are not counted as frames
+        else:
+            start = time.perf_counter()
+            super().paintEvent(event)
+            duration = time.perf_counter() - start
+            stats.record_frame(duration)
+            if stats.wants_exposed_count():
+                exposed = self.mapToScene(event.region().boundingRect()).boundingRect()
+                stats.record_exposed_items(len(self.scene().items(exposed))) # The document layer counts as one
+        if STARTUP_PROFILE.awaiting_first_paint:
+            STARTUP_PROFILE.first_frame_painted()
+
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        if self.snap_guides:
+            painter.save()
+            painter.setPen(QPen(SNAP_GUIDE_COLOR, 0)) # Cosmetic: one pixel at any zoom
+            painter.drawLines(self.snap_guides)
+            painter.restore()
+        if self.frame_stats is None:
+            return
+        # HUD in viewport coordinates, top-left corner; shows the stats up to the previous frame
+        lines = self.frame_stats.hud_lines()
+        painter.save()
+        painter.resetTransform()
+        font = QFont("monospace", 9)
+        painter.setFont(font)
+        line_height = QFontMetricsF(font).height()
+        width = max(QFontMetricsF(font).horizontalAdvance(line) for line in lines) + 12
+        hud_rect = QRectF(6, 6, width, line_height * len(lines) + 8)
+        self.hud_rect = hud_rect.toAlignedRect().adjusted(0, 0, 200, 0) # Room for lines that grow
+        painter.fillRect(hud_rect, QColor(0, 0, 0, 170))
+        painter.setPen(QColor(120, 255, 120))
+        for index, line in enumerate(lines):
+            painter.drawText(QPointF(12, 10 + line_height * (index + 0.8)), line)
+        painter.restore()
+
+    @timed_handler("mousePressEvent")
     def mousePressEvent(self, event):
         tool = self.parent_window.current_tool
 
@@ -185,6 +3751,11 @@ class CustomGraphicsView(QGraphicsView):
                     event.accept()
                     return
 
+            if tool == "select" and (item_at_click is None or item_at_click is self.parent_window.virtualizer.layer):
+                # Shapes drawn by the document layer have no item of their own until they are clicked
+                tolerance = VIRTUAL_HIT_TOLERANCE / max(self.transform().m11(), 1e-6)
+                item_at_click = self.parent_window.virtualizer.materialize_at(self.start_pos_scene, tolerance) or item_at_click
+
             if tool == "select":
                 # item_at_click is already fetched
                 if item_at_click and hasattr(item_at_click, 'is_resize_handle'): # Check if it's one of our item resize handles
@@ -214,6 +3785,8 @@ class CustomGraphicsView(QGraphicsView):
                         return 
                 else:
                     # If not on a handle, let the base class handle selection/movement
+                    if item_at_click is not None and self.snap_index is not None:
+                        self.snap_index.flush() # Catch up on edits now rather than on the first drag move
                     super().mousePressEvent(event)
                     return
             elif tool == "hand":
@@ -226,16 +3799,16 @@ class CustomGraphicsView(QGraphicsView):
                 return
             elif tool == "pen":
                 # Start a new path
-                self.current_drawing_path_item = QGraphicsPathItem()
+                self.current_drawing_path_item = StrokeItem()
                 self.scene().addItem(self.current_drawing_path_item)
                 
                 # Configure pen for the path item
-                pen = QPen(self.parent_window.current_pen_color,
-                           self.parent_window.current_pen_width,
-                           Qt.PenStyle.SolidLine,
-                           Qt.PenCapStyle.RoundCap,
-                           Qt.PenJoinStyle.RoundJoin)
-                self.current_drawing_path_item.setPen(pen)
+                STYLES.set_pen(self.current_drawing_path_item,
+                               STYLES.pen_id(self.parent_window.current_pen_color,
+                                             self.parent_window.current_pen_width,
+                                             Qt.PenStyle.SolidLine,
+                                             Qt.PenCapStyle.RoundCap,
+                                             Qt.PenJoinStyle.RoundJoin))
                 
                 # Create the QPainterPath and move to the start point
                 painter_path = QPainterPath()
@@ -245,10 +3818,10 @@ class CustomGraphicsView(QGraphicsView):
                 return
             elif tool == "text": # Handle text tool press
                 # Create QGraphicsTextItem at the click position
-                text_item = QGraphicsTextItem()
+                text_item = TextItem()
                 text_item.setPlainText("Type here...") # Default text
                 text_item.setPos(self.start_pos_scene)
-                text_item.setDefaultTextColor(self.parent_window.current_theme_colors["text_color"])
+                text_item.set_text_role("text_color") # Follows theme switches until a color is picked
                 # text_item.setFont(...) # TODO: Add font selection later
                 
                 text_item.setFlag(QGraphicsTextItem.GraphicsItemFlag.ItemIsSelectable, True)
@@ -265,7 +3838,8 @@ class CustomGraphicsView(QGraphicsView):
                 # If direct editing isn't triggered, we might need to explicitly call setFocus later.
                 event.accept()
                 return
-            # For drawing tools, start_pos_scene is already set, handled in move/release
+            elif tool in ("rectangle", "ellipse", "line", "triangle"):
+                self.start_pos_scene = self.snap_point(self.start_pos_scene, event) # Move and release draw from here
 
         # Fallback for other mouse buttons or if not handled above
         # super().mousePressEvent(event)
@@ -275,10 +3849,13 @@ class CustomGraphicsView(QGraphicsView):
             super().mousePressEvent(event)
 
 
+    @timed_handler("mouseMoveEvent")
     def mouseMoveEvent(self, event):
         tool = self.parent_window.current_tool
 
         if tool == "hand":
+            if event.buttons() & Qt.MouseButton.LeftButton:
+                self.begin_interaction() # Panning
             super().mouseMoveEvent(event) # Pass directly to base for hand tool
             return
 
@@ -323,6 +3900,7 @@ class CustomGraphicsView(QGraphicsView):
             else:
                  # For direct item resize, dx/dy in scene coords is fine as item.rect() is also scene-relative for top-level items with no parent for rect manipulation.
                  # No, item.rect() is item-local. So dx, dy must be in item-local coords.
+                current_pos_scene = self.snap_point(current_pos_scene, event, (self.item_being_resized,)) # The dragged corner snaps
                 map_to_item_transform = self.item_being_resized.sceneTransform().inverted()[0]
                 start_pos_item = map_to_item_transform.map(self.resize_start_pos_scene)
                 current_pos_item = map_to_item_transform.map(current_pos_scene)
@@ -413,7 +3991,7 @@ class CustomGraphicsView(QGraphicsView):
         
         # --- Drawing tools preview logic ---
         elif self.start_pos_scene and (event.buttons() & Qt.MouseButton.LeftButton) and tool in ["rectangle", "ellipse", "line", "triangle"]:
-            # current_pos_scene is already available
+            current_pos_scene = self.snap_point(current_pos_scene, event)
             if self.current_preview_item_view:
                 self.scene().removeItem(self.current_preview_item_view)
                 self.current_preview_item_view = None
@@ -456,7 +4034,11 @@ class CustomGraphicsView(QGraphicsView):
             return
         
         # Fallback to super for other moves (like item movement by select tool, hand tool panning)
+        grabber = self.scene().mouseGrabberItem() if tool == "select" and event.buttons() & Qt.MouseButton.LeftButton else None
+        grabbed_pos = grabber.pos() if grabber is not None else None
         super().mouseMoveEvent(event)
+        if grabber is not None and grabber.pos() != grabbed_pos: # A drag moved the selection (not e.g. text selection)
+            self._snap_dragged_items(event)
 
     def constrain_and_set_crop_rect(self, new_rect_proposed):
         # Helper function for crop rectangle updates
@@ -494,13 +4076,16 @@ class CustomGraphicsView(QGraphicsView):
 
         self.item_being_resized.setRect(constrained_rect.normalized())
 
+    @timed_handler("mouseReleaseEvent")
     def mouseReleaseEvent(self, event):
         tool = self.parent_window.current_tool
         current_pos_scene = self.mapToScene(event.position().toPoint()) # Defined for general use
+        self.snap_movers = None
+        self.set_snap_guides([])
 
         item_that_was_resized = None
         if self.item_being_resized and event.button() == Qt.MouseButton.LeftButton:
-            print(f"Resizing finished for: {self.item_being_resized}, handle: {self.current_resize_handle_type}")
+            log_resize.debug("Resizing finished for: %s, handle: %s", self.item_being_resized, self.current_resize_handle_type)
             item_that_was_resized = self.item_being_resized # Store before clearing
             if self.item_being_resized == self.parent_window.crop_overlay_rect:
                 self.parent_window._update_crop_handles()
@@ -527,11 +4112,11 @@ class CustomGraphicsView(QGraphicsView):
                 self.current_preview_item_view = None
 
             final_item = None
-            outline_color = self.parent_window.current_theme_colors["item_default_outline"]
-            fill_color = self.parent_window.current_theme_colors["item_default_fill"]
-            pen = QPen(outline_color)
-            brush = QBrush(fill_color)
+            pen_style = STYLES.role_pen_id("item_default_outline") # Default colors follow theme switches
+            brush_style = STYLES.role_brush_id("item_default_fill")
 
+            current_pos_scene = self.snap_point(current_pos_scene, event) # Same end point as the last preview
+            self.set_snap_guides([])
             final_bounding_rect = QRectF(self.start_pos_scene, current_pos_scene).normalized()
 
             if tool == "rectangle" or tool == "ellipse" or tool == "triangle":
@@ -553,7 +4138,7 @@ class CustomGraphicsView(QGraphicsView):
                     if final_item: final_item.shape_type = "triangle" # Custom attribute
                 
                 if final_item and tool in ["rectangle", "ellipse", "triangle"]:
-                    final_item.setBrush(brush)
+                    STYLES.set_brush(final_item, brush_style)
 
             elif tool == "line":
                 # Check for minimal length for a line, if desired (e.g., avoid zero-length lines)
@@ -562,7 +4147,7 @@ class CustomGraphicsView(QGraphicsView):
                                                    current_pos_scene.x(), current_pos_scene.y())
             
             if final_item:
-                final_item.setPen(pen)
+                STYLES.set_pen(final_item, pen_style)
                 final_item.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsSelectable)
                 final_item.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsMovable)
                 # self.scene().addItem(final_item) # Old direct add
@@ -594,7 +4179,9 @@ class CustomGraphicsView(QGraphicsView):
         # Fallback to super for other releases
         super().mouseReleaseEvent(event)
     
+    @timed_handler("wheelEvent")
     def wheelEvent(self, event):
+        self.begin_interaction()
         zoom_in_factor = 1.15
         zoom_out_factor = 1 / zoom_in_factor
         old_pos = self.mapToScene(event.position().toPoint())
@@ -606,6 +4193,7 @@ class CustomGraphicsView(QGraphicsView):
         new_pos = self.mapToScene(event.position().toPoint())
         delta = new_pos - old_pos
         self.translate(delta.x(), delta.y())
+        self.parent_window.schedule_image_resolution_check()
 
     def contextMenuEvent(self, event):
         # Create a context menu
@@ -625,6 +4213,41 @@ class CustomGraphicsView(QGraphicsView):
         menu.exec(event.globalPos())
         # super().contextMenuEvent(event) # Optional: call if you want base class behavior too
 
+    def _dropped_files(self, event, extensions):
+        mime_data = event.mimeData()
+        if not mime_data.hasUrls():
+            return []
+        return [url.toLocalFile() for url in mime_data.urls()
+                if url.isLocalFile() and url.toLocalFile().lower().endswith(extensions)]
+
+    def dragEnterEvent(self, event):
+        if self._dropped_files(event, TABLE_FILE_EXTENSIONS + IMAGE_FILE_EXTENSIONS):
+            event.acceptProposedAction()
+        else:
+            super().dragEnterEvent(event)
+
+    def dragMoveEvent(self, event):
+        # The base class forwards to the scene, which would reject the drag when no item accepts drops
+        if self._dropped_files(event, TABLE_FILE_EXTENSIONS + IMAGE_FILE_EXTENSIONS):
+            event.acceptProposedAction()
+        else:
+            super().dragMoveEvent(event)
+
+    def dropEvent(self, event):
+        table_paths = self._dropped_files(event, TABLE_FILE_EXTENSIONS)
+        image_paths = self._dropped_files(event, IMAGE_FILE_EXTENSIONS)
+        if not table_paths and not image_paths:
+            super().dropEvent(event)
+            return
+        drop_pos = self.mapToScene(event.position().toPoint())
+        for index, file_path in enumerate(table_paths):
+            # Offset multiple dropped files slightly so they don't stack exactly
+            self.parent_window.import_table_file(file_path, drop_pos + QPointF(20 * index, 20 * index))
+        if image_paths:
+            self.parent_window.import_image_files(image_paths, drop_pos)
+        event.acceptProposedAction()
+
+    @timed_handler("_erase_at_point")
     def _erase_at_point(self, scene_pos):
         brush_size = self.parent_window.eraser_brush_size
         eraser_rect_scene = QRectF(
@@ -634,7 +4257,9 @@ class CustomGraphicsView(QGraphicsView):
             brush_size
         )
 
+        self.parent_window.virtualizer.materialize_in(eraser_rect_scene) # Batch-drawn shapes need items to be rasterized
         items_to_erase = self.scene().items(eraser_rect_scene, Qt.IntersectsItemShape)
+        log_eraser.debug_sampled(32, "Erasing %d items at (%.0f, %.0f)", len(items_to_erase), scene_pos.x(), scene_pos.y())
 
         for item in items_to_erase:
             if isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem)) and not hasattr(item, 'is_rasterized_for_erase'):
@@ -675,15 +4300,15 @@ class CustomGraphicsView(QGraphicsView):
                     painter.drawLine(item.line())
                 painter.end()
 
-                new_pixmap_item = QGraphicsPixmapItem(QPixmap.fromImage(render_image))
+                new_pixmap_item = TiledImageItem(QPixmap.fromImage(render_image))
                 new_pixmap_item.setPos(item.scenePos()) # Position the new pixmap item where the old vector item was
                 new_pixmap_item.setTransformOriginPoint(item.transformOriginPoint()) # Preserve transform origin
                 new_pixmap_item.setRotation(item.rotation())
                 new_pixmap_item.setScale(item.scale())
                 
                 # Copy flags
-                new_pixmap_item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsSelectable, item.flags() & QGraphicsPixmapItem.GraphicsItemFlag.ItemIsSelectable)
-                new_pixmap_item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsMovable, item.flags() & QGraphicsPixmapItem.GraphicsItemFlag.ItemIsMovable)
+                new_pixmap_item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsSelectable, bool(item.flags() & QGraphicsPixmapItem.GraphicsItemFlag.ItemIsSelectable))
+                new_pixmap_item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsMovable, bool(item.flags() & QGraphicsPixmapItem.GraphicsItemFlag.ItemIsMovable))
                 
                 new_pixmap_item.is_rasterized_for_erase = True
                 # Store original vector data if needed for "undo rasterization" (future)
@@ -691,15 +4316,17 @@ class CustomGraphicsView(QGraphicsView):
                 
                 self.scene().removeItem(item)
                 self.scene().addItem(new_pixmap_item)
+                self.parent_window.virtualizer.release_removed() # A document shape's primitive goes with it
                 # The 'item' variable now refers to the new QGraphicsPixmapItem for subsequent erasing
                 # We should re-assign 'item' to new_pixmap_item for the current erase pass
-                print(f"Converted vector item to pixmap for erasing.")
+                log_eraser.info("Converted vector item to pixmap for erasing.")
                 item = new_pixmap_item 
                 # Important: if item was selected, the selection is lost. Re-selecting new_pixmap_item might be needed.
                 # This also means resize handles will be lost. This needs further thought.
                 # For now, focus on erasing part.
 
             if isinstance(item, QGraphicsPixmapItem):
+                self.parent_window.image_residency.ensure_resident(item)
                 # Ensure the item has a modifiable QImage
                 if not hasattr(item, 'modifiable_qimage') or item.modifiable_qimage is None:
                     item.modifiable_qimage = item.pixmap().toImage().convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
@@ -715,7 +4342,7 @@ class CustomGraphicsView(QGraphicsView):
                 item_eraser_path = transform.map(temp_path)
 
                 if not hasattr(item, 'pil_for_display'): # Should exist if it's an image we loaded
-                    print("Error: Image item does not have pil_for_display for erasing.")
+                    log_eraser.error("Image item does not have pil_for_display for erasing.")
                     continue
 
                 # Ensure the item has a modifiable QImage for erasing
@@ -724,7 +4351,7 @@ class CustomGraphicsView(QGraphicsView):
                     item.modifiable_qimage = pil_to_qimage(item.pil_for_display).convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
                 
                 if item.modifiable_qimage.isNull():
-                    print("Error: modifiable_qimage is null")
+                    log_eraser.error("modifiable_qimage is null")
                     continue
 
                 img_painter = QPainter(item.modifiable_qimage)
@@ -734,10 +4361,165 @@ class CustomGraphicsView(QGraphicsView):
                 img_painter.end()
                 
                 item.setPixmap(QPixmap.fromImage(item.modifiable_qimage))
+                item.has_erased_pixels = True # Pixels no longer derive from the source file alone
                 # Update pil_for_display to reflect the erased state
                 item.pil_for_display = qimage_to_pil(item.modifiable_qimage)
 
 
+# --- Input Recording ---
+# Events are stored as compact lists: [time_ms, code, ...]. Mouse: x, y (viewport), button, buttons, modifiers.
+# Wheel: x, y, angle_dx, angle_dy, modifiers. Key: target, key, modifiers, text, autorepeat. Tool: name, pen color.
+MOUSE_EVENT_CODES = {
+    QEvent.Type.MouseButtonPress: "mp",
+    QEvent.Type.MouseButtonRelease: "mr",
+    QEvent.Type.MouseButtonDblClick: "md",
+    QEvent.Type.MouseMove: "mm",
+}
+KEY_EVENT_CODES = {QEvent.Type.KeyPress: "kp", QEvent.Type.KeyRelease: "kr"}
+MOUSE_EVENT_TYPES = {code: event_type for event_type, code in MOUSE_EVENT_CODES.items()}
+KEY_EVENT_TYPES = {code: event_type for event_type, code in KEY_EVENT_CODES.items()}
+
+
+class InputRecorder(QObject):
+    # Event filter on the view, its viewport and the window; records what reaches the canvas, with timestamps
+    def __init__(self, window):
+        super().__init__(window)
+        self.canvas_window = window
+        self.events = []
+        self.start_time = time.perf_counter()
+        view = window.view
+        transform = view.transform()
+        self.header = {
+            "version": INPUT_RECORDING_VERSION,
+            "viewport": [view.viewport().width(), view.viewport().height()],
+            "transform": [transform.m11(), transform.m12(), transform.m21(), transform.m22(), transform.dx(), transform.dy()],
+            "scroll": [view.horizontalScrollBar().value(), view.verticalScrollBar().value()],
+            "tool": window.current_tool,
+            "pen_color": window.current_pen_color.name(QColor.NameFormat.HexArgb),
+        }
+        self.targets = {view.viewport(): "viewport", view: "view", window: "window"}
+        for target in self.targets:
+            target.installEventFilter(self)
+
+    def _elapsed_ms(self):
+        return round((time.perf_counter() - self.start_time) * 1000, 2)
+
+    def eventFilter(self, watched, event):
+        event_type = event.type()
+        target = self.targets.get(watched)
+        if event_type in MOUSE_EVENT_CODES and target == "viewport":
+            position = event.position()
+            self.events.append([self._elapsed_ms(), MOUSE_EVENT_CODES[event_type], round(position.x(), 2), round(position.y(), 2),
+                                event.button().value, event.buttons().value, event.modifiers().value])
+        elif event_type == QEvent.Type.Wheel and target == "viewport":
+            position = event.position()
+            delta = event.angleDelta()
+            self.events.append([self._elapsed_ms(), "w", round(position.x(), 2), round(position.y(), 2),
+                                delta.x(), delta.y(), event.modifiers().value])
+        elif event_type in KEY_EVENT_CODES and target in ("view", "window"):
+            self.events.append([self._elapsed_ms(), KEY_EVENT_CODES[event_type], target, event.key(),
+                                event.modifiers().value, event.text(), event.isAutoRepeat()])
+        return False # Never consume; recording must not change behaviour
+
+    def record_tool(self, tool_name, pen_color):
+        self.events.append([self._elapsed_ms(), "t", tool_name, pen_color.name(QColor.NameFormat.HexArgb)])
+
+    def stop(self):
+        for target in self.targets:
+            target.removeEventFilter(self)
+
+    def save(self, file_path):
+        with gzip.open(file_path, "wt", encoding="utf-8") as recording_file:
+            json.dump({"header": self.header, "events": self.events}, recording_file, separators=(",", ":"))
+        return len(self.events)
+
+
+def load_input_recording(file_path):
+    with gzip.open(file_path, "rt", encoding="utf-8") as recording_file:
+        session = json.load(recording_file)
+    if session.get("header", {}).get("version") != INPUT_RECORDING_VERSION:
+        raise ValueError(f"Unsupported input recording version in {file_path}")
+    return session
+
+
+class InputReplayer:
+    # Feeds a recorded session back into a window at recorded speed or as fast as possible, timing the
+    # dispatch of every event. Returns per-event-type statistics.
+    def __init__(self, window, session):
+        self.canvas_window = window
+        self.session = session
+
+    def _restore_view(self):
+        header = self.session["header"]
+        view = self.canvas_window.view
+        # Same viewport size as when recording, so viewport coordinates land on the same scene positions
+        width, height = header["viewport"]
+        self.canvas_window.resize(self.canvas_window.width() + width - view.viewport().width(),
+                                  self.canvas_window.height() + height - view.viewport().height())
+        QApplication.processEvents()
+        m11, m12, m21, m22, dx, dy = header["transform"]
+        view.setTransform(QTransform(m11, m12, m21, m22, dx, dy))
+        view.horizontalScrollBar().setValue(header["scroll"][0])
+        view.verticalScrollBar().setValue(header["scroll"][1])
+        self.canvas_window.current_pen_color = QColor(header["pen_color"])
+        self.canvas_window.set_tool(header["tool"], prompt_for_color=False)
+
+    def _dispatch(self, event):
+        window = self.canvas_window
+        view = window.view
+        code = event[1]
+        if code in MOUSE_EVENT_TYPES:
+            _, _, x, y, button, buttons, modifiers = event
+            position = QPointF(x, y)
+            QApplication.sendEvent(view.viewport(), QMouseEvent(
+                MOUSE_EVENT_TYPES[code], position, QPointF(view.viewport().mapToGlobal(position.toPoint())),
+                Qt.MouseButton(button), Qt.MouseButton(buttons), Qt.KeyboardModifier(modifiers)))
+        elif code == "w":
+            _, _, x, y, delta_x, delta_y, modifiers = event
+            position = QPointF(x, y)
+            QApplication.sendEvent(view.viewport(), QWheelEvent(
+                position, QPointF(view.viewport().mapToGlobal(position.toPoint())), QPoint(0, 0), QPoint(delta_x, delta_y),
+                Qt.MouseButton.NoButton, Qt.KeyboardModifier(modifiers), Qt.ScrollPhase.NoScrollPhase, False))
+        elif code in KEY_EVENT_TYPES:
+            _, _, target, key, modifiers, text, autorepeat = event
+            QApplication.sendEvent(view if target == "view" else window, QKeyEvent(
+                KEY_EVENT_TYPES[code], key, Qt.KeyboardModifier(modifiers), text, autorepeat))
+        elif code == "t":
+            window.current_pen_color = QColor(event[3])
+            window.set_tool(event[2], prompt_for_color=False)
+
+    def run(self, speed="max"):
+        # speed: "recorded" waits for each event's timestamp (events still process in between), "max" doesn't
+        self._restore_view()
+        durations = {}
+        lag_ms = 0.0
+        start = time.perf_counter()
+        for event in self.session["events"]:
+            if speed == "recorded":
+                due = start + event[0] / 1000
+                while time.perf_counter() < due:
+                    QApplication.processEvents()
+                    time.sleep(0.001)
+                lag_ms = max(lag_ms, (time.perf_counter() - due) * 1000)
+            event_start = time.perf_counter()
+            self._dispatch(event)
+            durations.setdefault(event[1], []).append(time.perf_counter() - event_start)
+            if speed == "max":
+                QApplication.processEvents() # Let queued work (repaints, timers) happen as it would between events
+        total = time.perf_counter() - start
+        by_type = {}
+        for code, times in durations.items():
+            ordered = sorted(times)
+            by_type[code] = {
+                "count": len(times),
+                "total_ms": sum(times) * 1000,
+                "mean_ms": sum(times) * 1000 / len(times),
+                "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return {"events": len(self.session["events"]), "seconds": total, "max_lag_ms": lag_ms, "by_type": by_type}
+
+
 class CanvasWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -746,11 +4528,12 @@ class CanvasWindow(QMainWindow):
 
         self.scene = QGraphicsScene()
         self.scene.setBackgroundBrush(QColor("white"))
-        self.view = CustomGraphicsView(self.scene, self)
-        self.view.setRenderHint(QPainter.RenderHint.Antialiasing)
+        self.view = CustomGraphicsView(self.scene, self) # Sets its own render hints
+        RENDER_SETTINGS.attach(self.view)
         self.setCentralWidget(self.view)
 
         self.current_tool = "select"
+        self.input_recorder = None # InputRecorder while View > Input Recording > Record Input is on
         self.selected_item = None
         self.active_resize_handles = [] 
         self.zoom_factor = 1.0 
@@ -878,6 +4661,71 @@ class CanvasWindow(QMainWindow):
         view_menu.addSeparator()
         view_menu.addAction(change_canvas_bg_action) # Also add to menu for discoverability
 
+        grid_menu = view_menu.addMenu("Grid")
+        self.show_grid_action = QAction("Show Grid", self)
+        self.show_grid_action.setCheckable(True)
+        self.show_grid_action.setShortcut(QKeySequence("Ctrl+'"))
+        self.show_grid_action.toggled.connect(self._update_grid)
+        grid_menu.addAction(self.show_grid_action)
+        grid_menu.addSeparator()
+        self.grid_style_actions = QActionGroup(self)
+        for style in GRID_STYLES:
+            style_action = QAction(style.capitalize(), self)
+            style_action.setCheckable(True)
+            style_action.setData(style)
+            style_action.setChecked(style == GRID_STYLES[0])
+            style_action.toggled.connect(self._update_grid)
+            self.grid_style_actions.addAction(style_action)
+            grid_menu.addAction(style_action)
+
+        snapping_menu = view_menu.addMenu("Snapping")
+        snap_objects_action = QAction("Snap to Objects", self)
+        snap_objects_action.setCheckable(True)
+        snap_objects_action.setChecked(True)
+        snap_objects_action.toggled.connect(lambda checked: setattr(self.view, "snap_to_objects", checked))
+        snapping_menu.addAction(snap_objects_action)
+        snap_grid_action = QAction("Snap to Grid", self) # While the grid is shown
+        snap_grid_action.setCheckable(True)
+        snap_grid_action.setChecked(True)
+        snap_grid_action.toggled.connect(lambda checked: setattr(self.view, "snap_to_grid", checked))
+        snapping_menu.addAction(snap_grid_action)
+
+        frame_hud_action = QAction("Frame Timing HUD", self)
+        frame_hud_action.setCheckable(True)
+        frame_hud_action.setShortcut(QKeySequence("F12"))
+        frame_hud_action.toggled.connect(lambda checked: self.view.set_frame_hud_enabled(checked))
+        view_menu.addAction(frame_hud_action)
+
+        trace_menu = view_menu.addMenu("Tracing")
+        self.record_trace_action = QAction("Record Trace", self)
+        self.record_trace_action.setCheckable(True)
+        self.record_trace_action.setChecked(TRACER.enabled)
+        self.record_trace_action.toggled.connect(self.set_tracing_enabled)
+        trace_menu.addAction(self.record_trace_action)
+        export_trace_action = QAction("Export Trace...", self)
+        export_trace_action.triggered.connect(self.export_trace)
+        trace_menu.addAction(export_trace_action)
+        clear_trace_action = QAction("Clear Trace", self)
+        clear_trace_action.triggered.connect(TRACER.clear)
+        trace_menu.addAction(clear_trace_action)
+
+        input_menu = view_menu.addMenu("Input Recording")
+        self.record_input_action = QAction("Record Input", self)
+        self.record_input_action.setCheckable(True)
+        self.record_input_action.toggled.connect(self.set_input_recording)
+        input_menu.addAction(self.record_input_action)
+        replay_input_action = QAction("Replay Recording...", self)
+        replay_input_action.triggered.connect(self.replay_input_recording_prompt)
+        input_menu.addAction(replay_input_action)
+
+        image_budget_action = QAction("Image Memory Budget...", self)
+        image_budget_action.triggered.connect(self.change_image_memory_budget)
+        view_menu.addAction(image_budget_action)
+
+        render_settings_action = QAction("Rendering Settings...", self)
+        render_settings_action.triggered.connect(self.show_render_settings)
+        view_menu.addAction(render_settings_action)
+
         # --- Arrange Menu (New) ---
         arrange_menu = menubar.addMenu("Arrange")
 
@@ -921,6 +4769,42 @@ class CanvasWindow(QMainWindow):
         save_image_as_action.triggered.connect(self.save_selected_image_as)
         file_menu.addAction(save_image_as_action)
 
+        import_table_action = QAction("Import Table (CSV/TSV)...", self)
+        import_table_action.triggered.connect(self.import_table_file_prompt)
+        file_menu.addAction(import_table_action)
+
+        add_image_folder_action = QAction("Add Images from Folder...", self)
+        add_image_folder_action.triggered.connect(self.add_image_folder_prompt)
+        file_menu.addAction(add_image_folder_action)
+
+        self.image_import_batches = []
+
+        # Images are decoded at a working resolution; zooming in re-decodes visible ones from their source file
+        self.image_redecode_signals = ImageRedecodeSignals(self)
+        self.image_redecode_signals.redecoded.connect(self._on_image_redecoded)
+        self.image_resolution_timer = QTimer(self)
+        self.image_resolution_timer.setSingleShot(True)
+        self.image_resolution_timer.setInterval(200)
+        self.image_resolution_timer.timeout.connect(self._check_visible_image_resolution)
+
+        # Decoded pixels are kept within a budget; off-screen images are evicted and decoded back on demand
+        self.image_residency = ImageResidencyManager(self, IMAGE_MEMORY_BUDGET_MB * 1024 * 1024, IMAGE_SPILL_DIR)
+        TiledImageItem.residency_manager = self.image_residency
+
+        # Bulk shapes live in the document model; the virtualizer gives them real items only near the viewport
+        self.document = DocumentModel(parent=self)
+        self.virtualizer = SceneVirtualizer(self.view, self.document, self)
+        self.view.snap_index = SnapIndex(self.view, self.virtualizer, self)
+
+        # --- Background table import progress ---
+        self.table_import_jobs = []
+        self.table_progress_bar = QProgressBar()
+        self.table_progress_bar.setRange(0, 100)
+        self.table_progress_bar.setMaximumWidth(200)
+        self.table_progress_bar.setFormat("Importing table... %p%")
+        self.table_progress_bar.setVisible(False)
+        self.statusBar().addPermanentWidget(self.table_progress_bar)
+
         # --- Edit Menu (for Undo/Redo) ---
         edit_menu = menubar.addMenu("Edit")
         undo_action = self.undo_stack.createUndoAction(self, "&Undo")
@@ -931,6 +4815,12 @@ class CanvasWindow(QMainWindow):
         redo_action.setShortcut(QKeySequence.StandardKey.Redo)
         edit_menu.addAction(redo_action)
 
+        edit_menu.addSeparator()
+        duplicate_image_action = QAction("Duplicate Image", self)
+        duplicate_image_action.setShortcut(QKeySequence("Ctrl+D"))
+        duplicate_image_action.triggered.connect(self.duplicate_selected_image)
+        edit_menu.addAction(duplicate_image_action)
+
         # Add Undo/Redo to toolbar for quick access
         self.toolbar.addSeparator()
         self.toolbar.addAction(undo_action)
@@ -944,169 +4834,39 @@ class CanvasWindow(QMainWindow):
         self.prop_label = QLabel("Select an item to see properties.")
         self.properties_layout.addWidget(self.prop_label)
 
-        self.fill_color_button = QPushButton("Change Fill Color")
-        self.fill_color_button.clicked.connect(self.change_selected_item_fill_color)
-        self.properties_layout.addWidget(self.fill_color_button)
-        self.current_fill_color_label = QLabel("Fill: N/A")
-        self.properties_layout.addWidget(self.current_fill_color_label)
-
-        self.outline_color_button = QPushButton("Change Outline Color")
-        self.outline_color_button.clicked.connect(self.change_selected_item_outline_color)
-        self.properties_layout.addWidget(self.outline_color_button)
-        self.current_outline_color_label = QLabel("Outline: N/A")
-        self.properties_layout.addWidget(self.current_outline_color_label)
-
-        # Remove Background Button (for images)
-        self.remove_bg_button = QPushButton("Remove Background")
-        self.remove_bg_button.clicked.connect(self.remove_selected_image_background)
-        self.properties_layout.addWidget(self.remove_bg_button)
-        self.remove_bg_button.setVisible(False)
-
-        # Brightness Controls (for images)
-        self.brightness_label = QLabel("Brightness:")
-        self.properties_layout.addWidget(self.brightness_label)
-        self.brightness_slider = QSlider(Qt.Orientation.Horizontal)
-        self.brightness_slider.setMinimum(0) # 0% brightness
-        self.brightness_slider.setMaximum(200) # 200% brightness
-        self.brightness_slider.setValue(100) # Default 100% (no change)
-        self.brightness_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
-        self.brightness_slider.setTickInterval(25)
-        self.brightness_slider.valueChanged.connect(self.on_brightness_slider_changed)
-        self.properties_layout.addWidget(self.brightness_slider)
-        self.brightness_value_label = QLabel("100%")
-        self.properties_layout.addWidget(self.brightness_value_label)
-
-        # Crop Mode Buttons (for images)
-        self.start_crop_button = QPushButton("Crop Image")
-        self.start_crop_button.clicked.connect(self.enter_crop_mode)
-        self.properties_layout.addWidget(self.start_crop_button)
-
-        self.apply_crop_button = QPushButton("Apply Crop")
-        self.apply_crop_button.clicked.connect(lambda: self.exit_crop_mode(apply_changes=True))
-        self.properties_layout.addWidget(self.apply_crop_button)
-
-        self.cancel_crop_button = QPushButton("Cancel Crop")
-        self.cancel_crop_button.clicked.connect(lambda: self.exit_crop_mode(apply_changes=False))
-        self.properties_layout.addWidget(self.cancel_crop_button)
-
-        # Rotation Controls (for images)
-        self.rotation_label = QLabel("Rotation:")
-        self.properties_layout.addWidget(self.rotation_label)
-        self.rotation_slider = QSlider(Qt.Orientation.Horizontal)
-        self.rotation_slider.setMinimum(0)
-        self.rotation_slider.setMaximum(359) # Degrees
-        self.rotation_slider.setValue(0)
-        self.rotation_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
-        self.rotation_slider.setTickInterval(45)
-        self.rotation_slider.valueChanged.connect(self.on_rotation_slider_changed)
-        self.properties_layout.addWidget(self.rotation_slider)
-        self.rotation_value_label = QLabel("0°")
-        self.properties_layout.addWidget(self.rotation_value_label)
-
-        # --- Image Size Controls (New) ---
-        self.image_size_label = QLabel("Current Size:") # Overall label
-        self.properties_layout.addWidget(self.image_size_label)
-        
-        self.image_width_label = QLabel("W:")
-        self.image_width_spinbox = QSpinBox()
-        self.image_width_spinbox.setRange(1, 10000) # Min 1px, Max 10000px
-        # self.image_width_spinbox.valueChanged.connect(self.on_image_width_changed)
-        self.image_width_spinbox.editingFinished.connect(self.on_image_width_editing_finished)
-        
-        self.image_height_label = QLabel("H:")
-        self.image_height_spinbox = QSpinBox()
-        self.image_height_spinbox.setRange(1, 10000)
-        # self.image_height_spinbox.valueChanged.connect(self.on_image_height_changed)
-        self.image_height_spinbox.editingFinished.connect(self.on_image_height_editing_finished)
-
-        # Layout for width and height side-by-side
-        size_control_layout = QHBoxLayout() 
-        size_control_layout.addWidget(self.image_width_label)
-        size_control_layout.addWidget(self.image_width_spinbox)
-        size_control_layout.addSpacing(10) 
-        size_control_layout.addWidget(self.image_height_label)
-        size_control_layout.addWidget(self.image_height_spinbox)
-        size_control_layout.addStretch() 
-        self.properties_layout.addLayout(size_control_layout)
-
-        # --- Save Image Button (Moved/New) ---
-        self.save_image_button = QPushButton("Save Image As...")
-        self.save_image_button.clicked.connect(self.save_selected_image_as)
-        self.properties_layout.addWidget(self.save_image_button)
-
-        # --- Text Color Controls (New) ---
-        self.text_color_label = QLabel("Text Color:")
-        self.properties_layout.addWidget(self.text_color_label)
-        self.change_text_color_button = QPushButton("Change Text Color")
-        self.change_text_color_button.clicked.connect(self.change_selected_item_text_color)
-        self.properties_layout.addWidget(self.change_text_color_button)
-        self.current_text_color_preview = QLabel("● Text") # Placeholder, will be styled
-        self.properties_layout.addWidget(self.current_text_color_preview)
-
-        # --- Font Family and Size Controls (New) ---
-        self.font_family_label = QLabel("Font Family:")
-        self.properties_layout.addWidget(self.font_family_label)
-        self.font_family_combo = QFontComboBox(self)
-        self.font_family_combo.currentFontChanged.connect(self.on_selected_item_font_family_changed)
-        self.properties_layout.addWidget(self.font_family_combo)
-
-        self.font_size_label = QLabel("Font Size:")
-        self.properties_layout.addWidget(self.font_size_label)
-        self.font_size_spinbox = QSpinBox(self)
-        self.font_size_spinbox.setRange(1, 200) # Min 1pt, Max 200pt
-        self.font_size_spinbox.setValue(10) # Default initial value
-        self.font_size_spinbox.editingFinished.connect(self.on_selected_item_font_size_editing_finished) # Use editingFinished
-        self.properties_layout.addWidget(self.font_size_spinbox)
-
-        # Pen Tool Properties (visible when pen tool is active)
-        self.pen_color_label = QLabel("Pen Color:")
-        self.properties_layout.addWidget(self.pen_color_label)
-        self.change_pen_color_button = QPushButton("Change Pen Color")
-        self.change_pen_color_button.clicked.connect(self.change_pen_color)
-        self.properties_layout.addWidget(self.change_pen_color_button)
-        self.current_pen_color_preview = QLabel("●") # Placeholder, will be styled
-        self.properties_layout.addWidget(self.current_pen_color_preview)
-
-        self.pen_width_label = QLabel("Pen Width:")
-        self.properties_layout.addWidget(self.pen_width_label)
-        self.pen_width_spinbox = QSpinBox()
-        self.pen_width_spinbox.setMinimum(1)
-        self.pen_width_spinbox.setMaximum(50)
-        self.pen_width_spinbox.setValue(int(self.current_pen_width))
-        self.pen_width_spinbox.valueChanged.connect(self.on_pen_width_changed)
-        self.properties_layout.addWidget(self.pen_width_spinbox)
-        
-        self.properties_layout.addStretch() # Ensure this is at the end of adding property widgets
-
-        # Initial visibility states for properties
-        self.brightness_label.setVisible(False)
-        self.brightness_slider.setVisible(False)
-        self.brightness_value_label.setVisible(False)
-        self.start_crop_button.setVisible(False)
-        self.apply_crop_button.setVisible(False)
-        self.cancel_crop_button.setVisible(False)
-        self.rotation_label.setVisible(False) # Hide by default
-        self.rotation_slider.setVisible(False)
-        self.rotation_value_label.setVisible(False)
-        self.pen_color_label.setVisible(False)
-        self.change_pen_color_button.setVisible(False)
-        self.current_pen_color_preview.setVisible(False)
-        self.pen_width_label.setVisible(False)
-        self.pen_width_spinbox.setVisible(False)
-        self.text_color_label.setVisible(False)
-        self.change_text_color_button.setVisible(False)
-        self.current_text_color_preview.setVisible(False)
-
-        # Hide new font controls by default
-        self.font_family_label.setVisible(False)
-        self.font_family_combo.setVisible(False)
-        self.font_size_label.setVisible(False)
-        self.font_size_spinbox.setVisible(False)
+        # One empty, hidden container per section; _properties_section() builds the widgets the first time
+        # a selection (or the pen tool) needs them, so startup does not pay for controls that may never show
+        self.properties_sections = {}
+        for section_name in PROPERTIES_SECTIONS:
+            section = QWidget()
+            section_layout = QVBoxLayout(section)
+            section_layout.setContentsMargins(0, 0, 0, 0)
+            section.built = False
+            section.setVisible(False)
+            self.properties_layout.addWidget(section)
+            self.properties_sections[section_name] = section
+        self.font_families = [] # Filled from the cached snapshot, then from the live font database
 
         self.properties_layout.addStretch() # Pushes controls to the top
         self.properties_dock.setWidget(self.properties_widget)
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.properties_dock)
 
+        # --- Memory Diagnostics Panel (hidden until opened from the View menu) ---
+        self.memory_dock = MemoryDiagnosticsDock(self)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.memory_dock)
+        self.memory_dock.hide()
+        memory_dock_action = self.memory_dock.toggleViewAction()
+        memory_dock_action.setText("Memory Diagnostics")
+        view_menu.addAction(memory_dock_action)
+
+        # --- Navigator (hidden until opened from the View menu) ---
+        self.navigator_dock = NavigatorDock(self)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.navigator_dock)
+        self.navigator_dock.hide()
+        navigator_action = self.navigator_dock.toggleViewAction()
+        navigator_action.setShortcut(QKeySequence("Ctrl+Shift+N"))
+        view_menu.addAction(navigator_action)
+
         self.scene.selectionChanged.connect(self.on_scene_selection_changed)
         self.set_tool("select") # Initialize tool
         self._update_properties_panel_for_selection() # Initial state
@@ -1116,7 +4876,7 @@ class CanvasWindow(QMainWindow):
         try:
             # A very basic check. If self.scene is None, we can't proceed.
             if not hasattr(self, 'scene') or self.scene is None:
-                print("on_scene_selection_changed: self.scene is None or not available.")
+                log_selection.warning("on_scene_selection_changed: self.scene is None or not available.")
                 return
 
             selected_items = self.scene.selectedItems() 
@@ -1126,28 +4886,29 @@ class CanvasWindow(QMainWindow):
 
             if selected_items:
                 new_selection = selected_items[0]
+                self.image_residency.ensure_resident(new_selection) # Handles and the panel need the real pixels
                 if self.selected_item != new_selection: # Selection truly changed
                     self.selected_item = new_selection
                 # Always ensure handles are (re)created for the current single selection
-                if isinstance(self.selected_item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsPixmapItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem, QGraphicsItemGroup)):
+                if isinstance(self.selected_item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsPixmapItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem, QGraphicsItemGroup, TableItem)):
                     self._create_resize_handles_for_item(self.selected_item)
-                print(f"Selected: {self.selected_item}")
+                log_selection.debug_sampled(16, "Selected: %s", self.selected_item) # Fires per rubber-band step
             else:
                 self.selected_item = None
-                print("Selection cleared")
+                log_selection.debug_sampled(16, "Selection cleared")
 
             self._update_properties_panel_for_selection()
 
             if self.current_crop_item and self.current_crop_item != self.selected_item:
                  if old_selected_item == self.current_crop_item:
-                     print("Selection changed away from item in crop mode. Cancelling crop.")
+                     log_crop.info("Selection changed away from item in crop mode. Cancelling crop.")
                      self.exit_crop_mode(apply_changes=False)
 
         except RuntimeError as e:
             # Check for common messages indicating a deleted C++ object
             error_msg = str(e).lower()
             if "already deleted" in error_msg or "cannot call method" in error_msg or "null object" in error_msg:
-                print(f"on_scene_selection_changed: Caught RuntimeError (C++ object likely deleted): {e}")
+                log_selection.warning("on_scene_selection_changed: Caught RuntimeError (C++ object likely deleted): %s", e)
                 # Attempt graceful cleanup or just prevent crash
                 if hasattr(self, 'selected_item'): self.selected_item = None
                 self._remove_resize_handles() # Try to clean handles
@@ -1167,7 +4928,7 @@ class CanvasWindow(QMainWindow):
             # Default or if a non-shape tool is active but we want to show last shape
             self.shape_tool_button.setText(self.current_shape_tool_action.text()) 
 
-    def set_tool(self, tool_name):
+    def set_tool(self, tool_name, prompt_for_color=True):
         # Temporarily disconnect pen width spinbox to prevent unintended updates during tool switch
         if hasattr(self, 'pen_width_spinbox'): # Check if it exists
             try: self.pen_width_spinbox.valueChanged.disconnect(self.on_pen_width_changed) 
@@ -1175,9 +4936,9 @@ class CanvasWindow(QMainWindow):
 
         previous_tool = self.current_tool
         self.current_tool = tool_name
-        print(f"Tool changed to: {self.current_tool}")
+        log_tool.info("Tool changed to: %s", self.current_tool)
 
-        if tool_name == "pen" and previous_tool != "pen": # Only prompt if switching TO pen tool
+        if tool_name == "pen" and previous_tool != "pen" and prompt_for_color: # Only prompt if switching TO pen tool (not when scripted)
             # Prompt for color when Pen tool is selected
             new_color = QColorDialog.getColor(self.current_pen_color, self, "Choose Pen Color",
                                               options=QColorDialog.ColorDialogOption.DontUseNativeDialog)
@@ -1185,6 +4946,9 @@ class CanvasWindow(QMainWindow):
                 self.current_pen_color = new_color
             # If user cancels, current_pen_color remains as it was
 
+        if self.input_recorder is not None:
+            self.input_recorder.record_tool(tool_name, self.current_pen_color)
+
         # Uncheck main tools if a shape tool is selected from dropdown
         if tool_name in ["rectangle", "ellipse", "line", "pen", "triangle", "text"]:
             for action in self.main_tool_actions_group:
@@ -1241,14 +5005,13 @@ class CanvasWindow(QMainWindow):
 
     def _create_resize_handles_for_item(self, parent_item):
         self._remove_resize_handles() 
-        theme_colors = self.current_theme_colors
 
         item_rect_for_handles = None
         if isinstance(parent_item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsPixmapItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem)):
             item_rect_for_handles = parent_item.boundingRect()
             # Basic check for validity, though boundingRect should generally be valid if item is visible
             if item_rect_for_handles.isEmpty() and not (isinstance(parent_item, QGraphicsLineItem) and parent_item.line().length() == 0): # Allow zero-length line if just drawn
-                 print(f"Cannot create handles for item {parent_item} with empty bounding rect.")
+                 log_resize.warning("Cannot create handles for item %s with empty bounding rect.", parent_item)
                  return 
         else:
             return # No handles for other types
@@ -1259,8 +5022,8 @@ class CanvasWindow(QMainWindow):
         
         se_handle = QGraphicsRectItem(0, 0, HANDLE_SIZE, HANDLE_SIZE, parent_item) 
         se_handle.setPos(QPointF(se_pos_x, se_pos_y)) 
-        se_handle.setBrush(theme_colors["selected_handle_fill"])
-        se_handle.setPen(QPen(theme_colors["selected_handle_outline"]))
+        STYLES.set_brush(se_handle, STYLES.role_brush_id("selected_handle_fill"))
+        STYLES.set_pen(se_handle, STYLES.role_pen_id("selected_handle_outline"))
         se_handle.is_resize_handle = True
         se_handle.handle_type = "se"
         self.active_resize_handles.append(se_handle)
@@ -1286,230 +5049,282 @@ class CanvasWindow(QMainWindow):
             if handle.handle_type == "se":
                 se_pos_x = item_rect_for_handles.right() - HANDLE_SIZE / 2
                 se_pos_y = item_rect_for_handles.bottom() - HANDLE_SIZE / 2
-                handle.setPos(QPointF(se_pos_x, se_pos_y))
-                handle.setBrush(self.current_theme_colors["selected_handle_fill"])
-                handle.setPen(QPen(self.current_theme_colors["selected_handle_outline"]))
+                handle.setPos(QPointF(se_pos_x, se_pos_y)) # Handle colors follow the theme through their role styles
+
+    # --- Properties Panel Sections ---
+    def _properties_section(self, name):
+        # Returns a properties-panel section, building its widgets the first time it is needed
+        section = self.properties_sections[name]
+        if not section.built:
+            section.built = True
+            getattr(self, f"_build_{name}_properties")(section.layout())
+        return section
+
+    def _show_properties_sections(self, names):
+        for name, section in self.properties_sections.items():
+            if name in names:
+                self._properties_section(name).setVisible(True)
+            elif section.built: # Sections never built are hidden already
+                section.setVisible(False)
+
+    def _build_shape_properties(self, layout):
+        self.fill_color_button = QPushButton("Change Fill Color")
+        self.fill_color_button.clicked.connect(self.change_selected_item_fill_color)
+        layout.addWidget(self.fill_color_button)
+        self.current_fill_color_label = QLabel("Fill: N/A")
+        layout.addWidget(self.current_fill_color_label)
 
-    def _update_properties_panel_for_selection(self):
-        # Default to all conditional widgets hidden
-        self.fill_color_button.setVisible(False)
-        self.current_fill_color_label.setVisible(False)
-        self.outline_color_button.setVisible(False)
-        self.current_outline_color_label.setVisible(False)
-        self.remove_bg_button.setVisible(False)
-        self.brightness_label.setVisible(False)
-        self.brightness_slider.setVisible(False)
-        self.brightness_value_label.setVisible(False)
-        self.start_crop_button.setVisible(False)
-        self.apply_crop_button.setVisible(False)
-        self.cancel_crop_button.setVisible(False)
-        self.rotation_label.setVisible(False) 
-        self.rotation_slider.setVisible(False)
-        self.rotation_value_label.setVisible(False)
-        self.pen_color_label.setVisible(False)
-        self.change_pen_color_button.setVisible(False)
-        self.current_pen_color_preview.setVisible(False)
-        self.pen_width_label.setVisible(False)
-        self.pen_width_spinbox.setVisible(False)
-        self.text_color_label.setVisible(False)
-        self.change_text_color_button.setVisible(False)
-        self.current_text_color_preview.setVisible(False)
-
-        # Hide new image controls initially
-        self.image_size_label.setVisible(False)
-        self.image_width_label.setVisible(False)
-        self.image_width_spinbox.setVisible(False)
-        self.image_height_label.setVisible(False)
-        self.image_height_spinbox.setVisible(False)
-        self.save_image_button.setVisible(False)
+        self.outline_color_button = QPushButton("Change Outline Color")
+        self.outline_color_button.clicked.connect(self.change_selected_item_outline_color)
+        layout.addWidget(self.outline_color_button)
+        self.current_outline_color_label = QLabel("Outline: N/A")
+        layout.addWidget(self.current_outline_color_label)
 
-        theme_colors = self.current_theme_colors
+    def _build_image_properties(self, layout):
+        # Remove Background Button
+        self.remove_bg_button = QPushButton("Remove Background")
+        self.remove_bg_button.clicked.connect(self.remove_selected_image_background)
+        layout.addWidget(self.remove_bg_button)
 
-        if self.selected_item:
-            item = self.selected_item
-            item_type_str = type(item).__name__ # Default item type string
-
-            # Determine capabilities
-            can_fill_outline = isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsPolygonItem))
-            is_line = isinstance(item, QGraphicsLineItem)
-            is_pen_stroke = isinstance(item, QGraphicsPathItem) and hasattr(item, 'item_type') and item.item_type == 'pen_stroke'
-            is_managed_image = isinstance(item, QGraphicsPixmapItem) and hasattr(item, 'pil_original_image')
-            can_rotate = isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem, QGraphicsPixmapItem, QGraphicsItemGroup))
-            is_text_item = isinstance(item, QGraphicsTextItem)
-
-            if can_fill_outline:
-                item_type_str = "Shape" # Generic shape, can be refined
-                if isinstance(item, QGraphicsRectItem): item_type_str = "Rectangle"
-                elif isinstance(item, QGraphicsEllipseItem): item_type_str = "Ellipse"
-                elif isinstance(item, QGraphicsPolygonItem) and hasattr(item, 'shape_type') and item.shape_type == 'triangle': item_type_str = "Triangle"
-                elif isinstance(item, QGraphicsPolygonItem): item_type_str = "Polygon"
-                
-                self.fill_color_button.setVisible(True)
-                self.current_fill_color_label.setVisible(True)
-                self.outline_color_button.setVisible(True)
-                self.current_outline_color_label.setVisible(True)
-                fill_color = item.brush().color()
-                self.current_fill_color_label.setText(f"Fill: {fill_color.name()}")
-                self.current_fill_color_label.setStyleSheet(f"background-color: {fill_color.name()}; color: {self.get_contrasting_text_color(fill_color, theme_colors).name()}")
-                outline_color = item.pen().color()
-                self.current_outline_color_label.setText(f"Outline: {outline_color.name()}")
-                self.current_outline_color_label.setStyleSheet(f"background-color: {outline_color.name()}; color: {self.get_contrasting_text_color(outline_color, theme_colors).name()}")
+        # Brightness Controls
+        self.brightness_label = QLabel("Brightness:")
+        layout.addWidget(self.brightness_label)
+        self.brightness_slider = QSlider(Qt.Orientation.Horizontal)
+        self.brightness_slider.setMinimum(0) # 0% brightness
+        self.brightness_slider.setMaximum(200) # 200% brightness
+        self.brightness_slider.setValue(100) # Default 100% (no change)
+        self.brightness_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
+        self.brightness_slider.setTickInterval(25)
+        self.brightness_slider.valueChanged.connect(self.on_brightness_slider_changed)
+        layout.addWidget(self.brightness_slider)
+        self.brightness_value_label = QLabel("100%")
+        layout.addWidget(self.brightness_value_label)
 
-            if is_line:
-                item_type_str = "Line"
-                self.outline_color_button.setVisible(True)
-                self.current_outline_color_label.setVisible(True)
-                self.current_fill_color_label.setText("Fill: N/A")
-                self.current_fill_color_label.setStyleSheet(f"color: {theme_colors['text_color'].name()}; background-color: transparent;")
-                outline_color = item.pen().color()
-                self.current_outline_color_label.setText(f"Outline: {outline_color.name()}")
-                self.current_outline_color_label.setStyleSheet(f"background-color: {outline_color.name()}; color: {self.get_contrasting_text_color(outline_color, theme_colors).name()}")
-
-            if is_pen_stroke:
-                item_type_str = "Pen Stroke"
-                self.pen_color_label.setVisible(True)
-                self.change_pen_color_button.setVisible(True)
-                self.change_pen_color_button.setText("Change Stroke Color")
-                self.current_pen_color_preview.setVisible(True)
-                self.current_pen_color_preview.setStyleSheet(f"color: {item.pen().color().name()}; font-size: 20px;")
-                self.pen_width_label.setVisible(True)
-                self.pen_width_spinbox.setVisible(True)
-                self.pen_width_spinbox.blockSignals(True)
-                self.pen_width_spinbox.setValue(int(item.pen().widthF()))
-                self.pen_width_spinbox.blockSignals(False)
-                # Hide shape fill/outline if it's a pen stroke, as it's controlled by pen props
-                self.fill_color_button.setVisible(False)
-                self.current_fill_color_label.setVisible(False)
-                self.outline_color_button.setVisible(False)
-                self.current_outline_color_label.setVisible(False)
-
-            if is_managed_image:
-                item_type_str = "Image"
-                self.remove_bg_button.setVisible(True)
-                self.brightness_label.setVisible(True)
-                self.brightness_slider.setVisible(True)
-                self.brightness_value_label.setVisible(True)
-                self.start_crop_button.setVisible(True)
-                self.apply_crop_button.setVisible(self.current_crop_item == item)
-                self.cancel_crop_button.setVisible(self.current_crop_item == item)
-                self.save_image_button.setVisible(True) 
-
-                self.image_size_label.setVisible(True)
-                self.image_width_label.setVisible(True)
-                self.image_width_spinbox.setVisible(True)
-                self.image_height_label.setVisible(True)
-                self.image_height_spinbox.setVisible(True)
-                self._update_image_size_spinboxes(item) # Call helper here
-                
-                if not self.current_crop_item or self.current_crop_item != item:
-                    slider_val = int(item.current_brightness_factor * 100)
-                    self.brightness_slider.blockSignals(True)
-                    self.brightness_slider.setValue(slider_val)
-                    self.brightness_slider.blockSignals(False)
-                    self.brightness_value_label.setText(f"{slider_val}%")
-                
-                # Hide shape fill/outline for images
-                self.fill_color_button.setVisible(False)
-                self.current_fill_color_label.setVisible(False)
-                self.current_fill_color_label.setText("Fill: N/A")
-                self.current_fill_color_label.setStyleSheet(f"color: {theme_colors['text_color'].name()}; background-color: transparent;")
-                self.current_outline_color_label.setText("Outline: N/A")
-                self.current_outline_color_label.setStyleSheet(f"color: {theme_colors['text_color'].name()}; background-color: transparent;")
-
-            if can_rotate:
-                self.rotation_label.setVisible(True)
-                self.rotation_slider.setVisible(True)
-                self.rotation_value_label.setVisible(True)
-                self.rotation_slider.blockSignals(True)
-                self.rotation_slider.setValue(int(item.rotation()))
-                self.rotation_slider.blockSignals(False)
-                self.rotation_value_label.setText(f"{int(item.rotation())}°")
-            
-            # If not an image, ensure image-specific controls are hidden
-            if not is_managed_image:
-                self.image_size_label.setVisible(False)
-                self.image_width_label.setVisible(False)
-                self.image_width_spinbox.setVisible(False)
-                self.image_height_label.setVisible(False)
-                self.image_height_spinbox.setVisible(False)
-                self.save_image_button.setVisible(False)
-                self.remove_bg_button.setVisible(False)
-                self.brightness_label.setVisible(False)
-                self.brightness_slider.setVisible(False)
-                self.brightness_value_label.setVisible(False)
-                self.start_crop_button.setVisible(False)
-                self.apply_crop_button.setVisible(False)
-                self.cancel_crop_button.setVisible(False)
-
-            if is_text_item:
-                item_type_str = "Text"
-                self.text_color_label.setVisible(True)
-                self.change_text_color_button.setVisible(True)
-                current_color = item.defaultTextColor()
-                self.current_text_color_preview.setText(f"Color: {current_color.name()}")
-                self.current_text_color_preview.setStyleSheet(f"background-color: {current_color.name()}; color: {self.get_contrasting_text_color(current_color, theme_colors).name()}")
-                
-                self.font_family_label.setVisible(True)
-                self.font_family_combo.setVisible(True)
-                self.font_size_label.setVisible(True)
-                self.font_size_spinbox.setVisible(True)
-
-                current_font = item.font()
-                self.font_family_combo.blockSignals(True)
-                self.font_family_combo.setCurrentFont(current_font)
-                self.font_family_combo.blockSignals(False)
-
-                self.font_size_spinbox.blockSignals(True)
-                self.font_size_spinbox.setValue(current_font.pointSize() if current_font.pointSize() > 0 else 10) # Default to 10 if pointSize is 0 or -1
-                self.font_size_spinbox.blockSignals(False)
-
-                # Hide other properties not relevant to simple text item for now
-                self.fill_color_button.setVisible(False)
-                self.current_fill_color_label.setVisible(False)
-                self.outline_color_button.setVisible(False)
-                self.current_outline_color_label.setVisible(False)
-            else: # Not a text item, ensure text controls are hidden
-                self.text_color_label.setVisible(False)
-                self.change_text_color_button.setVisible(False)
-                self.current_text_color_preview.setVisible(False)
-                # Also hide font controls if no selection
-                self.font_family_label.setVisible(False)
-                self.font_family_combo.setVisible(False)
-                self.font_size_label.setVisible(False)
-                self.font_size_spinbox.setVisible(False)
-
-            self.prop_label.setText(f"Selected: {item_type_str}")
-
-        else: # No item selected
-            self.prop_label.setText("Selected: None")
-            self.current_fill_color_label.setText("Fill: N/A")
-            self.current_fill_color_label.setStyleSheet(f"color: {theme_colors['text_color'].name()}; background-color: transparent;")
-            self.current_outline_color_label.setText("Outline: N/A")
-            self.current_outline_color_label.setStyleSheet(f"color: {theme_colors['text_color'].name()}; background-color: transparent;")
-            # Ensure text item specific properties are hidden as well if no selection
-            self.text_color_label.setVisible(False)
-            self.change_text_color_button.setVisible(False)
-            self.current_text_color_preview.setVisible(False)
+        # Crop Mode Buttons
+        self.start_crop_button = QPushButton("Crop Image")
+        self.start_crop_button.clicked.connect(self.enter_crop_mode)
+        layout.addWidget(self.start_crop_button)
+
+        self.apply_crop_button = QPushButton("Apply Crop")
+        self.apply_crop_button.clicked.connect(lambda: self.exit_crop_mode(apply_changes=True))
+        layout.addWidget(self.apply_crop_button)
+
+        self.cancel_crop_button = QPushButton("Cancel Crop")
+        self.cancel_crop_button.clicked.connect(lambda: self.exit_crop_mode(apply_changes=False))
+        layout.addWidget(self.cancel_crop_button)
+
+        # Image Size Controls
+        self.image_size_label = QLabel("Current Size:") # Overall label
+        layout.addWidget(self.image_size_label)
+
+        self.image_width_label = QLabel("W:")
+        self.image_width_spinbox = QSpinBox()
+        self.image_width_spinbox.setRange(1, 10000) # Min 1px, Max 10000px
+        self.image_width_spinbox.editingFinished.connect(self.on_image_width_editing_finished)
 
+        self.image_height_label = QLabel("H:")
+        self.image_height_spinbox = QSpinBox()
+        self.image_height_spinbox.setRange(1, 10000)
+        self.image_height_spinbox.editingFinished.connect(self.on_image_height_editing_finished)
+
+        # Layout for width and height side-by-side
+        size_control_layout = QHBoxLayout()
+        size_control_layout.addWidget(self.image_width_label)
+        size_control_layout.addWidget(self.image_width_spinbox)
+        size_control_layout.addSpacing(10)
+        size_control_layout.addWidget(self.image_height_label)
+        size_control_layout.addWidget(self.image_height_spinbox)
+        size_control_layout.addStretch()
+        layout.addLayout(size_control_layout)
+
+        self.save_image_button = QPushButton("Save Image As...")
+        self.save_image_button.clicked.connect(self.save_selected_image_as)
+        layout.addWidget(self.save_image_button)
+
+    def _build_rotation_properties(self, layout):
+        self.rotation_label = QLabel("Rotation:")
+        layout.addWidget(self.rotation_label)
+        self.rotation_slider = QSlider(Qt.Orientation.Horizontal)
+        self.rotation_slider.setMinimum(0)
+        self.rotation_slider.setMaximum(359) # Degrees
+        self.rotation_slider.setValue(0)
+        self.rotation_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
+        self.rotation_slider.setTickInterval(45)
+        self.rotation_slider.valueChanged.connect(self.on_rotation_slider_changed)
+        layout.addWidget(self.rotation_slider)
+        self.rotation_value_label = QLabel("0°")
+        layout.addWidget(self.rotation_value_label)
+
+    def _build_text_properties(self, layout):
+        self.text_color_label = QLabel("Text Color:")
+        layout.addWidget(self.text_color_label)
+        self.change_text_color_button = QPushButton("Change Text Color")
+        self.change_text_color_button.clicked.connect(self.change_selected_item_text_color)
+        layout.addWidget(self.change_text_color_button)
+        self.current_text_color_preview = QLabel("● Text") # Placeholder, will be styled
+        layout.addWidget(self.current_text_color_preview)
+
+        # Plain family names instead of QFontComboBox, which renders a preview of every installed font.
+        # The list starts from the previous run's snapshot and is refreshed off the GUI thread.
+        self.font_family_label = QLabel("Font Family:")
+        layout.addWidget(self.font_family_label)
+        self.font_family_combo = QComboBox(self)
+        self.font_family_combo.currentTextChanged.connect(self.on_selected_item_font_family_changed)
+        layout.addWidget(self.font_family_combo)
+        self._set_font_family_choices(load_cached_font_families())
+        self.font_family_signals = FontFamiliesSignals(self)
+        self.font_family_signals.families_ready.connect(self._set_font_family_choices)
+        QThreadPool.globalInstance().start(FontFamiliesTask(self.font_family_signals))
+
+        self.font_size_label = QLabel("Font Size:")
+        layout.addWidget(self.font_size_label)
+        self.font_size_spinbox = QSpinBox(self)
+        self.font_size_spinbox.setRange(1, 200) # Min 1pt, Max 200pt
+        self.font_size_spinbox.setValue(10) # Default initial value
+        self.font_size_spinbox.editingFinished.connect(self.on_selected_item_font_size_editing_finished) # Use editingFinished
+        layout.addWidget(self.font_size_spinbox)
+
+    def _build_pen_properties(self, layout):
+        self.pen_color_label = QLabel("Pen Color:")
+        layout.addWidget(self.pen_color_label)
+        self.change_pen_color_button = QPushButton("Change Pen Color")
+        self.change_pen_color_button.clicked.connect(self.change_pen_color)
+        layout.addWidget(self.change_pen_color_button)
+        self.current_pen_color_preview = QLabel("●") # Placeholder, will be styled
+        layout.addWidget(self.current_pen_color_preview)
+
+        self.pen_width_label = QLabel("Pen Width:")
+        layout.addWidget(self.pen_width_label)
+        self.pen_width_spinbox = QSpinBox()
+        self.pen_width_spinbox.setMinimum(1)
+        self.pen_width_spinbox.setMaximum(50)
+        self.pen_width_spinbox.setValue(int(self.current_pen_width))
+        self.pen_width_spinbox.valueChanged.connect(self.on_pen_width_changed)
+        layout.addWidget(self.pen_width_spinbox)
+
+    def _set_font_family_choices(self, families):
+        if families == self.font_families:
+            return
+        self.font_families = families
+        combo = self.font_family_combo
+        current_family = combo.currentText()
+        combo.blockSignals(True)
+        combo.clear()
+        combo.addItems(families)
+        if current_family:
+            self._select_font_family(current_family)
+        combo.blockSignals(False)
+
+    def _select_font_family(self, family):
+        # Callers block the combo's signals; a family missing from the list (not enumerated yet) is added
+        index = self.font_family_combo.findText(family)
+        if index < 0:
+            self.font_family_combo.insertItem(0, family)
+            index = 0
+        self.font_family_combo.setCurrentIndex(index)
+
+    def _update_properties_panel_for_selection(self):
+        theme_colors = self.current_theme_colors
+        item = self.selected_item
+
+        if not item:
+            self.prop_label.setText("Selected: None")
             # Show pen tool's global properties if pen tool is active
             if self.current_tool == "pen":
-                self.pen_color_label.setVisible(True)
-                self.change_pen_color_button.setVisible(True)
-                self.change_pen_color_button.setText("Change Pen Color")
-                self.current_pen_color_preview.setVisible(True)
-                self.current_pen_color_preview.setStyleSheet(f"color: {self.current_pen_color.name()}; font-size: 20px;")
-                self.pen_width_label.setVisible(True)
-                self.pen_width_spinbox.setVisible(True)
-                self.pen_width_spinbox.blockSignals(True)
-                self.pen_width_spinbox.setValue(int(self.current_pen_width))
-                self.pen_width_spinbox.blockSignals(False)
+                self._show_properties_sections(("pen",))
+                self._show_pen_properties("Change Pen Color", self.current_pen_color, self.current_pen_width)
             else:
-                # Ensure pen tool's own properties are hidden if no selection and pen tool isn't active
-                self.pen_color_label.setVisible(False)
-                self.change_pen_color_button.setVisible(False)
-                self.current_pen_color_preview.setVisible(False)
-                self.pen_width_label.setVisible(False)
-                self.pen_width_spinbox.setVisible(False)
+                self._show_properties_sections(())
+            return
+
+        item_type_str = type(item).__name__ # Default item type string
+
+        # Determine capabilities
+        can_fill_outline = isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsPolygonItem))
+        is_line = isinstance(item, QGraphicsLineItem)
+        is_pen_stroke = isinstance(item, QGraphicsPathItem) and hasattr(item, 'item_type') and item.item_type == 'pen_stroke'
+        is_managed_image = isinstance(item, QGraphicsPixmapItem) and hasattr(item, 'pil_original_image')
+        can_rotate = isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem, QGraphicsPixmapItem, QGraphicsItemGroup, TableItem))
+        is_text_item = isinstance(item, QGraphicsTextItem)
+
+        # Each item kind gets at most one main section; a whole section is shown or hidden at once
+        sections = []
+        if is_pen_stroke:
+            sections.append("pen")
+        elif is_managed_image:
+            sections.append("image")
+        elif is_text_item:
+            sections.append("text")
+        elif can_fill_outline or is_line:
+            sections.append("shape")
+        if can_rotate:
+            sections.append("rotation")
+        self._show_properties_sections(sections)
+
+        if can_fill_outline or is_line:
+            if is_line:
+                item_type_str = "Line"
+            elif isinstance(item, QGraphicsRectItem): item_type_str = "Rectangle"
+            elif isinstance(item, QGraphicsEllipseItem): item_type_str = "Ellipse"
+            elif isinstance(item, QGraphicsPolygonItem) and hasattr(item, 'shape_type') and item.shape_type == 'triangle': item_type_str = "Triangle"
+            elif isinstance(item, QGraphicsPolygonItem): item_type_str = "Polygon"
+
+            self.fill_color_button.setVisible(not is_line) # Lines only have an outline
+            self.current_fill_color_label.setVisible(not is_line)
+            if not is_line:
+                fill_color = item.brush().color()
+                self.current_fill_color_label.setText(f"Fill: {fill_color.name()}")
+                self.current_fill_color_label.setStyleSheet(f"background-color: {fill_color.name()}; color: {self.get_contrasting_text_color(fill_color, theme_colors).name()}")
+            outline_color = item.pen().color()
+            self.current_outline_color_label.setText(f"Outline: {outline_color.name()}")
+            self.current_outline_color_label.setStyleSheet(f"background-color: {outline_color.name()}; color: {self.get_contrasting_text_color(outline_color, theme_colors).name()}")
+
+        if is_pen_stroke:
+            item_type_str = "Pen Stroke"
+            self._show_pen_properties("Change Stroke Color", item.pen().color(), item.pen().widthF())
+
+        if is_managed_image:
+            item_type_str = "Image"
+            self.apply_crop_button.setVisible(self.current_crop_item == item)
+            self.cancel_crop_button.setVisible(self.current_crop_item == item)
+            self._update_image_size_spinboxes(item)
+
+            if not self.current_crop_item or self.current_crop_item != item:
+                slider_val = int(item.current_brightness_factor * 100)
+                self.brightness_slider.blockSignals(True)
+                self.brightness_slider.setValue(slider_val)
+                self.brightness_slider.blockSignals(False)
+                self.brightness_value_label.setText(f"{slider_val}%")
+
+        if is_text_item:
+            item_type_str = "Text"
+            current_color = item.defaultTextColor()
+            self.current_text_color_preview.setText(f"Color: {current_color.name()}")
+            self.current_text_color_preview.setStyleSheet(f"background-color: {current_color.name()}; color: {self.get_contrasting_text_color(current_color, theme_colors).name()}")
+
+            current_font = item.font()
+            self.font_family_combo.blockSignals(True)
+            self._select_font_family(current_font.family())
+            self.font_family_combo.blockSignals(False)
+
+            self.font_size_spinbox.blockSignals(True)
+            self.font_size_spinbox.setValue(current_font.pointSize() if current_font.pointSize() > 0 else 10) # Default to 10 if pointSize is 0 or -1
+            self.font_size_spinbox.blockSignals(False)
+
+        if can_rotate:
+            self.rotation_slider.blockSignals(True)
+            self.rotation_slider.setValue(int(item.rotation()))
+            self.rotation_slider.blockSignals(False)
+            self.rotation_value_label.setText(f"{int(item.rotation())}°")
+
+        self.prop_label.setText(f"Selected: {item_type_str}")
+
+    def _show_pen_properties(self, button_text, color, width):
+        self.change_pen_color_button.setText(button_text)
+        self.current_pen_color_preview.setStyleSheet(f"color: {color.name()}; font-size: 20px;")
+        self.pen_width_spinbox.blockSignals(True)
+        self.pen_width_spinbox.setValue(int(width))
+        self.pen_width_spinbox.blockSignals(False)
 
     def get_contrasting_text_color(self, bg_color, theme_colors=None):
         # Use current theme's text color as a fallback if bg_color is transparent or similar to it
@@ -1535,7 +5350,7 @@ class CanvasWindow(QMainWindow):
             current_color = self.selected_item.brush().color()
             new_color = QColorDialog.getColor(current_color, self, "Choose Fill Color")
             if new_color.isValid():
-                self.selected_item.setBrush(QBrush(new_color))
+                STYLES.set_brush(self.selected_item, STYLES.brush_id(new_color))
                 self._update_properties_panel_for_selection() # Update display
 
     def change_selected_item_outline_color(self):
@@ -1543,49 +5358,82 @@ class CanvasWindow(QMainWindow):
             current_color = self.selected_item.pen().color()
             new_color = QColorDialog.getColor(current_color, self, "Choose Outline Color")
             if new_color.isValid():
-                pen = self.selected_item.pen() # Get the current pen
-                pen.setColor(new_color)      # Modify its color
-                self.selected_item.setPen(pen) # Apply the modified pen
+                STYLES.set_pen(self.selected_item, STYLES.pen_id_like(self.selected_item.pen(), color=new_color)) # Same pen, new color
                 self.selected_item.update()   # Explicitly schedule a repaint for the item
                 self._update_properties_panel_for_selection() # Update display
 
     def add_image_prompt(self):
-        file_path, _ = QFileDialog.getOpenFileName(
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self, 
-            "Select an Image", 
+            "Select Images", 
             "", # Start directory
             "Images (*.png *.xpm *.jpg *.jpeg *.bmp *.gif)"
         )
-        if file_path:
-            pixmap = QPixmap(file_path)
-            if not pixmap.isNull():
-                image_item = QGraphicsPixmapItem(pixmap)
-                image_item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsSelectable)
-                image_item.setFlag(QGraphicsPixmapItem.GraphicsItemFlag.ItemIsMovable)
-                
-                # Store PIL image versions
-                q_img_original = pixmap.toImage() # Get QImage from initial pixmap
-                pil_img_original = qimage_to_pil(q_img_original)
-                image_item.pil_original_image = pil_img_original
-                image_item.pil_after_bg_removal = None
-                image_item.pil_for_display = pil_img_original.copy()
-                image_item.current_brightness_factor = 1.0
-                # Ensure pixmap reflects pil_for_display if any conversion differences
-                # image_item.setPixmap(QPixmap.fromImage(pil_to_qimage(image_item.pil_for_display))) # Already set from file load
-
-                # Position in the center of the current view
-                view_rect = self.view.viewport().rect()
-                scene_center_point = self.view.mapToScene(view_rect.center())
-                # Adjust for image size to center it
-                img_rect = image_item.boundingRect()
-                image_item.setPos(scene_center_point - QPointF(img_rect.width()/2, img_rect.height()/2))
-
-                # self.scene.addItem(image_item) # Old direct add
-                command = AddItemCommand(image_item, self.scene, "Add Image")
-                self.undo_stack.push(command)
-            else:
-                print(f"Error: Could not load image from {file_path}") # Or show a QMessageBox
+        if file_paths:
+            self.import_image_files(file_paths)
 
+    def add_image_folder_prompt(self):
+        folder_path = QFileDialog.getExistingDirectory(self, "Select Image Folder")
+        if not folder_path:
+            return
+        file_paths = sorted(
+            entry.path for entry in os.scandir(folder_path)
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_FILE_EXTENSIONS)
+        )
+        if not file_paths:
+            QMessageBox.information(self, "No Images", "The selected folder does not contain any supported images.")
+            return
+        self.import_image_files(file_paths)
+
+    @traced("import_images")
+    def import_image_files(self, file_paths, scene_pos=None):
+        # Decoding happens on the thread pool; placeholders are laid out (grid for several files) right away
+        if scene_pos is None:
+            scene_pos = self.view.mapToScene(self.view.viewport().rect().center())
+        batch = ImageImportBatch(self, file_paths, scene_pos)
+        self.image_import_batches.append(batch)
+        batch.start()
+
+    def _on_image_import_finished(self, batch):
+        if batch in self.image_import_batches:
+            self.image_import_batches.remove(batch)
+        batch.deleteLater()
+        self.schedule_image_resolution_check() # The view may have zoomed in while decoding
+        if batch.errors:
+            QMessageBox.warning(self, "Image Import",
+                                f"Could not load {len(batch.errors)} of {len(batch.file_paths)} image(s):\n" + "\n".join(batch.errors[:10]))
+
+    def duplicate_selected_image(self):
+        item = self.selected_item
+        if not isinstance(item, TiledImageItem) or getattr(item, 'is_loading_image', False):
+            QMessageBox.information(self, "No Image Selected", "Please select an image to duplicate.")
+            return
+        self.image_residency.ensure_resident(item)
+
+        # The copy references the same pixels (PIL images, implicitly shared pixmap, mip levels);
+        # whichever item is erased, cropped or re-processed later builds its own private copy then
+        duplicate = TiledImageItem()
+        duplicate.setPixmap(item.pixmap())
+        duplicate._mip_levels = item._mip_levels
+        duplicate.pixel_buffer = item.pixel_buffer
+        for attribute in ('pil_original_image', 'pil_after_bg_removal', 'pil_for_display', 'current_brightness_factor',
+                          'source_path', 'source_size', 'source_rect', 'has_erased_pixels', 'is_rasterized_for_erase'):
+            if hasattr(item, attribute):
+                setattr(duplicate, attribute, getattr(item, attribute))
+        duplicate.modifiable_qimage = None
+        duplicate.setOffset(item.offset())
+        duplicate.setTransformOriginPoint(item.transformOriginPoint())
+        duplicate.setTransform(item.transform())
+        duplicate.setScale(item.scale())
+        duplicate.setRotation(item.rotation())
+        duplicate.setZValue(item.zValue())
+        duplicate.setFlags(item.flags())
+        duplicate.setPos(item.pos() + QPointF(20, 20))
+
+        self.scene.clearSelection()
+        self.undo_stack.push(AddItemCommand(duplicate, self.scene, "Duplicate Image"))
+
+    @traced("remove_background")
     def remove_selected_image_background(self):
         if not self.selected_item or not isinstance(self.selected_item, QGraphicsPixmapItem):
             QMessageBox.information(self, "No Image Selected", "Please select an image to remove its background.")
@@ -1600,7 +5448,7 @@ class CanvasWindow(QMainWindow):
             pil_image_to_process = self.selected_item.pil_original_image.copy() # Always use original for BG removal input
             
             # Perform background removal
-            processed_pil_image = remove(pil_image_to_process) 
+            processed_pil_image = remove_background(pil_image_to_process) 
             
             self.selected_item.pil_after_bg_removal = processed_pil_image
             # Brightness factor remains, will be applied by _apply_image_effects
@@ -1610,15 +5458,167 @@ class CanvasWindow(QMainWindow):
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to remove background: {e}")
-            print(f"Error removing background: {e}")
+            log_image.error("Error removing background: %s", e)
 
     def zoom_in(self):
+        self.view.begin_interaction() # Repeated clicks count as one zoom gesture
         self.view.scale(1.2, 1.2)
         self.zoom_factor *= 1.2
+        self.schedule_image_resolution_check()
 
     def zoom_out(self):
+        self.view.begin_interaction()
         self.view.scale(0.8, 0.8)
         self.zoom_factor *= 0.8
+        self.schedule_image_resolution_check()
+
+    # --- Working Resolution Management ---
+    def view_device_scale(self):
+        # Device pixels per scene unit in the view (zoom and high-DPI screens)
+        transform = self.view.transform()
+        return math.hypot(transform.m11(), transform.m12()) * self.view.devicePixelRatioF()
+
+    def schedule_image_resolution_check(self):
+        # Debounced, so a burst of wheel steps only triggers one check
+        self.image_resolution_timer.start()
+
+    def _can_redecode_image(self, item):
+        # Only images whose pixels are still a pure function of the source file (plus effects) can be re-decoded
+        return (isinstance(item, QGraphicsPixmapItem) and hasattr(item, 'pil_original_image')
+                and getattr(item, 'evicted_state', None) is None and getattr(item, 'source_path', None) and item.pil_after_bg_removal is None
+                and not getattr(item, 'has_erased_pixels', False) and item != self.current_crop_item)
+
+    def _required_image_edge(self, item, device_scale):
+        # Long edge (in pixels) the item's working image needs so it isn't magnified, capped at the source region
+        item_transform = item.sceneTransform()
+        item_scale = math.hypot(item_transform.m11(), item_transform.m12())
+        pixmap = item.pixmap()
+        needed = max(pixmap.width(), pixmap.height()) * item_scale * device_scale
+        native_width, native_height = item.source_size
+        region = item.source_rect or (0, 0, native_width, native_height)
+        return min(needed, max(region[2] - region[0], region[3] - region[1]))
+
+    def _check_visible_image_resolution(self):
+        device_scale = self.view_device_scale()
+        visible_rect = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        for item in self.scene.items(visible_rect):
+            if not self._can_redecode_image(item) or getattr(item, 'redecode_pending', False):
+                continue
+            current_edge = max(item.pixmap().width(), item.pixmap().height())
+            required_edge = self._required_image_edge(item, device_scale)
+            if required_edge > current_edge * REDECODE_THRESHOLD:
+                item.redecode_pending = True
+                max_edge = math.ceil(required_edge * REDECODE_HEADROOM)
+                QThreadPool.globalInstance().start(
+                    ImageRedecodeTask(self.image_redecode_signals, item, item.source_path, max_edge, item.source_rect))
+
+    def _on_image_redecoded(self, item, buffer, source_rect):
+        item.redecode_pending = False
+        # Drop results made stale by edits (crop, background removal, erasing) while decoding
+        if buffer is None or not self._can_redecode_image(item) or item.source_rect != source_rect:
+            return
+        self._replace_working_image(item, buffer)
+
+    def ensure_image_resolution(self, item, required_edge):
+        # Synchronous re-decode for operations that need the pixels now (e.g. export)
+        if not self._can_redecode_image(item):
+            return
+        current_edge = max(item.pixmap().width(), item.pixmap().height())
+        if required_edge <= current_edge:
+            return
+        try:
+            pil_image, _ = decode_image_file(item.source_path, max_edge=math.ceil(required_edge), source_rect=item.source_rect)
+        except Exception as e:
+            log_image.error("Error re-decoding %s: %s", item.source_path, e)
+            return
+        self._replace_working_image(item, SharedPixelBuffer.intern(pil_image))
+
+    def set_input_recording(self, enabled):
+        if enabled:
+            self.input_recorder = InputRecorder(self)
+            log_diagnostics.info("Input recording started.")
+            return
+        recorder = self.input_recorder
+        self.input_recorder = None
+        if recorder is None:
+            return
+        recorder.stop()
+        recorder.deleteLater()
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Input Recording", "session.canvasrec", INPUT_RECORDING_FILTER)
+        if file_path:
+            try:
+                count = recorder.save(file_path)
+                log_diagnostics.info("Saved %d input events to %s", count, file_path)
+            except OSError as e:
+                QMessageBox.critical(self, "Save Error", f"Could not save input recording: {e}")
+
+    def replay_input_recording_prompt(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Replay Input Recording", "", INPUT_RECORDING_FILTER)
+        if not file_path:
+            return
+        try:
+            session = load_input_recording(file_path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Replay Error", f"Could not read input recording: {e}")
+            return
+        report = InputReplayer(self, session).run(speed="recorded")
+        lines = [f"{code}: {stats['count']} events, mean {stats['mean_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms"
+                 for code, stats in sorted(report["by_type"].items())]
+        QMessageBox.information(self, "Replay Finished",
+                                f"Replayed {report['events']} events in {report['seconds']:.2f} s (max lag {report['max_lag_ms']:.1f} ms).\n\n" + "\n".join(lines))
+
+    def set_tracing_enabled(self, enabled):
+        TRACER.enabled = enabled
+        log_diagnostics.info("Tracing %s (%d spans buffered).", "started" if enabled else "stopped", len(TRACER.events))
+
+    def export_trace(self):
+        if not TRACER.events:
+            QMessageBox.information(self, "Export Trace", "No spans recorded. Enable View > Tracing > Record Trace (or start with CANVAS_TRACE=1) and repeat the slow operation.")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "canvas_trace.json", "Chrome Trace (*.json)")
+        if not file_path:
+            return
+        try:
+            count = TRACER.export(file_path)
+            log_diagnostics.info("Exported %d spans to %s", count, file_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Export Error", f"Could not write trace: {e}")
+
+    def change_image_memory_budget(self):
+        current_mb = self.image_residency.budget_bytes // (1024 * 1024)
+        resident_mb = self.image_residency.resident_bytes() / (1024 * 1024)
+        budget_mb, ok = QInputDialog.getInt(self, "Image Memory Budget",
+                                            f"Decoded image memory budget in MB (currently using {resident_mb:.0f} MB):",
+                                            current_mb, 64, 1024 * 1024)
+        if ok:
+            self.image_residency.budget_bytes = budget_mb * 1024 * 1024
+            self.image_residency.enforce_budget()
+
+    def _update_grid(self):
+        checked = self.grid_style_actions.checkedAction()
+        self.view.set_grid_style(checked.data() if self.show_grid_action.isChecked() and checked else None)
+
+    def show_render_settings(self):
+        dialog = RenderSettingsDialog(RENDER_SETTINGS.values, self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            RENDER_SETTINGS.update(dialog.values())
+            RENDER_SETTINGS.save()
+
+    def _replace_working_image(self, item, buffer):
+        pil_image = buffer.pil_image
+        old_width = item.pixmap().width()
+        if pil_image.width <= old_width:
+            return
+        # Keep the on-canvas size: the pixmap grows, so the item's scale shrinks by the same factor
+        factor = old_width / pil_image.width
+        if item.transform().isIdentity():
+            item.setScale(item.scale() * factor)
+        else: # Non-uniform size set from the properties panel lives in the item transform
+            item.setTransform(QTransform.fromScale(factor, factor) * item.transform())
+        item.set_pixel_buffer(buffer)
+        self._apply_image_effects(item) # Rebuilds pil_for_display and the pixmap from the new original
+        if item == self.selected_item:
+            self._update_resize_handles_for_item(item)
 
     def on_brightness_slider_changed(self, value):
         if self.selected_item and isinstance(self.selected_item, QGraphicsPixmapItem) and hasattr(self.selected_item, 'pil_original_image'):
@@ -1631,10 +5631,21 @@ class CanvasWindow(QMainWindow):
             if hasattr(self, 'brightness_value_label'): # Check if UI element exists
                  self.brightness_value_label.setText("--%")
 
+    @traced("apply_image_effects")
     def _apply_image_effects(self, image_item):
         if not image_item or not hasattr(image_item, 'pil_original_image'):
             return
 
+        if (isinstance(image_item, TiledImageItem) and image_item.shares_pixel_buffer() and image_item.pil_after_bg_removal is None
+                and getattr(image_item, 'current_brightness_factor', 1.0) == 1.0):
+            # No effect changes the pixels: keep showing the shared buffer instead of a private copy
+            image_item.pil_for_display = image_item.pil_original_image
+            image_item.show_pixel_buffer()
+            image_item.modifiable_qimage = None
+            return
+        if isinstance(image_item, TiledImageItem) and image_item.pixel_buffer is not None and not image_item.shares_pixel_buffer():
+            image_item.pixel_buffer = None # Original was replaced (e.g. cropped): stop holding the shared buffer
+
         base_pil = image_item.pil_after_bg_removal if image_item.pil_after_bg_removal else image_item.pil_original_image
         effect_image = base_pil.copy()
 
@@ -1656,7 +5667,7 @@ class CanvasWindow(QMainWindow):
 
     def apply_theme(self, theme_name):
         if theme_name not in self.themes:
-            print(f"Error: Theme '{theme_name}' not found.")
+            log_theme.error("Theme '%s' not found.", theme_name)
             return
         
         self.current_theme_name = theme_name
@@ -1685,23 +5696,33 @@ class CanvasWindow(QMainWindow):
 
         # Update properties panel labels' text color (buttons are handled by stylesheet)
         self.prop_label.setStyleSheet(f"color: {theme['text_color'].name()};")
-        self.current_fill_color_label.setStyleSheet(f"color: {theme['text_color'].name()}; background-color: transparent;") # Reset bg, color set by value
-        self.current_outline_color_label.setStyleSheet(f"color: {theme['text_color'].name()}; background-color: transparent;") # Reset bg, color set by value
+        if self.properties_sections["shape"].built:
+            self.current_fill_color_label.setStyleSheet(f"color: {theme['text_color'].name()}; background-color: transparent;") # Reset bg, color set by value
+            self.current_outline_color_label.setStyleSheet(f"color: {theme['text_color'].name()}; background-color: transparent;") # Reset bg, color set by value
         self._update_properties_panel_for_selection() # Re-render to apply color previews with new text contrast
 
-        # Update existing items (optional, could be complex if many items)
-        # For now, new items will use the theme. Existing items retain their colors unless explicitly changed.
-        # However, resize handles should update
+        # Items drawn with default colors (and the handles) follow the theme through role styles; items given
+        # explicit colors keep them
+        self._rebind_theme_roles(theme)
         if self.selected_item:
-            self._update_resize_handles_for_item(self.selected_item) # Re-create with new theme colors
+            self._update_resize_handles_for_item(self.selected_item)
         
         self.scene.update() # Redraw scene
-        print(f"Applied {theme_name} theme.")
+        log_theme.info("Applied %s theme.", theme_name)
+
+    @traced("theme_roles", "theme")
+    def _rebind_theme_roles(self, theme):
+        # One batch: each role style is rebuilt once and handed to its items, and the document layer drops its
+        # resolved tools. The per-item updates coalesce into the single scene repaint that follows.
+        updated = STYLES.set_theme(theme)
+        self.virtualizer.layer.refresh_styles()
+        log_theme.debug("Re-resolved theme roles on %d items.", updated)
 
     def delete_selected_item(self):
         if self.selected_item:
             item_to_delete = self.selected_item
             self.scene.removeItem(item_to_delete)
+            self.virtualizer.release_removed() # A document shape leaves the model (hit-testing, snapping) right away
             self._remove_resize_handles() # Clear handles for the deleted item
             self.selected_item = None
             # If the deleted item had specific data stored (e.g. PIL image for QGraphicsPixmapItem)
@@ -1709,9 +5730,9 @@ class CanvasWindow(QMainWindow):
             # For now, basic item removal is handled.
             del item_to_delete # Explicitly delete the Python reference
             self._update_properties_panel_for_selection() # Update panel to show no selection
-            print("Item deleted")
+            log_app.info("Item deleted")
         else:
-            print("No item selected to delete")
+            log_app.info("No item selected to delete")
 
     def change_canvas_background_color(self):
         current_color = self.scene.backgroundBrush().color()
@@ -1722,35 +5743,35 @@ class CanvasWindow(QMainWindow):
             self.scene.update()
 
     def enter_crop_mode(self):
-        print("enter_crop_mode called.")
+        log_crop.debug("enter_crop_mode called.")
         if not self.selected_item:
-            print("enter_crop_mode: No item selected.")
+            log_crop.debug("enter_crop_mode: No item selected.")
             QMessageBox.warning(self, "Cannot Crop", "No item selected. Please select an image loaded by the application to crop.")
             return
         
-        print(f"enter_crop_mode: Selected item is {type(self.selected_item)}, has pil_original_image: {hasattr(self.selected_item, 'pil_original_image')}")
+        log_crop.debug("enter_crop_mode: Selected item is %s, has pil_original_image: %s", type(self.selected_item), hasattr(self.selected_item, 'pil_original_image'))
 
         if not isinstance(self.selected_item, QGraphicsPixmapItem) or not hasattr(self.selected_item, 'pil_original_image'):
-            print("enter_crop_mode: Selected item is not a valid image for cropping.")
+            log_crop.debug("enter_crop_mode: Selected item is not a valid image for cropping.")
             QMessageBox.warning(self, "Cannot Crop", "Please select an image loaded by the application to crop.")
             return
 
-        print("enter_crop_mode: Proceeding with crop mode setup.")
+        log_crop.debug("enter_crop_mode: Proceeding with crop mode setup.")
 
         if self.current_crop_item: # Already cropping another item? Or re-clicked on same item?
-            print(f"enter_crop_mode: Already in crop mode for {self.current_crop_item}. Current selection: {self.selected_item}")
+            log_crop.debug("enter_crop_mode: Already in crop mode for %s. Current selection: %s", self.current_crop_item, self.selected_item)
             if self.current_crop_item == self.selected_item:
                 # Clicked "Crop Image" again for the item already in crop mode - do nothing or treat as cancel?
                 # For now, let's assume this state shouldn't be easily reachable if UI updates correctly.
                 return 
             else:
                 # Switched selection while an old crop was active - cancel old one first
-                print("enter_crop_mode: Switching crop target, cancelling old crop.")
+                log_crop.debug("enter_crop_mode: Switching crop target, cancelling old crop.")
                 self.exit_crop_mode(apply_changes=False) 
 
         item_to_crop = self.selected_item # Store it before it gets deselected
         if not item_to_crop: # Should have been caught earlier, but as a safeguard
-            print("enter_crop_mode: Error - item_to_crop became None unexpectedly.")
+            log_crop.error("enter_crop_mode: item_to_crop became None unexpectedly.")
             return
 
         self.current_crop_item = item_to_crop
@@ -1775,7 +5796,7 @@ class CanvasWindow(QMainWindow):
 
         self._update_properties_panel_for_selection() # Update buttons
         self.view.setFocus() # Ensure view has focus for potential keyboard shortcuts (e.g. Esc for cancel)
-        print(f"Entering crop mode for {self.current_crop_item}")
+        log_crop.info("Entering crop mode for %s", self.current_crop_item)
 
     def _create_crop_handles(self):
         self._remove_crop_handles() # Clear any existing crop handles
@@ -1799,8 +5820,8 @@ class CanvasWindow(QMainWindow):
         for handle_type, pos in handle_positions.items():
             handle = QGraphicsRectItem(0, 0, HANDLE_SIZE, HANDLE_SIZE, parent_for_handles)
             handle.setPos(pos)
-            handle.setBrush(self.current_theme_colors["selected_handle_fill"])
-            handle.setPen(QPen(self.current_theme_colors["selected_handle_outline"], 1))
+            STYLES.set_brush(handle, STYLES.role_brush_id("selected_handle_fill"))
+            STYLES.set_pen(handle, STYLES.role_pen_id("selected_handle_outline"))
             handle.is_crop_handle = True
             handle.handle_type = handle_type
             handle.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsMovable, False)
@@ -1825,9 +5846,6 @@ class CanvasWindow(QMainWindow):
         for handle in self.active_crop_handles:
             if handle.handle_type in new_handle_positions:
                 handle.setPos(new_handle_positions[handle.handle_type])
-                # Also update handle colors in case theme changed while active
-                handle.setBrush(self.current_theme_colors["selected_handle_fill"])
-                handle.setPen(QPen(self.current_theme_colors["selected_handle_outline"], 1))
 
     def _remove_crop_handles(self):
         # Iterate over a copy if modifying the list, or just clear after scene removal
@@ -1836,6 +5854,7 @@ class CanvasWindow(QMainWindow):
                 self.scene.removeItem(handle)
         self.active_crop_handles.clear()
 
+    @traced("exit_crop_mode")
     def exit_crop_mode(self, apply_changes=False):
         if not self.current_crop_item:
             return
@@ -1867,6 +5886,18 @@ class CanvasWindow(QMainWindow):
             # --- Perform actual cropping on PIL images --- 
             cropped_something = False
             try:
+                # Track the cropped region in source-file pixels so the item can still be re-decoded at higher resolution
+                if getattr(item_was_cropped, 'source_path', None) and item_was_cropped.pil_original_image:
+                    native_width, native_height = item_was_cropped.source_size
+                    region = item_was_cropped.source_rect or (0, 0, native_width, native_height)
+                    to_source = (region[2] - region[0]) / item_was_cropped.pil_original_image.width
+                    item_was_cropped.source_rect = (
+                        region[0] + pil_crop_box[0] * to_source,
+                        region[1] + pil_crop_box[1] * to_source,
+                        region[0] + pil_crop_box[2] * to_source,
+                        region[1] + pil_crop_box[3] * to_source,
+                    )
+
                 # A. Crop pil_original_image
                 if item_was_cropped.pil_original_image:
                     item_was_cropped.pil_original_image = item_was_cropped.pil_original_image.crop(pil_crop_box)
@@ -1888,15 +5919,16 @@ class CanvasWindow(QMainWindow):
                 # The new pixmap from _apply_image_effects is based on the cropped PIL images.
                 # Its (0,0) corresponds to the crop_box_item_coords.topLeft().
                 # We need to translate the item by this amount.
+                # The offset is in item (pixel) coordinates, so map it through the item's scale/rotation.
                 offset = crop_box_item_coords.topLeft()
-                item_was_cropped.setPos(item_was_cropped.pos() + offset)
+                item_was_cropped.setPos(item_was_cropped.mapToParent(offset))
                 # Bounding rect of the QGraphicsPixmapItem will change automatically due to new pixmap.
 
-                print(f"Applied crop to {item_was_cropped}")
+                log_crop.info("Applied crop to %s", item_was_cropped)
 
             except Exception as e:
                 QMessageBox.critical(self, "Crop Error", f"Could not apply crop: {e}")
-                print(f"Error during PIL crop: {e}")
+                log_crop.error("Error during PIL crop: %s", e)
         
         # Cleanup UI
         self._remove_crop_handles() # Call this first to remove handles from scene before their parent overlay is gone
@@ -1929,9 +5961,7 @@ class CanvasWindow(QMainWindow):
             if self.current_tool == "pen": # Update preview only if pen tool is active
                 self.current_pen_color_preview.setStyleSheet(f"color: {self.current_pen_color.name()}; font-size: 20px;")
             elif self.selected_item and isinstance(self.selected_item, QGraphicsPathItem) and hasattr(self.selected_item, 'item_type') and self.selected_item.item_type == 'pen_stroke':
-                pen = self.selected_item.pen()
-                pen.setColor(new_color)
-                self.selected_item.setPen(pen)
+                STYLES.set_pen(self.selected_item, STYLES.pen_id_like(self.selected_item.pen(), color=new_color))
                 self.current_pen_color_preview.setStyleSheet(f"color: {new_color.name()}; font-size: 20px;") # Update preview for selected item
                 self.selected_item.update()
 
@@ -1939,17 +5969,17 @@ class CanvasWindow(QMainWindow):
         new_width = float(value)
         if self.current_tool == "pen":
             self.current_pen_width = new_width
-            print(f"Pen tool width changed to: {self.current_pen_width}")
+            log_pen.info_every("pen_width", 0.5, "Pen tool width changed to: %s", self.current_pen_width)
         elif self.selected_item and isinstance(self.selected_item, QGraphicsPathItem) and hasattr(self.selected_item, 'item_type') and self.selected_item.item_type == 'pen_stroke':
-            pen = self.selected_item.pen()
-            pen.setWidthF(new_width)
-            self.selected_item.setPen(pen)
+            STYLES.set_pen(self.selected_item, STYLES.pen_id_like(self.selected_item.pen(), width=new_width))
             self.selected_item.update()
-            print(f"Selected stroke width changed to: {new_width}")
+            log_pen.info_every("stroke_width", 0.5, "Selected stroke width changed to: %s", new_width)
 
     def on_rotation_slider_changed(self, value):
-        if self.selected_item and isinstance(self.selected_item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem, QGraphicsPixmapItem, QGraphicsItemGroup)):
+        if self.selected_item and isinstance(self.selected_item, (QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPolygonItem, QGraphicsPixmapItem, QGraphicsItemGroup, TableItem)):
             angle = float(value)
+            if self.rotation_slider.isSliderDown():
+                self.view.begin_interaction()
             self.selected_item.setRotation(angle)
             self.rotation_value_label.setText(f"{int(angle)}°")
             self._update_resize_handles_for_item(self.selected_item) 
@@ -2031,6 +6061,7 @@ class CanvasWindow(QMainWindow):
             self.scene.update()
 
     # --- Image Saving Method ---
+    @traced("export_image")
     def save_selected_image_as(self):
         if not self.selected_item:
             QMessageBox.information(self, "No Selection", "Please select an item to save.")
@@ -2041,6 +6072,9 @@ class CanvasWindow(QMainWindow):
             return
 
         item_to_save = self.selected_item
+        # Export at the on-canvas size; re-decode from the source file if the working image is smaller than that
+        if getattr(item_to_save, 'source_path', None):
+            self.ensure_image_resolution(item_to_save, self._required_image_edge(item_to_save, 1.0))
         pixmap_to_render = item_to_save.pixmap() # This should have effects applied
 
         if pixmap_to_render.isNull():
@@ -2111,9 +6145,9 @@ class CanvasWindow(QMainWindow):
                 QMessageBox.information(self, "Image Saved", f"Image successfully saved to:\n{file_path}")
             except Exception as e:
                 QMessageBox.critical(self, "Save Error", f"Could not save image:\n{e}")
-                print(f"Error saving image to {file_path}: {e}")
+                log_image.error("Error saving image to %s: %s", file_path, e)
         else:
-            print("Save operation cancelled by user.")
+            log_image.info("Save operation cancelled by user.")
 
     # --- Image Size Change Handlers (New) ---
     def on_image_width_editing_finished(self):
@@ -2207,6 +6241,8 @@ class CanvasWindow(QMainWindow):
 
     def _update_image_size_spinboxes(self, item_or_none):
         """Helper to update spinboxes from item's current state, primarily for selection and after mouse resize."""
+        if not self.properties_sections["image"].built:
+            return
         if item_or_none and isinstance(item_or_none, QGraphicsPixmapItem) and self.image_width_spinbox.isVisible():
             item = item_or_none
             pixmap_w = item.pixmap().width()
@@ -2249,6 +6285,7 @@ class CanvasWindow(QMainWindow):
             self.image_height_spinbox.blockSignals(False)
 
     # --- Table Pasting Method ---
+    @traced("paste_table")
     def paste_table_from_clipboard(self, scene_pos):
         clipboard = QApplication.clipboard()
         mime_data = clipboard.mimeData()
@@ -2262,84 +6299,57 @@ class CanvasWindow(QMainWindow):
             QMessageBox.information(self, "Paste Error", "Clipboard text is empty.")
             return
 
-        # Try to parse as TSV (Tab Separated Values) then CSV
-        parsed_rows = []
-        try:
-            # Use StringIO to treat the string as a file for csv.reader
-            f = StringIO(clipboard_text)
-            # Attempt to sniff the dialect
-            dialect = None
-            try:
-                dialect = csv.Sniffer().sniff(clipboard_text.splitlines()[0]) # Sniff first line
-            except csv.Error:
-                # Sniffing failed, try common delimiters
-                if '\t' in clipboard_text.splitlines()[0]:
-                    dialect = csv.excel_tab
-                else:
-                    dialect = csv.excel # Default to Excel (comma-separated)
-            
-            reader = csv.reader(f, dialect)
-            for row in reader:
-                parsed_rows.append(row)
-        except Exception as e:
-            QMessageBox.warning(self, "Parse Error", f"Could not parse table data: {e}")
-            return
+        # Parsing runs on a worker thread; rows appear progressively as chunks arrive
+        self._start_table_import(scene_pos, text=clipboard_text)
 
-        if not parsed_rows:
+    def import_table_file_prompt(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Import Table",
+            "",
+            "Tables (*.csv *.tsv *.txt);;All Files (*)"
+        )
+        if file_path:
+            view_center = self.view.mapToScene(self.view.viewport().rect().center())
+            self.import_table_file(file_path, view_center)
+
+    def import_table_file(self, file_path, scene_pos):
+        self._start_table_import(scene_pos, file_path=file_path)
+
+    def _start_table_import(self, scene_pos, text=None, file_path=None):
+        job = TableImportJob(self, scene_pos, text=text, file_path=file_path)
+        self.table_import_jobs.append(job)
+        self.table_progress_bar.setValue(0)
+        self.table_progress_bar.setVisible(True)
+        job.start()
+
+    def _on_table_import_finished(self, job):
+        if job in self.table_import_jobs:
+            self.table_import_jobs.remove(job)
+        if not self.table_import_jobs:
+            self.table_progress_bar.setVisible(False)
+        job.deleteLater()
+
+        if job.error:
+            QMessageBox.warning(self, "Parse Error", f"Could not parse table data: {job.error}")
+        elif job.table_item is None:
             QMessageBox.information(self, "Paste Error", "No rows found in pasted table data.")
-            return
-
-        # --- Create Table Graphics ---
-        table_group = QGraphicsItemGroup()
-        table_group.setFlag(QGraphicsItemGroup.GraphicsItemFlag.ItemIsSelectable, True)
-        table_group.setFlag(QGraphicsItemGroup.GraphicsItemFlag.ItemIsMovable, True)
-        # table_group.setFlag(QGraphicsItemGroup.GraphicsItemFlag.ItemSendsGeometryChanges, True) # For future resizing
-
-        # Default cell styling and dimensions
-        cell_padding = 5.0
-        default_cell_width = 100.0 
-        default_cell_height = 30.0
-        theme_colors = self.current_theme_colors
-        cell_border_pen = QPen(theme_colors["item_default_outline"])
-        cell_fill_brush = QBrush(theme_colors["window_bg"]) # Use window_bg for cells, or a lighter properties_bg
-        text_color = theme_colors["text_color"]
-
-        current_y = 0.0
-        max_cols = max(len(row) for row in parsed_rows) if parsed_rows else 0
-
-        for row_idx, row_data in enumerate(parsed_rows):
-            current_x = 0.0
-            row_actual_height = default_cell_height # Could calculate based on text in future
-            for col_idx in range(max_cols):
-                cell_text_content = row_data[col_idx] if col_idx < len(row_data) else ""
-                cell_actual_width = default_cell_width # Could calculate based on text
-
-                # Create cell rectangle (background and border)
-                cell_rect_item = QGraphicsRectItem(0, 0, cell_actual_width, row_actual_height, table_group)
-                cell_rect_item.setPos(current_x, current_y)
-                cell_rect_item.setPen(cell_border_pen)
-                cell_rect_item.setBrush(cell_fill_brush)
-
-                # Create cell text
-                text_item = QGraphicsSimpleTextItem(cell_text_content, table_group)
-                text_item.setPos(current_x + cell_padding, current_y + cell_padding)
-                text_item.setBrush(QBrush(text_color)) 
-                # text_item.setFont(...) # Can set font here
-                
-                # Ensure text does not overflow cell_actual_width - 2*cell_padding (approx)
-                # QGraphicsSimpleTextItem does not auto-wrap or clip aggressively. 
-                # For proper handling, QGraphicsTextItem would be needed, or manual truncation.
-                # This is a simple start.
-
-                current_x += cell_actual_width
-            current_y += row_actual_height
-        
-        table_group.setPos(scene_pos)
-        # self.scene.addItem(table_group) # Old direct add
-        command = AddItemCommand(table_group, self.scene, "Paste Table")
-        self.undo_stack.push(command)
-        # table_group.setSelected(True) # AddItemCommand.redo() handles selection
-        print("Table pasted successfully.")
+        else:
+            log_table.info("Table imported: %d rows.", job.table_item.store.row_count)
+
+    def closeEvent(self, event):
+        # Stop background parsers before their threads are destroyed with the window
+        for job in list(self.table_import_jobs):
+            job.cancel()
+        # Drop queued image decodes and let running ones finish before the batches go away
+        QThreadPool.globalInstance().clear()
+        QThreadPool.globalInstance().waitForDone()
+        self.image_residency.shutdown() # Removes spill files
+        self.virtualizer.shutdown()
+        self.view.snap_index.shutdown()
+        RENDER_SETTINGS.detach(self.view)
+        self.navigator_dock.navigator.set_tracking(False)
+        super().closeEvent(event)
 
     # --- Text Item Specific Methods ---
     def change_selected_item_text_color(self):
@@ -2348,15 +6358,18 @@ class CanvasWindow(QMainWindow):
             new_color = QColorDialog.getColor(current_color, self, "Choose Text Color")
             if new_color.isValid():
                 # TODO: Make this undoable with a ChangePropertyCommand
-                self.selected_item.setDefaultTextColor(new_color)
+                if isinstance(self.selected_item, TextItem):
+                    self.selected_item.set_text_color(new_color) # An explicit color stops following the theme
+                else:
+                    self.selected_item.setDefaultTextColor(new_color)
                 self._update_properties_panel_for_selection() # Update display
                 self.selected_item.update() # Ensure repaint
 
-    def on_selected_item_font_family_changed(self, font):
-        if self.selected_item and isinstance(self.selected_item, QGraphicsTextItem):
+    def on_selected_item_font_family_changed(self, family):
+        if family and self.selected_item and isinstance(self.selected_item, QGraphicsTextItem):
             # We want to change the family, but keep other aspects like size if possible
             current_item_font = self.selected_item.font()
-            current_item_font.setFamily(font.family())
+            current_item_font.setFamily(family)
             # TODO: Make this undoable
             self.selected_item.setFont(current_item_font)
             self._update_properties_panel_for_selection() # Refresh size display if it changed due to family
@@ -2373,7 +6386,20 @@ class CanvasWindow(QMainWindow):
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    configure_logging()
+    STARTUP_PROFILE.mark("imports")
+    startup_flags = ("--startup-profile", "--warm-up-rembg")
+    show_startup_profile = "--startup-profile" in sys.argv
+    warm_up = "--warm-up-rembg" in sys.argv or os.environ.get("CANVAS_REMBG_WARMUP", "") not in ("", "0")
+    app = QApplication([arg for arg in sys.argv if arg not in startup_flags])
+    STARTUP_PROFILE.mark("QApplication")
+    RENDER_SETTINGS.load() # Saved preferences; applied when the window attaches its view
     window = CanvasWindow()
+    STARTUP_PROFILE.mark("window construction")
     window.show()
+    STARTUP_PROFILE.mark("show")
+    if show_startup_profile:
+        STARTUP_PROFILE.after_first_paint(lambda: sys.stderr.write(STARTUP_PROFILE.report()))
+    if warm_up:
+        STARTUP_PROFILE.after_first_paint(warm_up_rembg)
     sys.exit(app.exec()) 
\ No newline at end of file
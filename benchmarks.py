@@ -0,0 +1,670 @@
+# Headless performance benchmarks for the canvas hot paths.
+#
+#   python benchmarks.py                          # run everything, write benchmark_results.json
+#   python benchmarks.py --only pen_stroke,eraser_4k --repeat 5
+#   python benchmarks.py --compare old_results.json   # flag regressions against an earlier run
+#   python benchmarks.py --replay session.canvasrec    # replay a recorded session (View > Input Recording)
+#
+# Runs on Qt's offscreen platform and drives CanvasWindow / CustomGraphicsView through the same
+# events and slots the UI uses. Each scenario gets a fresh window; only the measured part is timed.
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # Must be set before Qt is imported
+
+from PySide6 import __version__ as PYSIDE_VERSION
+from PySide6.QtCore import Qt, QEvent, QPoint, QPointF, QRectF, QThreadPool
+from PySide6.QtGui import QColor, QImage, QMouseEvent, QPainter, QPainterPath, QWheelEvent
+from PySide6.QtWidgets import QApplication, QGraphicsRectItem
+from PIL import Image
+
+import app
+
+VIEW_SIZE = (1280, 800)
+DEFAULT_REGRESSION_THRESHOLD = 0.10 # Slower by more than this fraction counts as a regression
+
+
+# --- Driving helpers ---
+def pump(condition=None, timeout=60.0):
+    # Process events (and let pool tasks finish) until condition() is true or timeout
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        QApplication.processEvents()
+        QThreadPool.globalInstance().waitForDone(5)
+        if condition is None or condition():
+            QApplication.processEvents()
+            return True
+    return False
+
+
+def send_mouse(view, event_type, scene_pos, buttons=Qt.MouseButton.LeftButton):
+    view_pos = QPointF(view.mapFromScene(scene_pos))
+    button = Qt.MouseButton.NoButton if event_type == QEvent.Type.MouseMove else Qt.MouseButton.LeftButton
+    if event_type == QEvent.Type.MouseButtonRelease:
+        buttons = Qt.MouseButton.NoButton
+    event = QMouseEvent(event_type, view_pos, QPointF(view.viewport().mapToGlobal(view_pos.toPoint())),
+                        button, buttons, Qt.KeyboardModifier.NoModifier)
+    QApplication.sendEvent(view.viewport(), event)
+
+
+def drag(view, scene_points):
+    send_mouse(view, QEvent.Type.MouseButtonPress, scene_points[0])
+    for point in scene_points[1:]:
+        send_mouse(view, QEvent.Type.MouseMove, point)
+    send_mouse(view, QEvent.Type.MouseButtonRelease, scene_points[-1])
+
+
+def send_wheel(view, steps, view_pos=None):
+    view_pos = QPointF(view_pos or view.viewport().rect().center())
+    event = QWheelEvent(view_pos, QPointF(view.viewport().mapToGlobal(view_pos.toPoint())), QPoint(0, 0), QPoint(0, 120 * steps),
+                        Qt.MouseButton.NoButton, Qt.KeyboardModifier.NoModifier, Qt.ScrollPhase.NoScrollPhase, False)
+    QApplication.sendEvent(view.viewport(), event)
+
+
+def paint_frame(view):
+    # Synchronous repaint of the whole viewport; returns its duration in seconds
+    start = time.perf_counter()
+    view.viewport().repaint()
+    return time.perf_counter() - start
+
+
+def make_test_image(directory, name, size):
+    # Gradient with some structure so encoders and effects do real work
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        width, height = size
+        gradient = Image.linear_gradient("L").resize(size)
+        image = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.ROTATE_90).resize(size), Image.new("L", size, 128)))
+        image.save(path, quality=90)
+    return path
+
+
+def import_images(window, paths):
+    window.import_image_files(paths)
+    pump(lambda: not window.image_import_batches)
+    return [item for item in window.scene.items() if isinstance(item, app.TiledImageItem)]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# --- Scenarios ---
+# Each scenario takes (window, data_dir), does its setup, and returns (seconds, extra metrics) for the timed part.
+def bench_draw_shapes(window, data_dir, count=10000):
+    window.set_tool("rectangle")
+    columns = 100
+    start = time.perf_counter()
+    for index in range(count):
+        x = (index % columns) * 30.0
+        y = (index // columns) * 30.0
+        drag(window.view, [QPointF(x, y), QPointF(x + 10, y + 10), QPointF(x + 20, y + 20)])
+    seconds = time.perf_counter() - start
+    return seconds, {"shapes": count, "ms_per_shape": seconds * 1000 / count}
+
+
+def bench_pen_stroke(window, data_dir, samples=2000):
+    window.set_tool("pen", prompt_for_color=False)
+    points = [QPointF(i * 0.5, 200 * math.sin(i / 50.0)) for i in range(samples)]
+    start = time.perf_counter()
+    drag(window.view, points)
+    seconds = time.perf_counter() - start
+    return seconds, {"samples": samples, "ms_per_sample": seconds * 1000 / samples}
+
+
+def bench_eraser_4k(window, data_dir, samples=200):
+    path = make_test_image(data_dir, "bench_4k.jpg", (3840, 2160))
+    item = import_images(window, [path])[0]
+    window.scene.clearSelection()
+    window.set_tool("eraser")
+    window.eraser_brush_size = 30.0
+    rect = item.sceneBoundingRect()
+    points = [QPointF(rect.left() + rect.width() * i / samples, rect.center().y() + rect.height() * 0.3 * math.sin(i / 10.0))
+              for i in range(samples)]
+    start = time.perf_counter()
+    drag(window.view, points)
+    seconds = time.perf_counter() - start
+    return seconds, {"samples": samples, "ms_per_sample": seconds * 1000 / samples,
+                     "working_pixels": item.pixmap().width() * item.pixmap().height()}
+
+
+def bench_brightness_sweep(window, data_dir):
+    path = make_test_image(data_dir, "bench_photo.jpg", (2400, 1600))
+    item = import_images(window, [path])[0]
+    window.scene.clearSelection()
+    item.setSelected(True)
+    values = list(range(0, 201, 4))
+    start = time.perf_counter()
+    for value in values:
+        window.brightness_slider.setValue(value)
+    seconds = time.perf_counter() - start
+    return seconds, {"steps": len(values), "ms_per_step": seconds * 1000 / len(values)}
+
+
+def bench_table_paste(window, data_dir, rows=1000, columns=10):
+    text = "\n".join("\t".join(f"r{row}c{column}" for column in range(columns)) for row in range(rows))
+    QApplication.clipboard().setText(text)
+    start = time.perf_counter()
+    window.paste_table_from_clipboard(QPointF(0, 0))
+    pump(lambda: not window.table_import_jobs)
+    frame = paint_frame(window.view)
+    seconds = time.perf_counter() - start
+    return seconds, {"cells": rows * columns, "first_frame_ms": frame * 1000}
+
+
+def bench_z_order(window, data_dir, count=50000, operations=20):
+    for index in range(count):
+        item = QGraphicsRectItem(0, 0, 10, 10)
+        item.setPos((index % 250) * 12.0, (index // 250) * 12.0)
+        item.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsSelectable)
+        window.scene.addItem(item)
+    target = window.scene.items()[count // 2]
+    target.setSelected(True)
+    pump()
+    timings = {}
+    start = time.perf_counter()
+    for name in ("bring_selected_to_front", "send_selected_to_back", "bring_selected_forward", "send_selected_backward"):
+        operation = getattr(window, name)
+        operation_start = time.perf_counter()
+        for _ in range(operations):
+            operation()
+        timings[f"{name}_ms"] = (time.perf_counter() - operation_start) * 1000 / operations
+    seconds = time.perf_counter() - start
+    return seconds, dict(timings, items=count)
+
+
+def _populate_mixed_scene(window, data_dir, shapes=5000):
+    for index in range(shapes):
+        item = QGraphicsRectItem(0, 0, 20, 20)
+        item.setPos((index % 100) * 30.0, (index // 100) * 30.0)
+        item.setBrush(QColor.fromHsv(index % 360, 160, 220))
+        window.scene.addItem(item)
+    paths = [make_test_image(data_dir, f"bench_tile_{index}.jpg", (1600, 1200)) for index in range(4)]
+    import_images(window, paths)
+
+
+def bench_zoom_pan(window, data_dir, steps=30):
+    _populate_mixed_scene(window, data_dir)
+    window.view.fitInView(window.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+    frames = []
+    start = time.perf_counter()
+    for step in range(steps):
+        send_wheel(window.view, 1 if step < steps // 2 else -1)
+        frames.append(paint_frame(window.view))
+    scrollbar = window.view.horizontalScrollBar()
+    for step in range(steps):
+        scrollbar.setValue(scrollbar.value() + 40)
+        frames.append(paint_frame(window.view))
+    seconds = time.perf_counter() - start
+    return seconds, {"frames": len(frames), "frame_p50_ms": percentile(frames, 0.5) * 1000,
+                     "frame_p95_ms": percentile(frames, 0.95) * 1000, "frame_max_ms": max(frames) * 1000}
+
+
+def bench_scene_export(window, data_dir, max_edge=4096):
+    # There is no whole-canvas export command; this renders the scene to an image the way one would
+    _populate_mixed_scene(window, data_dir)
+    source = window.scene.itemsBoundingRect()
+    scale = min(1.0, max_edge / max(source.width(), source.height()))
+    start = time.perf_counter()
+    image = QImage(max(1, int(source.width() * scale)), max(1, int(source.height() * scale)), QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.white)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform) # As the app's own image export does
+    window.scene.render(painter, QRectF(image.rect()), source)
+    painter.end()
+    export_path = os.path.join(data_dir, "bench_export.png")
+    image.save(export_path)
+    seconds = time.perf_counter() - start
+    return seconds, {"width": image.width(), "height": image.height()}
+
+
+def bench_document_pan(window, data_dir, count=250000, steps=30):
+    # Virtualized shapes: model-only primitives, real items only near the viewport
+    kinds = app.PRIMITIVE_KINDS
+    fills = [QColor.fromHsv(hue, 160, 220) for hue in range(0, 360, 30)]
+    outline = QColor("black")
+    start = time.perf_counter()
+    with window.document.bulk_update():
+        for index in range(count):
+            window.document.add(kinds[index % len(kinds)], (index % 1000) * 30.0, (index // 1000) * 30.0, 20.0, 20.0,
+                                fills[index % len(fills)], outline)
+    add_seconds = time.perf_counter() - start
+    window.view.centerOn(600, 400)
+    pump()
+    virtualizer = window.virtualizer
+    frames = []
+    start = time.perf_counter()
+    scrollbar = window.view.horizontalScrollBar()
+    for step in range(steps):
+        scrollbar.setValue(scrollbar.value() + 60)
+        virtualizer.update_materialized() # What the debounce timer does after the pan settles
+        frames.append(paint_frame(window.view))
+    pan_seconds = time.perf_counter() - start
+    window.view.fitInView(window.document.bounds, Qt.AspectRatioMode.KeepAspectRatio)
+    virtualizer.update_materialized()
+    overview_first_ms = paint_frame(window.view) * 1000 # Includes building the layer's cell batches
+    overview_ms = paint_frame(window.view) * 1000
+    return pan_seconds, {"primitives": count, "add_seconds": add_seconds,
+                         "bytes_per_primitive": window.document.estimated_bytes() / count,
+                         "live_items": len(virtualizer.live), "frame_p50_ms": percentile(frames, 0.5) * 1000,
+                         "frame_p95_ms": percentile(frames, 0.95) * 1000, "overview_first_frame_ms": overview_first_ms,
+                         "overview_frame_ms": overview_ms}
+
+
+def bench_document_boxes(window, data_dir, count=50000, steps=30):
+    # A 50k-box diagram zoomed out far enough that the document layer draws it in batches
+    fills = [QColor.fromHsv(hue, 160, 220) for hue in range(0, 360, 60)]
+    outline = QColor("black")
+    with window.document.bulk_update():
+        for index in range(count):
+            window.document.add("rectangle", (index % 250) * 30.0, (index // 250) * 30.0, 20.0, 20.0,
+                                fills[index % len(fills)], outline)
+    window.view.fitInView(window.document.bounds, Qt.AspectRatioMode.KeepAspectRatio)
+    window.view.scale(2.0, 2.0)
+    window.virtualizer.update_materialized()
+    paint_frame(window.view) # Builds the cell batches
+    frames = []
+    scrollbar = window.view.horizontalScrollBar()
+    start = time.perf_counter()
+    for step in range(steps):
+        scrollbar.setValue(scrollbar.value() + (40 if step < steps // 2 else -40))
+        frames.append(paint_frame(window.view))
+    seconds = time.perf_counter() - start
+    return seconds, {"boxes": count, "live_items": len(window.virtualizer.live), "frame_p50_ms": percentile(frames, 0.5) * 1000,
+                     "frame_p95_ms": percentile(frames, 0.95) * 1000}
+
+
+def bench_theme_switch(window, data_dir, count=100000, switches=10):
+    # A 100k-primitive board drawn in the default colors, switched between light and dark
+    with window.document.bulk_update():
+        for index in range(count):
+            window.document.add("rectangle", (index % 400) * 30.0, (index // 400) * 30.0, 20.0, 20.0,
+                                "item_default_fill", "item_default_outline")
+    window.view.fitInView(QRectF(0, 0, 800, 600), Qt.AspectRatioMode.KeepAspectRatio)
+    window.virtualizer.update_materialized() # Materializes the primitives around the viewport
+    paint_frame(window.view)
+    switch_times, frames = [], []
+    start = time.perf_counter()
+    for switch in range(switches):
+        began = time.perf_counter()
+        window.apply_theme("dark" if switch % 2 == 0 else "light")
+        switch_times.append(time.perf_counter() - began)
+        frames.append(paint_frame(window.view))
+    seconds = time.perf_counter() - start
+    return seconds, {"primitives": count, "live_items": len(window.virtualizer.live),
+                     "switch_p50_ms": percentile(switch_times, 0.5) * 1000, "switch_max_ms": max(switch_times) * 1000,
+                     "frame_p50_ms": percentile(frames, 0.5) * 1000}
+
+
+def bench_lod_overview(window, data_dir, strokes=400, texts=2000, frames=10):
+    # Pen strokes, text and a pasted table seen from far out, drawn with and without the level-of-detail rules
+    pen_style = app.STYLES.pen_id(QColor("navy"), 2.0, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+    for index in range(strokes):
+        origin_x, origin_y = (index % 20) * 300.0, (index // 20) * 300.0
+        path = QPainterPath(QPointF(origin_x, origin_y))
+        for sample in range(1, 500):
+            path.lineTo(origin_x + sample * 0.5, origin_y + 100 + 80 * math.sin(sample / 20.0 + index))
+        stroke = app.StrokeItem()
+        stroke.setPath(path)
+        app.STYLES.set_pen(stroke, pen_style)
+        window.scene.addItem(stroke)
+    for index in range(texts):
+        text = app.TextItem()
+        text.setPlainText(f"Note {index}\nsecond line of text\nand a third one")
+        text.setPos(6200 + (index % 40) * 150.0, (index // 40) * 120.0)
+        window.scene.addItem(text)
+    QApplication.clipboard().setText("\n".join("\t".join(f"r{row}c{column}" for column in range(10)) for row in range(2000)))
+    window.paste_table_from_clipboard(QPointF(0, 6200))
+    pump(lambda: not window.table_import_jobs)
+    window.scene.clearSelection()
+    window.view.fitInView(window.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+    paint_frame(window.view) # Fills the caches for both
+    timings = {}
+    try:
+        for enabled in (False, True):
+            app.RENDER_SETTINGS.update({"lod_enabled": enabled, "item_cache": False}) # Item caches would hide the paint cost
+            paint_frame(window.view)
+            timings[enabled] = [paint_frame(window.view) for _ in range(frames)]
+    finally:
+        app.RENDER_SETTINGS.update(app.RENDER_SETTINGS_DEFAULTS)
+    seconds = sum(timings[True])
+    full, simplified = percentile(timings[False], 0.5), percentile(timings[True], 0.5)
+    return seconds, {"frame_p50_ms": simplified * 1000, "full_detail_frame_p50_ms": full * 1000,
+                     "speedup": full / simplified if simplified else 0.0, "lod": window.view.transform().m11()}
+
+
+def bench_navigation_quality(window, data_dir, steps=20):
+    # Wheel zoom over a heavy board with the reduced interactive quality, then the same with full quality throughout
+    _populate_mixed_scene(window, data_dir)
+    for index in range(200):
+        stroke = app.StrokeItem()
+        path = QPainterPath(QPointF((index % 20) * 150.0, 3000 + (index // 20) * 150.0))
+        for sample in range(1, 300):
+            path.lineTo((index % 20) * 150.0 + sample * 0.4, 3000 + (index // 20) * 150.0 + 40 * math.sin(sample / 15.0))
+        stroke.setPath(path)
+        app.STYLES.set_pen(stroke, app.STYLES.pen_id(QColor("black"), 3.0))
+        window.scene.addItem(stroke)
+    window.view.fitInView(window.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+    paint_frame(window.view)
+    timings = {}
+    start = time.perf_counter()
+    for adaptive in (True, False):
+        window.view.adaptive_quality = adaptive
+        frames = []
+        for step in range(steps):
+            send_wheel(window.view, 1 if step < steps // 2 else -1)
+            frames.append(paint_frame(window.view))
+        timings[adaptive] = frames
+        if adaptive:
+            window.view.end_interaction()
+            settle_frame = paint_frame(window.view)
+            seconds = time.perf_counter() - start
+    interactive, full = percentile(timings[True], 0.5), percentile(timings[False], 0.5)
+    return seconds, {"interactive_frame_p50_ms": interactive * 1000, "full_quality_frame_p50_ms": full * 1000,
+                     "settle_frame_ms": settle_frame * 1000}
+
+
+def bench_render_cache(window, data_dir, steps=30):
+    # Panning over tables, text and rotated images with the item/background caches on, then off
+    for index in range(12):
+        QApplication.clipboard().setText("\n".join("\t".join(f"t{index}r{row}c{column}" for column in range(6)) for row in range(40)))
+        window.paste_table_from_clipboard(QPointF((index % 4) * 700.0, (index // 4) * 1300.0))
+    pump(lambda: not window.table_import_jobs)
+    for index in range(600):
+        text = app.TextItem()
+        text.setPlainText(f"Label {index}\nwith a second line")
+        text.setPos(2900 + (index % 20) * 140.0, (index // 20) * 120.0)
+        window.scene.addItem(text)
+    paths = [make_test_image(data_dir, f"bench_rotated_{index}.jpg", (1200, 900)) for index in range(4)]
+    for index, item in enumerate(import_images(window, paths)):
+        item.setRotation(12.0 * (index + 1))
+    window.scene.clearSelection()
+    window.view.resetTransform()
+    window.view.centerOn(2000, 1500)
+    timings = {}
+    try:
+        start = time.perf_counter()
+        for cached in (True, False):
+            app.RENDER_SETTINGS.update({"item_cache": cached, "background_cache": cached})
+            paint_frame(window.view)
+            frames = []
+            scrollbar = window.view.horizontalScrollBar()
+            for step in range(steps):
+                scrollbar.setValue(scrollbar.value() + (60 if step < steps // 2 else -60))
+                frames.append(paint_frame(window.view))
+            timings[cached] = frames
+            if cached:
+                seconds = time.perf_counter() - start
+    finally:
+        app.RENDER_SETTINGS.update(app.RENDER_SETTINGS_DEFAULTS)
+    cached, direct = percentile(timings[True], 0.5), percentile(timings[False], 0.5)
+    return seconds, {"cached_frame_p50_ms": cached * 1000, "uncached_frame_p50_ms": direct * 1000,
+                     "cached_frame_p95_ms": percentile(timings[True], 0.95) * 1000,
+                     "pixmap_cache_kb": app.RENDER_SETTINGS.retune_pixmap_cache()}
+
+
+def bench_grid_pan(window, data_dir, steps=30):
+    # Panning a shape board with the grid off, as lines and as dots (also zoomed far out, where it changes level)
+    for index in range(3000):
+        item = QGraphicsRectItem(0, 0, 20, 20)
+        item.setPos((index % 60) * 30.0, (index // 60) * 30.0)
+        item.setBrush(QColor.fromHsv(index % 360, 160, 220))
+        window.scene.addItem(item)
+
+    def pan_frames():
+        frames = []
+        scrollbar = window.view.horizontalScrollBar()
+        for step in range(steps):
+            scrollbar.setValue(scrollbar.value() + (40 if step < steps // 2 else -40))
+            frames.append(paint_frame(window.view))
+        return percentile(frames, 0.5) * 1000
+
+    metrics = {}
+    start = time.perf_counter()
+    for zoom_name, zoom in (("", 1.0), ("zoomed_out_", 0.02)):
+        window.view.resetTransform()
+        window.view.scale(zoom, zoom)
+        for style in (None,) + app.GRID_STYLES:
+            window.view.set_grid_style(style)
+            paint_frame(window.view)
+            metrics[f"{zoom_name}{style or 'no_grid'}_frame_p50_ms"] = pan_frames()
+    seconds = time.perf_counter() - start
+    window.view.set_grid_style(None)
+    return seconds, metrics
+
+
+def bench_navigator(window, data_dir, count=50000, edits=20):
+    # Navigator overview of a 50k-primitive board: first build, then edits that re-render only their tiles
+    with window.document.bulk_update():
+        for index in range(count):
+            window.document.add("rectangle", (index % 250) * 30.0, (index // 250) * 30.0, 20.0, 20.0,
+                                QColor.fromHsv(index % 360, 160, 220), QColor("black"))
+    shapes = []
+    for index in range(edits):
+        item = QGraphicsRectItem(0, 0, 200, 200)
+        item.setPos(index * 350.0, 6500.0)
+        window.scene.addItem(item)
+        shapes.append(item)
+    window.navigator_dock.show()
+    navigator = window.navigator_dock.navigator
+    pump()
+    start = time.perf_counter()
+    navigator.invalidate()
+    pump(lambda: not navigator.image.isNull() and not navigator.dirty_tiles and not navigator.render_timer.isActive())
+    build = time.perf_counter() - start
+    tiles = len([(column, row) for column in range(math.ceil(navigator.image.width() / app.NAVIGATOR_TILE))
+                 for row in range(math.ceil(navigator.image.height() / app.NAVIGATOR_TILE))])
+    updates = []
+    for item in shapes:
+        item.moveBy(-40.0, -40.0) # Inward, so the scene rect (and the overview layout) stays put
+        pump(lambda: navigator.dirty_tiles, timeout=1.0)
+        update_start = time.perf_counter()
+        navigator.render_dirty_tiles()
+        updates.append(time.perf_counter() - update_start)
+    pan_start = time.perf_counter()
+    for step in range(edits):
+        navigator._pan_to(QPointF(navigator.width() * step / edits, navigator.height() / 2))
+    pan = (time.perf_counter() - pan_start) / edits
+    seconds = time.perf_counter() - start
+    return seconds, {"build_ms": build * 1000, "tiles": tiles, "edit_update_p50_ms": percentile(updates, 0.5) * 1000,
+                     "pan_ms": pan * 1000}
+
+
+def bench_snapping(window, data_dir, count=50000, moves=300):
+    # Dragging a shape across a 50k-primitive board with object and grid snapping: index build, then per-move cost
+    with window.document.bulk_update():
+        for index in range(count):
+            window.document.add("rectangle", (index % 250) * 30.0, (index // 250) * 30.0, 20.0, 20.0,
+                                QColor.fromHsv(index % 360, 160, 220), QColor("black"))
+    window.show_grid_action.setChecked(True)
+    item = QGraphicsRectItem(0, 0, 40, 40)
+    item.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsSelectable)
+    item.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsMovable)
+    item.setPos(3000.0, 3000.0)
+    window.scene.addItem(item)
+    window.view.centerOn(item)
+    window.set_tool("select")
+    pump()
+    index = window.view.snap_index
+    build_start = time.perf_counter()
+    index.flush()
+    build = time.perf_counter() - build_start
+    snap_times = []
+    snap = index.snap
+
+    def timed_snap(*args, **kwargs):
+        snap_start = time.perf_counter()
+        result = snap(*args, **kwargs)
+        snap_times.append(time.perf_counter() - snap_start)
+        return result
+    index.snap = timed_snap
+    move_times = []
+    snapped = 0
+    start = time.perf_counter()
+    send_mouse(window.view, QEvent.Type.MouseButtonPress, QPointF(3020.0, 3020.0))
+    for step in range(moves):
+        point = QPointF(3020.0 + 300 * math.sin(step / 40.0), 3020.0 + step * 0.7)
+        move_start = time.perf_counter()
+        send_mouse(window.view, QEvent.Type.MouseMove, point)
+        move_times.append(time.perf_counter() - move_start)
+        snapped += bool(window.view.snap_guides)
+        QApplication.processEvents() # Repaint and scene.changed, as between real mouse moves
+    send_mouse(window.view, QEvent.Type.MouseButtonRelease, item.scenePos())
+    seconds = time.perf_counter() - start
+    del index.snap
+    return seconds, {"index_build_ms": build * 1000, "anchors": sum(len(values) for values, _, _ in index.axes),
+                     "snap_p50_ms": percentile(snap_times, 0.5) * 1000, "snap_max_ms": max(snap_times) * 1000,
+                     "move_event_p50_ms": percentile(move_times, 0.5) * 1000, "guided_moves": snapped}
+
+
+def make_replay_scenario(file_path, speed):
+    # A recorded input session replayed onto a fresh canvas becomes a scenario of its own
+    session = app.load_input_recording(file_path)
+
+    def bench_replay(window, data_dir):
+        report = app.InputReplayer(window, session).run(speed)
+        return report["seconds"], {key: value for key, value in report.items() if key != "seconds"}
+    return bench_replay
+
+
+SCENARIOS = {
+    "draw_shapes_10k": bench_draw_shapes,
+    "pen_stroke_2000": bench_pen_stroke,
+    "eraser_4k": bench_eraser_4k,
+    "brightness_sweep": bench_brightness_sweep,
+    "table_paste_10k_cells": bench_table_paste,
+    "z_order_50k": bench_z_order,
+    "zoom_pan_frames": bench_zoom_pan,
+    "scene_export": bench_scene_export,
+    "document_pan_250k": bench_document_pan,
+    "document_boxes_50k": bench_document_boxes,
+    "theme_switch_100k": bench_theme_switch,
+    "lod_overview": bench_lod_overview,
+    "navigation_quality": bench_navigation_quality,
+    "render_cache_pan": bench_render_cache,
+    "grid_pan": bench_grid_pan,
+    "navigator_50k": bench_navigator,
+    "snapping_50k": bench_snapping,
+}
+
+
+# --- Runner ---
+def new_window():
+    window = app.CanvasWindow()
+    window.resize(*VIEW_SIZE)
+    window.show()
+    pump()
+    return window
+
+
+def close_window(window):
+    window.scene.clearSelection() # Drops the resize handles through the normal selection path
+    pump()
+    window.close() # Stops background work first; clearing the scene below must not wake anything up
+    window.undo_stack.clear()
+    window.scene.clear()
+    window.deleteLater()
+    pump()
+
+
+def run_scenario(name, function, data_dir, repeat):
+    runs = []
+    metrics = {}
+    for _ in range(repeat):
+        window = new_window()
+        try:
+            seconds, metrics = function(window, data_dir)
+        finally:
+            close_window(window)
+        runs.append(seconds)
+    return {"seconds": statistics.median(runs), "min_seconds": min(runs), "runs": runs, "metrics": metrics}
+
+
+def compare(results, baseline, threshold):
+    # Prints a comparison table and returns the names of scenarios that got slower than the threshold
+    regressions = []
+    print(f"\n{'scenario':<24}{'baseline s':>12}{'current s':>12}{'change':>10}")
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<24}{'-':>12}{result['seconds']:>12.4f}{'new':>10}")
+            continue
+        change = result["seconds"] / previous["seconds"] - 1.0 if previous["seconds"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<24}{previous['seconds']:>12.4f}{result['seconds']:>12.4f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless canvas performance benchmarks")
+    parser.add_argument("--only", help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Fractional slowdown reported as a regression (default 0.10)")
+    parser.add_argument("--list", action="store_true", help="List scenarios and exit")
+    parser.add_argument("--replay", action="append", default=[], metavar="RECORDING",
+                        help="Replay a recorded input session as a scenario (repeatable); only replays run unless --only is given")
+    parser.add_argument("--replay-speed", choices=("max", "recorded"), default="max",
+                        help="Replay as fast as possible (default) or with the recorded timing")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(SCENARIOS))
+        return 0
+    names = args.only.split(",") if args.only else ([] if args.replay else list(SCENARIOS))
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    qt_app = QApplication.instance() or QApplication(sys.argv)
+    scenarios = {name: SCENARIOS[name] for name in names}
+    for file_path in args.replay:
+        scenarios["replay_" + os.path.splitext(os.path.basename(file_path))[0]] = make_replay_scenario(file_path, args.replay_speed)
+    app.TRACER.enabled = False # Measure the app, not the instrumentation
+    data_dir = os.path.join(tempfile.gettempdir(), "canvas_benchmarks")
+    os.makedirs(data_dir, exist_ok=True)
+
+    results = {}
+    for name, function in scenarios.items():
+        result = run_scenario(name, function, data_dir, args.repeat)
+        results[name] = result
+        print(f"{name:<24}{result['seconds']:>10.4f} s  (min {result['min_seconds']:.4f})  {json.dumps(result['metrics'])}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pyside6": PYSIDE_VERSION,
+            "platform": platform.platform(),
+            "qpa": qt_app.platformName(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())